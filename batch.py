@@ -0,0 +1,189 @@
+"""Answer a file of questions in parallel.
+
+    python batch.py questions.csv -o answers.csv
+    python batch.py questions.jsonl -o answers.parquet --results-dir results/
+
+Questions come from a CSV (``question`` column, optional ``id``), a JSONL
+file (``{"id": ..., "question": ...}`` per line) or a plain text file (one
+question per line). Duplicate questions (after normalization) are generated
+and executed once. One summary row per question, with timings, is written as
+soon as it finishes; ``--results-dir`` also saves each result table.
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import core
+
+SUMMARY_FIELDS = ["id", "question", "sql", "rows", "status", "error", "coalesced", "llm_s", "sql_s", "total_s"]
+
+
+def read_questions(path):
+    """Yield (id, question) pairs from a .csv, .jsonl or plain text file."""
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, newline="", encoding="utf-8") as f:
+        if ext == ".csv":
+            for i, row in enumerate(csv.DictReader(f)):
+                yield row.get("id") or str(i), row["question"]
+        elif ext in (".jsonl", ".ndjson"):
+            for i, line in enumerate(f):
+                if line.strip():
+                    item = json.loads(line)
+                    yield str(item.get("id", i)), item["question"]
+        else:
+            for i, line in enumerate(f):
+                if line.strip():
+                    yield str(i), line.strip()
+
+
+class SummaryWriter:
+    """Streams summary rows to CSV (flushed per row) or Parquet (one row group per batch)."""
+
+    def __init__(self, path, flush_every=50):
+        self.path = path
+        self.parquet = path.lower().endswith(".parquet")
+        self.flush_every = flush_every
+        self._pending = []
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            self._pa = pa
+            schema = pa.schema(
+                [(name, pa.int64() if name == "rows" else pa.bool_() if name == "coalesced"
+                  else pa.float64() if name.endswith("_s") else pa.string()) for name in SUMMARY_FIELDS]
+            )
+            self._writer = pq.ParquetWriter(path, schema)
+            self._schema = schema
+        else:
+            self._file = open(path, "w", newline="", encoding="utf-8")
+            self._writer = csv.DictWriter(self._file, fieldnames=SUMMARY_FIELDS)
+            self._writer.writeheader()
+
+    def write(self, record):
+        if not self.parquet:
+            self._writer.writerow(record)
+            self._file.flush()
+            return
+        self._pending.append(record)
+        if len(self._pending) >= self.flush_every:
+            self._flush()
+
+    def _flush(self):
+        if self._pending:
+            table = self._pa.Table.from_pylist(self._pending, schema=self._schema)
+            self._writer.write_table(table)
+            self._pending = []
+
+    def close(self):
+        if self.parquet:
+            self._flush()
+            self._writer.close()
+        else:
+            self._file.close()
+
+
+def _run_sql_in_process(sql):
+    return core.run_sql(sql)
+
+
+async def answer_group(pipeline, question, processes):
+    """Generate and execute SQL for one distinct question; returns (sql, result, error, timings)."""
+    timings = {}
+    start = time.perf_counter()
+    sql = result = error = None
+    try:
+        sql = await pipeline.generate_sql(question)
+        timings["llm_s"] = time.perf_counter() - start
+        mark = time.perf_counter()
+        if processes is not None:
+            rows, cols = await asyncio.wait_for(
+                asyncio.get_running_loop().run_in_executor(processes, _run_sql_in_process, sql),
+                pipeline.timeouts["sql"],
+            )
+            result = core.QueryResult(sql, rows, cols)
+        else:
+            result = await pipeline.execute(sql)
+        timings["sql_s"] = time.perf_counter() - mark
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    timings["total_s"] = time.perf_counter() - start
+    return sql, result, error, timings
+
+
+async def run_batch(questions, pipeline, writer, results_dir=None, results_format="csv", processes=None):
+    """Answer every (id, question); duplicates share one generation and execution."""
+    groups = {}
+    for qid, question in questions:
+        groups.setdefault(core.normalize_question(question), []).append((qid, question))
+
+    async def run(members):
+        return members, await answer_group(pipeline, members[0][1], processes)
+
+    tasks = [asyncio.ensure_future(run(members)) for members in groups.values()]
+    done = 0
+    for next_done in asyncio.as_completed(tasks):
+        members, (sql, result, error, timings) = await next_done
+        if result is not None and results_dir:
+            first_id = members[0][0]
+            out = os.path.join(results_dir, f"{first_id}.{results_format}")
+            if results_format == "parquet":
+                result.frame.to_parquet(out, index=False)
+            else:
+                result.frame.to_csv(out, index=False)
+        for i, (qid, question) in enumerate(members):
+            writer.write({
+                "id": qid,
+                "question": question,
+                "sql": sql,
+                "rows": len(result) if result is not None else None,
+                "status": "ok" if error is None else "error",
+                "error": error,
+                "coalesced": i > 0,
+                **{k: round(v, 4) for k, v in timings.items()},
+            })
+            done += 1
+    return done, len(groups)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Answer a file of questions in parallel.")
+    parser.add_argument("questions", help=".csv, .jsonl or .txt file of questions")
+    parser.add_argument("-o", "--output", default="answers.csv", help="summary file (.csv or .parquet)")
+    parser.add_argument("--results-dir", help="also save each result table here")
+    parser.add_argument("--results-format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--llm-concurrency", type=int, default=4, help="concurrent LLM calls")
+    parser.add_argument("--sql-workers", type=int, default=4, help="parallel query executions")
+    parser.add_argument("--processes", action="store_true", help="execute SQL in worker processes instead of threads")
+    parser.add_argument("--sql-timeout", type=float, default=core.Pipeline.DEFAULT_TIMEOUTS["sql"])
+    args = parser.parse_args(argv)
+
+    if args.results_dir:
+        os.makedirs(args.results_dir, exist_ok=True)
+    pipeline = core.Pipeline(
+        llm_concurrency=args.llm_concurrency,
+        sql_concurrency=args.sql_workers,
+        timeouts={"sql": args.sql_timeout},
+    )
+    processes = ProcessPoolExecutor(args.sql_workers) if args.processes else None
+    writer = SummaryWriter(args.output)
+    start = time.perf_counter()
+    try:
+        answered, distinct = asyncio.run(run_batch(
+            read_questions(args.questions), pipeline, writer,
+            args.results_dir, args.results_format, processes,
+        ))
+    finally:
+        writer.close()
+        if processes is not None:
+            processes.shutdown()
+    elapsed = time.perf_counter() - start
+    print(f"Answered {answered} questions ({distinct} distinct) in {elapsed:.1f}s -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import statistics
+import sys
+import time
+
+from core import COIN_DBS, AccessMode, ConnectionPool
+
+# 1. Access modes to compare; all attach the four coin databases read-only
+MODES = {
+    "default": AccessMode(),
+    "mmap": AccessMode(mmap_bytes=256 << 20),
+    "immutable": AccessMode(immutable=True, mmap_bytes=256 << 20),
+    "tuned": AccessMode(immutable=True, mmap_bytes=256 << 20, cache_kib=64 << 10, shared_cache=True),
+}
+
+# 2. Typical questions: a full scan per coin, a date range, a point lookup
+QUERIES = {
+    "yearly avg": "\nUNION ALL\n".join(
+        f"SELECT '{table}', strftime('%Y', Date), AVG(Close) FROM {alias}.{table} GROUP BY 2"
+        for alias, table in ((a, a.split("_")[1].upper()) for a in COIN_DBS)
+    ),
+    "range": "SELECT Date, Close FROM coin_bitcoin.BITCOIN WHERE Date BETWEEN '2019-01-01' AND '2019-12-31'",
+    "max high": "SELECT MAX(High) FROM coin_ethereum.ETHEREUM",
+}
+
+
+def timed(conn, sql):
+    start = time.perf_counter()
+    conn.execute(sql).fetchall()
+    return (time.perf_counter() - start) * 1e3
+
+
+# 3. cold: a fresh connection's first query (attach, schema parse, empty cache)
+#    pool cold: the same while another connection of the pool is open (what a
+#    pool growing under load sees; only the shared cache helps here)
+#    warm: the query repeated on a connection that already ran it
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+print(f"{'mode':<10} {'query':<11} {'cold ms':>8} {'pool cold':>10} {'warm ms':>8}")
+for mode_name, mode in MODES.items():
+    pool = ConnectionPool(COIN_DBS, optional={}, access=mode)
+    for name, sql in QUERIES.items():
+        cold, pool_cold, warm = [], [], []
+        for _ in range(N):
+            start = time.perf_counter()
+            conn = pool._connect()
+            conn.execute(sql).fetchall()
+            cold.append((time.perf_counter() - start) * 1e3)
+            warm.extend(timed(conn, sql) for _ in range(5))
+            start = time.perf_counter()
+            other = pool._connect()
+            other.execute(sql).fetchall()
+            pool_cold.append((time.perf_counter() - start) * 1e3)
+            other.close()
+            conn.close()
+        print(f"{mode_name:<10} {name:<11} {statistics.median(cold):>8.3f} "
+              f"{statistics.median(pool_cold):>10.3f} {statistics.median(warm):>8.3f}")
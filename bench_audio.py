@@ -0,0 +1,53 @@
+import io
+import sys
+import timeit
+import wave
+
+import numpy as np
+import speech_recognition as sr
+from pydub import AudioSegment
+
+from core import ingest_audio
+
+# 1. A recorder-style clip: 44.1 kHz stereo, 1 s of room noise, N s of
+#    "speech" (a warbling tone), 1 s of noise; optional argument = N
+SPEECH_S = float(sys.argv[1]) if len(sys.argv) > 1 else 4
+RATE = 44100
+t = np.arange(int(RATE * (SPEECH_S + 2)))
+speech = (t > RATE) & (t < RATE * (SPEECH_S + 1))
+signal = np.where(speech, np.sin(2 * np.pi * (300 + 50 * np.sin(t / 4000)) * t / RATE) * 8000, 0)
+signal = (signal + np.random.randn(len(t)) * 30).astype(np.int16)
+stereo = np.repeat(signal[:, None], 2, axis=1).tobytes()
+segment = AudioSegment(stereo, frame_rate=RATE, sample_width=2, channels=2)
+buf = io.BytesIO()
+with wave.open(buf, "wb") as w:
+    w.setnchannels(2)
+    w.setsampwidth(2)
+    w.setframerate(RATE)
+    w.writeframes(stereo)
+wav_bytes = buf.getvalue()
+
+
+# 2. What transcribe() used to do before recognising: WAV export, re-read
+#    with sr.AudioFile, then speech_recognition's own conversion to 16 kHz
+def legacy(audio):
+    if isinstance(audio, AudioSegment):
+        wav = io.BytesIO()
+        audio.export(wav, "wav")
+        wav.seek(0)
+    else:
+        wav = io.BytesIO(audio)
+    with sr.AudioFile(wav) as source:
+        data = sr.Recognizer().record(source)
+    return data.get_raw_data(convert_rate=16000, convert_width=2)
+
+
+# 3. Time both paths and compare how much audio reaches the recognizer
+N = 20
+print(f"{'input':<10} {'legacy ms':>10} {'ingest ms':>10} {'legacy s':>9} {'sent s':>7}")
+for name, audio in (("recorder", segment), ("wav bytes", wav_bytes)):
+    old = timeit.timeit(lambda: legacy(audio), number=N) / N * 1e3
+    new = timeit.timeit(lambda: ingest_audio(audio, 16000), number=N) / N * 1e3
+    old_s = len(legacy(audio)) / 2 / 16000
+    new_s = len(ingest_audio(audio, 16000)) / 16000
+    print(f"{name:<10} {old:>10.2f} {new:>10.2f} {old_s:>9.2f} {new_s:>7.2f}")
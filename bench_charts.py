@@ -0,0 +1,58 @@
+import sys
+import time
+from io import BytesIO
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from charts import build_chart, render_png
+from core import ALIAS_TO_TABLE, execute
+
+# 1. Daily closes of all four coins; an optional argument repeats the history
+#    that many times (shifted in time) to see how both paths scale
+SCALE = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+SQL = "\nUNION ALL\n".join(
+    f"SELECT '{table.title()}' AS Source, Date, Close FROM {alias}.{table}" for alias, table in ALIAS_TO_TABLE.items()
+)
+base = execute(SQL).plot_frame()
+span = base["Date"].max() - base["Date"].min() + pd.Timedelta(days=1)
+df = pd.concat([base.assign(Date=base["Date"] + i * span) for i in range(SCALE)], ignore_index=True)
+
+
+# 2. The line branch the apps used to run: parse dates, mask per coin, plot every point
+def legacy(df):
+    df = df.copy()
+    df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
+    fig, ax = plt.subplots()
+    for src in df["Source"].unique():
+        sub = df[df["Source"] == src]
+        ax.plot(sub["Date"], sub["Close"], label=src)
+    ax.legend()
+    plt.tight_layout()
+    out = BytesIO()
+    fig.savefig(out, format="png")
+    plt.close(fig)
+
+
+def timed(fn, n=5):
+    times = []
+    for _ in range(n):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1e3)
+    return np.median(times)
+
+
+# 3. Chart stage: build (group + downsample), first render, cached rerun
+legacy(df)      # warm matplotlib's font cache
+print(f"{len(df)} rows")
+print(f"{'legacy ms':>10} {'build ms':>9} {'render ms':>10} {'rerun ms':>9} {'points':>7}")
+chart = build_chart(df, "line")
+build_ms = timed(lambda: build_chart(df, "line"))
+render_ms = timed(lambda: render_png(build_chart(df.assign(Close=df["Close"] * np.random.rand()), "line")))
+render_png(chart)
+rerun_ms = timed(lambda: render_png(build_chart(df, "line")))
+print(f"{timed(lambda: legacy(df), 3):>10.1f} {build_ms:>9.1f} {render_ms:>10.1f} {rerun_ms:>9.1f} {chart.points():>7}")
@@ -0,0 +1,51 @@
+import sqlite3
+import sys
+import timeit
+
+import create_tv_shows_db
+from core import FTSIndex, rewrite_like_to_match
+
+# 1. tvshows.db as built by create_tv_shows_db.py; an optional argument
+#    copies TVSHOWS that many times into a shared in-memory database, with
+#    the builder's table and index DDL, to see how both plans scale
+SCALE = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+conn = sqlite3.connect(":memory:", uri=True)
+if SCALE == 1:
+    conn.execute("ATTACH DATABASE 'file:tvshows.db?mode=ro' AS tvshows")
+else:
+    job = create_tv_shows_db.jobs()[0]
+    spec = job.tables[0]
+    copied = ", ".join(c for c in spec.columns if c != "id")
+    scaled = sqlite3.connect("file:tvshows_scaled?mode=memory&cache=shared", uri=True)
+    scaled.execute("ATTACH DATABASE 'file:tvshows.db?mode=ro' AS src")
+    scaled.execute(spec.create_sql())
+    for _ in range(SCALE):
+        scaled.execute(f"INSERT INTO {spec.table} ({copied}) SELECT {copied} FROM src.{spec.table}")
+    for sql in job.after[:2]:  # TVSHOWS_FTS and its rebuild
+        scaled.execute(sql)
+    scaled.commit()
+    conn.execute("ATTACH DATABASE 'file:tvshows_scaled?mode=memory&cache=shared' AS tvshows")
+INDEXES = [FTSIndex("tvshows", "TVSHOWS_FTS", "TVSHOWS", "id", ["Title", "Genre", "Description"])]
+
+# 2. Typical model output for "shows about ..." questions
+QUERIES = {
+    "dragon": "SELECT Title, Rating FROM tvshows.TVSHOWS WHERE Description LIKE '%dragon%' ORDER BY Rating DESC",
+    "detective": "SELECT Title FROM tvshows.TVSHOWS WHERE Description LIKE '%detective%' AND Rating > 7",
+    # A term in half of the rows: the index saves less than it costs here
+    "comedy": "SELECT Title FROM tvshows.TVSHOWS WHERE Genre LIKE '%Comedy%'",
+    "title and": "SELECT Title FROM tvshows.TVSHOWS t WHERE t.Title LIKE '%Star%' AND t.Description LIKE '%space%'",
+}
+
+# 3. Time the LIKE scan against the MATCH rewrite; both must agree
+N = max(1, 200 // SCALE)
+rows = conn.execute("SELECT COUNT(*) FROM tvshows.TVSHOWS").fetchone()[0]
+print(f"{rows} rows")
+print(f"{'query':<10} {'hits':>6} {'LIKE ms':>9} {'MATCH ms':>9}")
+for name, sql in QUERIES.items():
+    rewritten = rewrite_like_to_match(sql, INDEXES)
+    assert rewritten != sql
+    before = sorted(conn.execute(sql).fetchall())
+    assert before == sorted(conn.execute(rewritten).fetchall())
+    like = timeit.timeit(lambda: conn.execute(sql).fetchall(), number=N) / N * 1e3
+    match = timeit.timeit(lambda: conn.execute(rewritten).fetchall(), number=N) / N * 1e3
+    print(f"{name:<10} {len(before):>6} {like:>9.3f} {match:>9.3f}")
@@ -0,0 +1,48 @@
+import re
+import timeit
+
+from core import postprocess_sql
+
+# 1. The per-request cleanup the apps used to run inline (kept here for comparison)
+def legacy_postprocess(sql):
+    sql = sql.strip()
+    sql = re.sub(r"^```.*\n", "", sql)
+    sql = re.sub(r"\n```$", "", sql)
+    order_patterns = re.compile(r"(?i)ORDER BY\s+[^;]+", flags=re.MULTILINE)
+    all_orders = order_patterns.findall(sql)
+    if all_orders:
+        last_order = all_orders[-1].strip()
+        sql = order_patterns.sub("", sql).strip().rstrip(";")
+        sql = sql + "\n" + last_order
+    alias_to_table = {
+        "coin_bitcoin": "BITCOIN",
+        "coin_chainlink": "CHAINLINK",
+        "coin_ethereum": "ETHEREUM",
+        "coin_usdcoin": "USDCOIN",
+    }
+    for alias, tbl in alias_to_table.items():
+        sql = re.sub(fr"(?i)\bFROM\s+{alias}\b(?!\.)", f"FROM {alias}.{tbl}", sql)
+        sql = re.sub(fr"(?i)\bJOIN\s+{alias}\b(?!\.)", f"JOIN {alias}.{tbl}", sql)
+    return sql
+
+
+# 2. Typical model outputs: single table, four-arm UNION ALL, subquery
+SAMPLES = {
+    "single": "```sql\nSELECT 'Bitcoin' AS Source, Date, High FROM coin_bitcoin "
+              "WHERE Date LIKE '2021%' ORDER BY Date;\n```",
+    "union4": "\nUNION ALL\n".join(
+        f"SELECT '{name}' AS Source, Date, Close FROM coin_{name.lower()} "
+        f"WHERE Date >= '2021-01-01' ORDER BY Date"
+        for name in ["Bitcoin", "Chainlink", "Ethereum", "USDCoin"]
+    ) + ";",
+    "subquery": "SELECT * FROM (SELECT Date, Close FROM coin_bitcoin.BITCOIN "
+                "ORDER BY Close DESC LIMIT 10) ORDER BY Date",
+}
+
+# 3. Time both and print the per-query cost
+N = 20_000
+print(f"{'query':<10} {'legacy µs':>10} {'postprocess_sql µs':>20}")
+for name, sql in SAMPLES.items():
+    legacy = timeit.timeit(lambda: legacy_postprocess(sql), number=N) / N * 1e6
+    new = timeit.timeit(lambda: postprocess_sql(sql), number=N) / N * 1e6
+    print(f"{name:<10} {legacy:>10.1f} {new:>20.1f}")
@@ -0,0 +1,34 @@
+import json
+import statistics
+import subprocess
+import sys
+
+# 1. Each measurement runs in a fresh interpreter, like a cold server start
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+LEGACY = "import google.generativeai, pandas, numpy, pydub, speech_recognition"
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+{code}
+print(json.dumps({{"import": time.perf_counter() - start, **{extra}}}))
+"""
+
+
+def run(code, extra="{}"):
+    out = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", PROBE.format(code=code, extra=extra)],
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+# 2. What importing core used to cost (every heavy module up front), what it
+#    costs now, and what warm_up() then spends per resource
+legacy = [run(LEGACY)["import"] for _ in range(N)]
+lazy = [run("import core", "{'warm': core.warm_up(), 'modules': dict(core.import_report)}") for _ in range(N)]
+print(f"eager heavy imports: {statistics.median(legacy) * 1e3:8.0f} ms")
+print(f"import core:         {statistics.median(r['import'] for r in lazy) * 1e3:8.0f} ms")
+for stage in lazy[0]["warm"]:
+    print(f"warm_up {stage:<12} {statistics.median(r['warm'][stage] for r in lazy) * 1e3:8.0f} ms")
+for module in lazy[0]["modules"]:
+    print(f"  first import {module:<20} {statistics.median(r['modules'][module] for r in lazy) * 1e3:6.0f} ms")
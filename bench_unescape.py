@@ -0,0 +1,57 @@
+import html
+import sqlite3
+import sys
+import timeit
+
+import pandas as pd
+
+from core import ColumnarResult, QueryResult
+
+# 1. Raw rows as the cursor returns them (tvshows.db is read directly),
+#    repeated to simulate larger results. Both a small and a large result
+#    are reported by default, since the columns below CELL_UNESCAPE_ROWS
+#    take a different path; arguments choose other scales.
+SCALES = [int(a) for a in sys.argv[1:]] or [1, 20]
+QUERIES = {
+    "first 100": "SELECT * FROM TVSHOWS LIMIT 100",
+    "Description": "SELECT Description FROM TVSHOWS",
+    "all columns": "SELECT * FROM TVSHOWS",
+}
+
+
+def fetch(sql, scale):
+    conn = sqlite3.connect("tvshows.db")
+    cur = conn.execute(sql)
+    rows, cols = cur.fetchall() * scale, [d[0] for d in cur.description]
+    conn.close()
+    return rows, cols
+
+
+# 2. The per-cell comprehension the apps used to run on every result
+def legacy_decode(rows, cols):
+    cleaned = [
+        tuple(html.unescape(cell) if isinstance(cell, str) else cell for cell in row)
+        for row in rows
+    ]
+    return pd.DataFrame(cleaned, columns=cols)
+
+
+# 3. Typed columns from the rows, vectorized unescape of the flagged columns only
+def columnar_decode(rows, cols):
+    return QueryResult("", [], cols, data=ColumnarResult(rows, cols)).display_frame()
+
+
+print(f"{'query':<12} {'rows':>7} {'comprehension ms':>17} {'columnar ms':>12} {'decode only ms':>15}")
+for scale in SCALES:
+    N = max(5, 200 // scale)
+    for name, sql in QUERIES.items():
+        rows, cols = fetch(sql, scale)
+        assert legacy_decode(rows, cols).equals(columnar_decode(rows, cols))
+        # Best of 5 repeats: the small results take well under a millisecond
+        legacy = min(timeit.repeat(lambda: legacy_decode(rows, cols), number=N, repeat=5)) / N * 1e3
+        new = min(timeit.repeat(lambda: columnar_decode(rows, cols), number=N, repeat=5)) / N * 1e3
+        # The apps already hold the columnar result (it is what the result cache stores)
+        data = ColumnarResult(rows, cols)
+        decode = min(timeit.repeat(lambda: QueryResult("", [], cols, data=data).display_frame(),
+                                   number=N, repeat=5)) / N * 1e3
+        print(f"{name:<12} {len(rows):>7} {legacy:>17.2f} {new:>12.2f} {decode:>15.2f}")
@@ -0,0 +1,182 @@
+"""Shared CSV -> SQLite bulk loader for the create_* scripts.
+
+    python bulk_load.py            # rebuild every database in parallel
+    python bulk_load.py coins books
+
+Each database is described by a LoadJob: the tables to stream from CSV
+(declared column types, an optional per-chunk transform, indexes) and SQL to
+run once the rows are in. A job loads its CSVs in chunks, inside a single
+transaction with journal_mode=OFF and synchronous=OFF, creates indexes after
+the rows are in, then runs ANALYZE. Several jobs run in parallel processes.
+
+With the journal off a failed build leaves the file unusable; run it again.
+"""
+
+import argparse
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+CHUNK_ROWS = 100_000
+
+# Declared SQL type -> how a chunk column is coerced before binding
+_NUMERIC = {"INTEGER": "Int64", "REAL": "float64"}
+
+
+class TableLoad:
+    """One table streamed from one CSV.
+
+    ``columns`` maps output column -> declared SQL type, in table order.
+    ``transform(chunk)`` turns a raw CSV chunk into those columns (the chunk
+    index keeps counting across chunks, so it can number rows). ``ddl``
+    overrides the generated CREATE TABLE; ``indexes`` are created after load.
+    """
+
+    def __init__(self, table, csv, columns, transform=None, ddl=None, indexes=(), read_options=None):
+        self.table = table
+        self.csv = csv
+        self.columns = dict(columns)
+        self.transform = transform
+        self.ddl = ddl
+        self.indexes = tuple(indexes)
+        self.read_options = dict(read_options or {})
+
+    def create_sql(self) -> str:
+        if self.ddl:
+            return self.ddl
+        cols = ",\n    ".join(f"{name} {decl}" for name, decl in self.columns.items())
+        return f"CREATE TABLE {self.table} (\n    {cols}\n)"
+
+
+class LoadJob:
+    """Every table of one database file, plus SQL to run after loading.
+
+    ``finish(job)``, if given, runs in the calling process once the database
+    is built, e.g. to refresh files derived from it. It must be a module-level
+    function, since jobs are sent to worker processes.
+    """
+
+    def __init__(self, db, tables, after=(), drop=(), finish=None):
+        self.db = db
+        self.tables = list(tables)
+        self.after = tuple(after)
+        self.drop = tuple(drop)     # extra objects to remove first (e.g. derived tables)
+        self.finish = finish
+
+
+def typed_chunk(chunk: pd.DataFrame, columns: dict) -> pd.DataFrame:
+    """Coerce each column to its declared type; missing values become None."""
+    out = {}
+    for name, decl in columns.items():
+        kind = decl.split()[0].upper() if decl else ""
+        col = chunk[name]
+        if kind in _NUMERIC:
+            col = pd.to_numeric(col, errors="coerce").astype(_NUMERIC[kind])
+        out[name] = col.astype(object).where(col.notna(), None)
+    return pd.DataFrame(out, index=chunk.index)
+
+
+def load_table(conn, spec: TableLoad, chunk_rows=CHUNK_ROWS) -> int:
+    """Create ``spec.table`` and stream its CSV into it; returns rows loaded."""
+    conn.execute(spec.create_sql())
+    placeholders = ", ".join("?" * len(spec.columns))
+    sql = f"INSERT INTO {spec.table} ({', '.join(spec.columns)}) VALUES ({placeholders})"
+    rows = 0
+    for chunk in pd.read_csv(spec.csv, chunksize=chunk_rows, **spec.read_options):
+        if spec.transform is not None:
+            chunk = spec.transform(chunk)
+        chunk = typed_chunk(chunk, spec.columns)
+        conn.executemany(sql, chunk.itertuples(index=False, name=None))
+        rows += len(chunk)
+    for index in spec.indexes:
+        conn.execute(index)
+    return rows
+
+
+def build(job: LoadJob, chunk_rows=CHUNK_ROWS):
+    """Rebuild one database file; returns (db, rows, seconds)."""
+    start = time.perf_counter()
+    conn = sqlite3.connect(job.db, isolation_level=None)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    rows = 0
+    conn.execute("BEGIN")
+    try:
+        for name in job.drop:
+            conn.execute(f"DROP TABLE IF EXISTS {name}")
+        for spec in job.tables:
+            conn.execute(f"DROP TABLE IF EXISTS {spec.table}")
+        for spec in job.tables:
+            rows += load_table(conn, spec, chunk_rows)
+        for sql in job.after:
+            conn.execute(sql)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.close()
+        raise
+    conn.execute("ANALYZE")
+    # Tables dropped from an earlier build leave free pages behind
+    if conn.execute("PRAGMA freelist_count").fetchone()[0]:
+        conn.execute("VACUUM")
+    conn.close()
+    return job.db, rows, time.perf_counter() - start
+
+
+def report(db, rows, seconds):
+    print(f"{db}: {rows:,} rows in {seconds:.2f}s ({rows / max(seconds, 1e-9):,.0f} rows/s)")
+
+
+def build_all(jobs, processes=None, chunk_rows=CHUNK_ROWS):
+    """Build every job, in parallel processes when there is more than one,
+    printing each database's rows/sec as it finishes and running its
+    ``finish``. Returns total rows."""
+    jobs = list(jobs)
+    start = time.perf_counter()
+    total = 0
+    if len(jobs) == 1 or processes == 1:
+        for job in jobs:
+            result = build(job, chunk_rows)
+            report(*result)
+            total += result[1]
+            if job.finish is not None:
+                job.finish(job)
+    else:
+        workers = processes or min(len(jobs), os.cpu_count() or 1)
+        with ProcessPoolExecutor(workers) as pool:
+            futures = {pool.submit(build, job, chunk_rows): job for job in jobs}
+            for future in as_completed(futures):
+                result = future.result()
+                report(*result)
+                total += result[1]
+                if futures[future].finish is not None:
+                    futures[future].finish(futures[future])
+    report(f"{len(jobs)} database(s)", total, time.perf_counter() - start)
+    return total
+
+
+def all_jobs() -> dict:
+    """Every builder's jobs, by dataset name."""
+    import create_books_db
+    import create_coins
+    import create_db
+    import create_tv_shows_db
+    return {
+        "coins": create_coins.jobs(),
+        "movies": create_db.jobs(),
+        "books": create_books_db.jobs(),
+        "tvshows": create_tv_shows_db.jobs(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the SQLite databases from their CSVs.")
+    parser.add_argument("datasets", nargs="*", help="coins, movies, books, tvshows (default: all)")
+    parser.add_argument("--processes", type=int, help="parallel builds (default: one per database, up to CPUs)")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+    available = all_jobs()
+    chosen = args.datasets or list(available)
+    build_all([job for name in chosen for job in available[name]], args.processes, args.chunk_rows)
@@ -0,0 +1,280 @@
+"""Chart stage shared by the front ends.
+
+    kind = chart_intent(question)           # before anything runs
+    ...
+    st.image(render_png(chart_for(sql, kind)))
+
+chart_for runs bar, pie and histogram queries shaped by core.execute_chart,
+so SQLite returns one row per group or bin; other charts read the full result.
+build_chart reduces the result to what will actually be drawn: line series are
+grouped by Source in one pass and downsampled to the chart's pixel width
+(min/max per bucket, or LTTB), histograms to their bin counts, bars to one
+value per group. render_png draws that on a pyplot-free Figure with the Agg
+canvas and keeps the PNG, so a Streamlit rerun with the same data costs a
+dictionary lookup.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+from core import CHART_BINS, execute, execute_chart
+
+PLOT_WORDS = ("plot", "graph", "chart", "visualize", "line", "bar", "histogram", "pie")
+WIDTH = 700         # px, Streamlit's centered layout
+HEIGHT = 420
+DPI = 100
+PNG_CACHE_SIZE = 32
+MARGINS = {"left": 0.12, "right": 0.97, "bottom": 0.14, "top": 0.92}
+
+
+class ChartUnavailable(ValueError):
+    """The result has no columns for the requested chart."""
+
+
+def wants_chart(question: str) -> bool:
+    ql = question.lower()
+    return any(kw in ql for kw in PLOT_WORDS)
+
+
+def chart_intent(question: str):
+    """The chart a question asks for (see chart_kind), or None for no chart."""
+    return chart_kind(question) if wants_chart(question) else None
+
+
+def chart_kind(question: str) -> str:
+    """"pie", "hist", "bar" or "line", checked in that order."""
+    ql = question.lower()
+    for kind in ("pie", "hist", "bar"):
+        if kind in ql:
+            return kind
+    return "line"
+
+
+# 1. Downsampling: keep at most ~``points`` of a series, preserving its shape
+def minmax_indices(y: np.ndarray, points: int) -> np.ndarray:
+    """Indices of the lowest and highest point in each of points // 2 equal
+    buckets, plus both ends. Spikes survive, which averaging would flatten."""
+    n = len(y)
+    buckets = max(points // 2, 1)
+    if n <= points:
+        return np.arange(n)
+    bounds = np.linspace(0, n, buckets + 1).astype(np.int64)
+    ids = np.repeat(np.arange(buckets), np.diff(bounds))
+    order = np.lexsort((y, ids))        # by bucket, then value (NaN last)
+    picks = np.concatenate([order[bounds[:-1]], order[bounds[1:] - 1], [0, n - 1]])
+    return np.unique(picks)
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, points: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: per bucket, the point forming the
+    largest triangle with the previous pick and the next bucket's mean."""
+    n = len(y)
+    if n <= points or points < 3:
+        return np.arange(n)
+    x = x.astype(np.float64)
+    y = np.nan_to_num(y.astype(np.float64))
+    bounds = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    picks = np.empty(points, dtype=np.int64)
+    picks[0], picks[-1] = 0, n - 1
+    a = 0
+    for i in range(points - 2):
+        lo, hi = bounds[i], bounds[i + 1]
+        nxt = slice(hi, bounds[i + 2] if i + 2 < len(bounds) else n)
+        cx, cy = x[nxt].mean(), y[nxt].mean()
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = picks[i + 1] = lo + int(area.argmax())
+    return picks
+
+
+def downsample(x, y, points=WIDTH, method="minmax"):
+    """(x, y) reduced to about ``points`` points; x must be sorted."""
+    if method == "lttb":
+        idx = lttb_indices(x, y, points)
+    else:
+        idx = minmax_indices(y, points)
+    return x[idx], y[idx]
+
+
+# 2. Chart payloads: only the numbers that end up on screen
+class Chart:
+    """A chart ready to draw. Line charts hold (label, x, y) series with x as
+    datetime64; bar and pie hold labels and values; histograms hold counts
+    and bin edges."""
+
+    def __init__(self, kind, title, xlabel="", ylabel="", series=(), labels=(), values=(), edges=()):
+        self.kind = kind
+        self.title = title
+        self.xlabel = xlabel
+        self.ylabel = ylabel
+        self.series = list(series)
+        self.labels = [str(label) for label in labels]
+        self.values = np.asarray(values, dtype=np.float64)
+        self.edges = np.asarray(edges, dtype=np.float64)
+
+    def key(self) -> str:
+        """Digest of everything drawn; equal charts share a rendered PNG."""
+        h = hashlib.blake2b(digest_size=16)
+        h.update(repr((self.kind, self.title, self.xlabel, self.ylabel, self.labels)).encode())
+        for label, x, y in self.series:
+            h.update(str(label).encode())
+            h.update(np.ascontiguousarray(x).tobytes())
+            h.update(np.ascontiguousarray(y).tobytes())
+        h.update(self.values.tobytes())
+        h.update(self.edges.tobytes())
+        return h.hexdigest()
+
+    def points(self) -> int:
+        return sum(len(x) for _, x, _ in self.series) + len(self.values)
+
+
+def _columns(df):
+    num_cols = df.select_dtypes(include="number").columns.tolist()
+    cat_cols = [c for c in df.columns if c not in num_cols]
+    return num_cols, cat_cols
+
+
+def line_series(df, ycol, group="Source", points=WIDTH, method="minmax"):
+    """One downsampled (label, dates, values) series per group, in order of
+    first appearance. The frame is grouped once, not masked per group."""
+    dates = df["Date"]
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        dates = pd.to_datetime(dates, errors="coerce")
+    x = dates.to_numpy(dtype="datetime64[ns]")
+    y = df[ycol].to_numpy(dtype=np.float64, na_value=np.nan)
+    valid = ~np.isnat(x)
+    if group in df.columns:
+        codes, labels = pd.factorize(df[group])
+    else:
+        codes, labels = np.zeros(len(df), dtype=np.int64), [ycol]
+    valid &= codes >= 0
+    x, y, codes = x[valid], y[valid], codes[valid]
+    # One stable sort by (group, date) and contiguous slices per group
+    order = np.lexsort((x.view(np.int64), codes))
+    x, y, codes = x[order], y[order], codes[order]
+    bounds = np.searchsorted(codes, np.arange(len(labels) + 1))
+    series = []
+    for i, label in enumerate(labels):
+        lo, hi = bounds[i], bounds[i + 1]
+        if hi > lo:
+            xs, ys = downsample(x[lo:hi].view(np.int64), y[lo:hi], points, method)
+            series.append((label, xs.view("datetime64[ns]"), ys))
+    return series
+
+
+def shaped_chart(df: pd.DataFrame, kind: str) -> Chart:
+    """The Chart for rows already aggregated by core.execute_chart."""
+    if kind == "hist":
+        name = df.columns[0]
+        counts = np.zeros(CHART_BINS)
+        counts[df[name].to_numpy(dtype=np.int64)] = df["Frequency"].to_numpy()
+        lo, hi = (float(df["lo"].iloc[0]), float(df["hi"].iloc[0])) if len(df) else (0.0, 1.0)
+        if lo == hi:
+            lo, hi = lo - 0.5, hi + 0.5
+        return Chart("hist", f"Histogram of {name}", name, "Frequency",
+                     values=counts, edges=np.linspace(lo, hi, CHART_BINS + 1))
+    grp, value = df.columns[:2]
+    if kind == "pie":
+        return Chart("pie", f"Pie Chart of {value} by {grp}", labels=df[grp], values=df[value])
+    return Chart("bar", f"Bar Chart of {value} by {grp}", grp, value, labels=df[grp], values=df[value])
+
+
+def build_chart(df: pd.DataFrame, kind: str, points=WIDTH, method="minmax") -> Chart:
+    """Reduce a result frame to the Chart for ``kind``; raises ChartUnavailable
+    when the needed columns are missing."""
+    num_cols, cat_cols = _columns(df)
+    if kind == "pie":
+        if not (num_cols and cat_cols):
+            raise ChartUnavailable("No numeric and category columns for a pie chart.")
+        grp = "Source" if "Source" in cat_cols else cat_cols[0]
+        sums = df.groupby(grp)[num_cols[0]].sum()
+        return Chart("pie", f"Pie Chart of {num_cols[0]} by {grp}",
+                     labels=sums.index, values=sums.to_numpy())
+    if kind == "hist":
+        if not num_cols:
+            raise ChartUnavailable("No numeric column available for histogram.")
+        values = df[num_cols[0]].dropna().to_numpy(dtype=np.float64)
+        counts, edges = np.histogram(values, bins=CHART_BINS)
+        return Chart("hist", f"Histogram of {num_cols[0]}", num_cols[0], "Frequency",
+                     values=counts, edges=edges)
+    if kind == "bar":
+        if not num_cols:
+            raise ChartUnavailable("No numeric column available for bar chart.")
+        grp = "Source" if "Source" in df.columns else cat_cols[0] if cat_cols else None
+        if grp is None:
+            raise ChartUnavailable("No category column available for bar chart.")
+        sums = df.groupby(grp)[num_cols[0]].sum()
+        return Chart("bar", f"Bar Chart of {num_cols[0]} by {grp}", grp, num_cols[0],
+                     labels=sums.index, values=sums.to_numpy())
+    if "Date" not in df.columns:
+        raise ChartUnavailable("No 'Date' column for line chart.")
+    ycol = next((c for c in num_cols if c != "Date"), "Close")
+    if ycol not in df.columns:
+        raise ChartUnavailable("No numeric column available for line chart.")
+    return Chart("line", f"Line Chart of {ycol} over Time", "Date", ycol,
+                 series=line_series(df, ycol, points=points, method=method))
+
+
+def chart_for(sql: str, kind: str) -> Chart:
+    """Run ``sql`` for a ``kind`` chart: pre-aggregated by SQLite when it can
+    be, else the full result reduced by build_chart."""
+    shaped = execute_chart(sql, kind)
+    if shaped is not None:
+        return shaped_chart(shaped.plot_frame(), kind)
+    return build_chart(execute(sql).plot_frame(), kind)
+
+
+# 3. Rendering: Agg canvas, no pyplot state, PNGs cached by chart digest
+_png_cache = OrderedDict()
+_png_lock = threading.Lock()
+
+
+def draw(chart: Chart, width=WIDTH, height=HEIGHT):
+    """A matplotlib Figure of ``chart`` (matplotlib is imported on the first draw)."""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(width / DPI, height / DPI), dpi=DPI)
+    FigureCanvasAgg(fig)
+    ax = fig.subplots()
+    if chart.kind == "pie":
+        ax.pie(chart.values, labels=chart.labels, autopct="%1.1f%%")
+    elif chart.kind == "hist":
+        ax.hist(chart.edges[:-1], chart.edges, weights=chart.values)
+    elif chart.kind == "bar":
+        ax.bar(chart.labels, chart.values)
+        ax.tick_params(axis="x", labelrotation=90)
+    else:
+        for label, x, y in chart.series:
+            ax.plot(x, y, label=label)
+        if chart.series:
+            ax.legend()
+    ax.set_xlabel(chart.xlabel)
+    ax.set_ylabel(chart.ylabel)
+    ax.set_title(chart.title)
+    # Fixed margins: tight_layout would lay out every tick label once more
+    # just to measure them, which costs more than drawing the chart
+    fig.subplots_adjust(**MARGINS)
+    return fig
+
+
+def render_png(chart: Chart, width=WIDTH, height=HEIGHT) -> bytes:
+    """PNG of ``chart``; the last PNG_CACHE_SIZE renders are reused."""
+    key = (chart.key(), width, height)
+    with _png_lock:
+        png = _png_cache.get(key)
+        if png is not None:
+            _png_cache.move_to_end(key)
+            return png
+    out = BytesIO()
+    draw(chart, width, height).savefig(out, format="png")
+    png = out.getvalue()
+    with _png_lock:
+        _png_cache[key] = png
+        while len(_png_cache) > PNG_CACHE_SIZE:
+            _png_cache.popitem(last=False)
+    return png
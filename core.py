@@ -1,84 +1,2781 @@
-# core.py
-
-import os
-import re
-import sqlite3
-import google.generativeai as genai
-from dotenv import load_dotenv
-from pydub import AudioSegment
-from io import BytesIO
-import speech_recognition as sr
-import pandas as pd
-
-
-# STEP 1 - load the key from .env
-load_dotenv()
-api_key = os.getenv("GENAI_API_KEY")
-if not api_key:
-    st.error("GENAI_API_KEY not found. Please set it in .env")
-else:
-    genai.configure(api_key=api_key)
-
-# 2. Combined prompt- change when change db
-COMBINED_PROMPT = """
-You are an expert in converting English questions to SQL queries.
-You have four attached SQLite tables:
-
-  ATTACH DATABASE 'bitcoin.db'   AS coin_bitcoin;
-  ATTACH DATABASE 'chainlink.db' AS coin_chainlink;
-  ATTACH DATABASE 'ethereum.db'  AS coin_ethereum;
-  ATTACH DATABASE 'usdcoin.db'   AS coin_usdcoin;
-
-Each table has columns: SNo, Name, Symbol, Date, High, Low, Open, Close, Volume, Marketcap.
-When querying across them, you may query any single table or UNION ALL across multiple tables.
-Prefix each SELECT with a literal 'Source' column indicating which coin.
-
-Do NOT wrap your answer in backticks or include the word “SQL.”
-
-Example:
-  SELECT 'Bitcoin'  AS Source, Date, Close
-    FROM coin_bitcoin.BITCOIN
-   WHERE Symbol='BTC'
-  UNION ALL
-  SELECT 'Ethereum' AS Source, Date, Close
-    FROM coin_ethereum.ETHEREUM
-   WHERE Symbol='ETH';
-
-ALSO whenver a date is asked, remeber that the date column has date followed with 23::59:59 for all entries
-
-make sure to remeber that after the sql part the user will also make a graph from the data, so if u think the date or any other 
-feature should be added to the sql query add it for the graph to be made better
-
-"""
-
-
-def transcribe(audio_input) -> str:
-    """Convert audio_input (AudioSegment or bytes) into text via Google Web Speech."""
-    if isinstance(audio_input, AudioSegment):
-        wav = BytesIO()
-        audio_input.export(wav, "wav")
-        wav.seek(0)
-    elif isinstance(audio_input, (bytes, bytearray)):
-        wav = BytesIO(audio_input)
-    else:
-        raise RuntimeError("Unsupported audio input type.")
-    recognizer = sr.Recognizer()
-    with sr.AudioFile(wav) as source:
-        audio_data = recognizer.record(source)
-    return recognizer.recognize_google(audio_data)
-
-
-def run_sql(sql: str):
-    """Attach all coin DBs in-memory and execute the given SQL."""
-    conn = sqlite3.connect(":memory:")
-    cwd = os.getcwd()
-    conn.execute(f"ATTACH DATABASE '{cwd}/bitcoin.db'   AS coin_bitcoin;")
-    conn.execute(f"ATTACH DATABASE '{cwd}/chainlink.db' AS coin_chainlink;")
-    conn.execute(f"ATTACH DATABASE '{cwd}/ethereum.db'  AS coin_ethereum;")
-    conn.execute(f"ATTACH DATABASE '{cwd}/usdcoin.db'   AS coin_usdcoin;")
-    cur = conn.cursor()
-    cur.execute(sql)
-    rows = cur.fetchall()
-    cols = [desc[0] for desc in cur.description]
-    conn.close()
-    return rows, cols
\ No newline at end of file
+# core.py
+from __future__ import annotations
+
+import abc
+import asyncio
+import calendar
+import datetime as dt
+import hashlib
+import html
+import importlib
+import json
+import logging
+import operator
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import unicodedata
+import wave
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
+from fractions import Fraction
+from dotenv import load_dotenv
+from io import BytesIO
+
+_IMPORT_START = time.perf_counter()
+
+# STEP 0 - heavy modules (Gemini SDK, NumPy/pandas, speech_recognition, pydub)
+# are imported on first use, so a text-only request never loads the audio
+# stack and nothing pays for the SDK until a model is needed. import_report
+# records how long each first import took, and core's own import time.
+import_report = OrderedDict()   # module -> seconds spent importing it
+
+
+class _LazyModule:
+    """Stands in for a module global until an attribute is first read, then
+    imports the module and puts it in the global's place."""
+
+    def __init__(self, name, alias):
+        self._name = name
+        self._alias = alias
+
+    def __getattr__(self, attr):
+        return getattr(load_module(self._name, self._alias), attr)
+
+
+def load_module(name: str, alias: str = None):
+    """Import ``name`` (timed into import_report) and bind it to ``alias`` here."""
+    module = sys.modules.get(name)
+    if module is None:
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        import_report[name] = time.perf_counter() - start
+    if alias:
+        globals()[alias] = module
+    return module
+
+
+genai = _LazyModule("google.generativeai", "genai")
+sr = _LazyModule("speech_recognition", "sr")
+np = _LazyModule("numpy", "np")
+pd = _LazyModule("pandas", "pd")
+
+
+def _is_segment(audio) -> bool:
+    """isinstance(audio, pydub.AudioSegment) without importing pydub."""
+    return "pydub" in sys.modules and isinstance(audio, sys.modules["pydub"].AudioSegment)
+
+
+# STEP 1 - load the key from .env (once per process; the front ends check api_key)
+load_dotenv()
+api_key = os.getenv("GENAI_API_KEY")
+if not api_key:
+    logging.getLogger("nl2sql").warning("GENAI_API_KEY not found. Please set it in .env")
+
+MODEL_NAME = "models/gemini-1.5-flash-001"
+_models = {}
+_model_lock = threading.Lock()
+
+
+def get_model(name: str = MODEL_NAME):
+    """Process-wide Gemini client for ``name``; the SDK is imported and
+    configured on the first call."""
+    model = _models.get(name)
+    if model is None:
+        with _model_lock:
+            model = _models.get(name)
+            if model is None:
+                if not _models and api_key:
+                    genai.configure(api_key=api_key)
+                model = _models[name] = genai.GenerativeModel(name)
+    return model
+
+# 2. Combined prompt- change when change db
+# (generate_sql now builds its prompt from the attached schema, see 4.1; this
+# fixed text for the per-coin files is kept for callers that pass it explicitly)
+COMBINED_PROMPT = """
+You are an expert in converting English questions to SQL queries.
+You have four attached SQLite tables:
+
+  ATTACH DATABASE 'bitcoin.db'   AS coin_bitcoin;
+  ATTACH DATABASE 'chainlink.db' AS coin_chainlink;
+  ATTACH DATABASE 'ethereum.db'  AS coin_ethereum;
+  ATTACH DATABASE 'usdcoin.db'   AS coin_usdcoin;
+
+Each table has columns: SNo, Name, Symbol, Date, High, Low, Open, Close, Volume, Marketcap.
+When querying across them, you may query any single table or UNION ALL across multiple tables.
+Prefix each SELECT with a literal 'Source' column indicating which coin.
+
+Do NOT wrap your answer in backticks or include the word “SQL.”
+
+Example:
+  SELECT 'Bitcoin'  AS Source, Date, Close
+    FROM coin_bitcoin.BITCOIN
+   WHERE Symbol='BTC'
+  UNION ALL
+  SELECT 'Ethereum' AS Source, Date, Close
+    FROM coin_ethereum.ETHEREUM
+   WHERE Symbol='ETH';
+
+ALSO whenver a date is asked, remeber that the date column has date followed with 23::59:59 for all entries
+Date is an indexed ISO text column, so filter it with plain range comparisons
+(e.g. Date BETWEEN '2021-01-01' AND '2021-12-31 23:59:59') instead of wrapping it in functions like strftime().
+
+make sure to remeber that after the sql part the user will also make a graph from the data, so if u think the date or any other 
+feature should be added to the sql query add it for the graph to be made better
+
+"""
+
+# "files" attaches the four per-coin databases; "unified" attaches coins.db
+# (one table plus per-coin views) under the same aliases.
+COIN_STORE = os.getenv("NL2SQL_COIN_STORE", "files")
+
+
+# 2.2 Speech-to-text: pluggable backends fed 16-bit mono PCM chunk by chunk,
+# so an offline engine can recognise while audio is still arriving and the
+# question is ready when it stops. NL2SQL_STT picks the backend ("google", the
+# Web Speech API, or "vosk", a local Kaldi model on CPU; NL2SQL_VOSK_MODEL is
+# its directory). Every transcription's per-stage times go to transcribe_report.
+transcribe_report = deque(maxlen=200)   # most recent transcriptions, newest last
+CHUNK_MS = 500
+
+
+class TranscriptionStream(abc.ABC):
+    """One utterance being transcribed: ``feed`` PCM as it arrives (returns the
+    text so far), then ``finish`` for the final text.
+
+    ``timings`` holds seconds per stage: decode (container -> PCM, when
+    transcribe() does it), recognize (spent in feed), finalize and total.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.sample_rate = backend.sample_rate
+        self.partial = ""
+        self.timings = {"decode": 0.0, "recognize": 0.0}
+        self._start = time.perf_counter()
+
+    def feed(self, pcm: bytes) -> str:
+        start = time.perf_counter()
+        self._accept(pcm)
+        self.timings["recognize"] += time.perf_counter() - start
+        return self.partial
+
+    def finish(self) -> str:
+        start = time.perf_counter()
+        text = self._final()
+        now = time.perf_counter()
+        self.timings["finalize"] = now - start
+        self.timings["total"] = now - self._start
+        transcribe_report.append({"backend": self.backend.name, "text": text, **self.timings})
+        return text
+
+    @abc.abstractmethod
+    def _accept(self, pcm):
+        """Recognise one PCM chunk, updating ``partial``."""
+
+    @abc.abstractmethod
+    def _final(self) -> str:
+        """The utterance's final text, once all PCM has been fed."""
+
+
+class Transcriber(abc.ABC):
+    """A speech-to-text engine; ``stream()`` starts one utterance."""
+
+    name = "base"
+    sample_rate = 16000
+    offline = False
+
+    @abc.abstractmethod
+    def stream(self) -> TranscriptionStream:
+        """A new TranscriptionStream for one utterance."""
+
+
+class _BufferedStream(TranscriptionStream):
+    """Collects the PCM and recognises it in one call at finish()."""
+
+    def __init__(self, backend):
+        super().__init__(backend)
+        self._chunks = []
+
+    def _accept(self, pcm):
+        self._chunks.append(pcm)
+
+    def _final(self) -> str:
+        return self.backend.recognize(b"".join(self._chunks))
+
+
+class GoogleTranscriber(Transcriber):
+    """Google Web Speech via speech_recognition: one request after the audio ends."""
+
+    name = "google"
+
+    def stream(self) -> TranscriptionStream:
+        return _BufferedStream(self)
+
+    def recognize(self, pcm: bytes) -> str:
+        return sr.Recognizer().recognize_google(sr.AudioData(pcm, self.sample_rate, 2))
+
+
+class _VoskStream(TranscriptionStream):
+    def __init__(self, backend):
+        super().__init__(backend)
+        from vosk import KaldiRecognizer
+        self._recognizer = KaldiRecognizer(backend.model(), self.sample_rate)
+        self._phrases = []
+
+    def _accept(self, pcm):
+        if self._recognizer.AcceptWaveform(pcm):
+            self._phrases.append(json.loads(self._recognizer.Result())["text"])
+            partial = ""
+        else:
+            partial = json.loads(self._recognizer.PartialResult())["partial"]
+        self.partial = " ".join(p for p in [*self._phrases, partial] if p)
+
+    def _final(self) -> str:
+        self._phrases.append(json.loads(self._recognizer.FinalResult())["text"])
+        return " ".join(p for p in self._phrases if p)
+
+
+class VoskTranscriber(Transcriber):
+    """Offline recognition with a local Vosk (Kaldi) model, decoded as chunks arrive."""
+
+    name = "vosk"
+    offline = True
+
+    def __init__(self, model_path=None):
+        self.model_path = model_path or os.getenv("NL2SQL_VOSK_MODEL", "models/vosk")
+        self._model = None
+        self._lock = threading.Lock()
+
+    def model(self):
+        """The loaded model, shared by every stream (loading takes seconds)."""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from vosk import Model, SetLogLevel
+                    SetLogLevel(-1)
+                    self._model = Model(self.model_path)
+        return self._model
+
+    def stream(self) -> TranscriptionStream:
+        return _VoskStream(self)
+
+
+TRANSCRIBERS = {"google": GoogleTranscriber, "vosk": VoskTranscriber}
+_transcriber = None
+_transcriber_lock = threading.Lock()
+
+
+def get_transcriber() -> Transcriber:
+    """Process-wide backend chosen by NL2SQL_STT (default "google")."""
+    global _transcriber
+    if _transcriber is None:
+        with _transcriber_lock:
+            if _transcriber is None:
+                _transcriber = TRANSCRIBERS[os.getenv("NL2SQL_STT", "google")]()
+    return _transcriber
+
+
+# 2.3 Audio ingestion: any input -> one int16 mono array at the recognizer's
+# rate. Recorder segments are used as the PCM they already hold and WAV
+# uploads are read with the wave module; only other containers go through
+# ffmpeg. Downmix, resampling and silence trimming are NumPy passes over that
+# one buffer, and chunks are memoryview slices of it.
+_CONTAINERS = [
+    (b"RIFF", "wav"), (b"fLaC", "flac"), (b"OggS", "ogg"), (b"ID3", "mp3"),
+    (b"\x1aE\xdf\xa3", "webm"), (b"FORM", "aiff"),
+]
+VAD_FRAME_MS = 20
+VAD_RANGE_DB = 35       # frames this far below the loudest one count as silence
+VAD_FLOOR_DB = -55      # ... as do frames below this level (dBFS)
+VAD_PAD_MS = 200        # kept around the speech that was found
+
+
+def detect_container(data: bytes):
+    """"wav", "mp3", "flac", "ogg", "webm", "aiff", "mp4" or None, from magic bytes."""
+    head = bytes(data[:12])
+    for magic, fmt in _CONTAINERS:
+        if head.startswith(magic):
+            return fmt
+    if head[4:8] == b"ftyp":
+        return "mp4"
+    if len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0:
+        return "mp3"    # bare MPEG audio frame sync
+    return None
+
+
+def _samples(raw, sample_width: int, channels: int) -> np.ndarray:
+    """Interleaved PCM bytes as a (frames, channels) array; 16-bit input is
+    viewed in place, other widths are scaled to the int16 range."""
+    if sample_width == 2:
+        data = np.frombuffer(raw, dtype="<i2")
+    elif sample_width == 1:
+        data = (np.frombuffer(raw, dtype=np.uint8).astype(np.int16) - 128) << 8
+    elif sample_width == 3:
+        b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3)
+        data = (b[:, 1].astype(np.int16) | (b[:, 2].astype(np.int16) << 8))
+    elif sample_width == 4:
+        data = (np.frombuffer(raw, dtype="<i4") >> 16).astype(np.int16)
+    else:
+        raise RuntimeError(f"Unsupported sample width: {sample_width} bytes.")
+    return data[: len(data) - len(data) % channels].reshape(-1, channels)
+
+
+def decode_audio(audio_input):
+    """(samples, sample_rate) with samples shaped (frames, channels), from an
+    AudioSegment, encoded bytes or a file object. A file object is read from
+    its start, so one that was already read (an UploadedFile shown in the
+    page, say) still decodes."""
+    if hasattr(audio_input, "getvalue"):
+        audio_input = audio_input.getvalue()
+    elif hasattr(audio_input, "read"):
+        if hasattr(audio_input, "seek"):
+            audio_input.seek(0)
+        audio_input = audio_input.read()
+    if _is_segment(audio_input):
+        seg = audio_input
+        return _samples(seg.raw_data, seg.sample_width, seg.channels), seg.frame_rate
+    if not isinstance(audio_input, (bytes, bytearray, memoryview)):
+        raise RuntimeError("Unsupported audio input type.")
+    if not audio_input:
+        raise RuntimeError("Empty audio input.")
+    fmt = detect_container(audio_input)
+    if fmt == "wav":
+        try:
+            with wave.open(BytesIO(audio_input)) as w:
+                raw = w.readframes(w.getnframes())
+                return _samples(raw, w.getsampwidth(), w.getnchannels()), w.getframerate()
+        except wave.Error:
+            pass        # e.g. float or compressed WAV: let ffmpeg read it
+    seg = load_module("pydub").AudioSegment.from_file(BytesIO(audio_input), format=fmt)
+    return _samples(seg.raw_data, seg.sample_width, seg.channels), seg.frame_rate
+
+
+def audio_digest(audio_input) -> str:
+    """Hash of an AudioSegment's PCM, encoded bytes or an uploaded file's
+    bytes; a front end reuses its transcript until this changes."""
+    if _is_segment(audio_input):
+        data = audio_input.raw_data
+    elif hasattr(audio_input, "getvalue"):
+        data = audio_input.getvalue()
+    else:
+        data = audio_input
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def to_mono(samples: np.ndarray) -> np.ndarray:
+    if samples.shape[1] == 1:
+        return samples[:, 0]
+    # Column by column: a reduction along the short channel axis is far slower
+    out = samples[:, 0].astype(np.float32)
+    for channel in range(1, samples.shape[1]):
+        out += samples[:, channel]
+    out *= 1.0 / samples.shape[1]
+    return out
+
+
+def resample(samples: np.ndarray, src_rate: int, dst_rate: int) -> np.ndarray:
+    """Integer ratios average each block (a box filter against aliasing),
+    others interpolate linearly."""
+    if src_rate == dst_rate:
+        return samples
+    if src_rate % dst_rate == 0:
+        k = src_rate // dst_rate
+        n = len(samples) - len(samples) % k
+        return samples[:n].reshape(-1, k).mean(axis=1, dtype=np.float32)
+    n = int(len(samples) * dst_rate / src_rate)
+    pos = np.arange(n) * (src_rate / dst_rate)
+    i0 = pos.astype(np.intp)
+    frac = (pos - i0).astype(np.float32)
+    left = samples[i0].astype(np.float32)
+    return left + frac * (samples[np.minimum(i0 + 1, len(samples) - 1)] - left)
+
+
+def trim_silence(samples: np.ndarray, sample_rate: int) -> np.ndarray:
+    """Drop leading and trailing silence: per-frame RMS in dBFS, one pass;
+    pauses inside the speech are kept. Returns a view."""
+    frame = sample_rate * VAD_FRAME_MS // 1000
+    n = len(samples) // frame
+    if n == 0:
+        return samples
+    frames = samples[: n * frame].reshape(n, frame).astype(np.float32)
+    # Variance rather than mean square, so a DC offset does not count as sound
+    db = 10 * np.log10(frames.var(axis=1) / 32768.0 ** 2 + 1e-12)
+    voiced = np.flatnonzero(db > max(db.max() - VAD_RANGE_DB, VAD_FLOOR_DB))
+    if len(voiced) == 0:
+        return samples
+    pad = VAD_PAD_MS // VAD_FRAME_MS
+    start = max(voiced[0] - pad, 0) * frame
+    stop = min((voiced[-1] + 1 + pad) * frame, len(samples))
+    return samples[start:stop]
+
+
+def ingest_audio(audio_input, sample_rate: int, trim: bool = True) -> np.ndarray:
+    """int16 mono PCM at ``sample_rate``, silence trimmed. 16-bit mono input
+    already at that rate is not copied."""
+    samples, rate = decode_audio(audio_input)
+    mono = resample(to_mono(samples), rate, sample_rate)
+    if trim:
+        mono = trim_silence(mono, sample_rate)
+    if mono.dtype != np.int16:
+        mono = np.clip(np.rint(mono), -32768, 32767).astype(np.int16)
+    return np.ascontiguousarray(mono)
+
+
+def pcm_chunks(audio_input, sample_rate, chunk_ms=CHUNK_MS):
+    """16-bit mono PCM at ``sample_rate`` from an AudioSegment, encoded audio
+    bytes or a file object, as memoryview chunks of ``chunk_ms``."""
+    pcm = memoryview(ingest_audio(audio_input, sample_rate)).cast("B")
+    step = sample_rate * 2 * chunk_ms // 1000
+    for i in range(0, len(pcm), step):
+        yield pcm[i:i + step]
+
+
+def transcribe(audio_input, on_partial=None, timings: dict = None, backend: Transcriber = None) -> str:
+    """Convert audio_input (AudioSegment, bytes or file object) into text with
+    the configured backend, feeding it chunk by chunk; ``on_partial(text)``
+    is called after each chunk with the text recognised so far and
+    ``timings`` (if given) receives the per-stage seconds."""
+    stream = (backend or get_transcriber()).stream()
+    chunks = pcm_chunks(audio_input, stream.sample_rate)
+    while True:
+        start = time.perf_counter()
+        chunk = next(chunks, None)
+        stream.timings["decode"] += time.perf_counter() - start
+        if chunk is None:
+            break
+        partial = stream.feed(chunk)
+        if on_partial is not None and partial:
+            on_partial(partial)
+    text = stream.finish()
+    if timings is not None:
+        timings.update(stream.timings)
+    return text
+
+
+def format_timings(timings: dict) -> str:
+    """"decode 12 ms · recognize 340 ms · ..." for a caption; values that are
+    not seconds (e.g. warm_up's errors) are shown as they are."""
+    return " · ".join(
+        f"{stage} {value * 1000:.0f} ms" if isinstance(value, (int, float)) else f"{stage} {value}"
+        for stage, value in timings.items()
+    )
+
+
+# 3. Coin databases attached to every query connection (alias -> file)
+COIN_DBS = {
+    "coin_bitcoin": "bitcoin.db",
+    "coin_chainlink": "chainlink.db",
+    "coin_ethereum": "ethereum.db",
+    "coin_usdcoin": "usdcoin.db",
+}
+
+UNIFIED_DBS = {"coins": "coins.db", **{alias: "coins.db" for alias in COIN_DBS}}
+# Attached only when the file exists (built by create_rollups.py)
+OPTIONAL_DBS = {"coin_rollups": "rollups.db"}
+
+
+def coin_databases() -> dict:
+    """Alias -> file mapping for the configured coin store."""
+    return UNIFIED_DBS if COIN_STORE == "unified" else COIN_DBS
+
+
+# 3.0 Dataset registry: each dataset is a set of files attached together.
+# Questions are routed to datasets before the LLM call (SchemaCatalog.route)
+# and queries to a pool attaching only the datasets their SQL names.
+class Dataset:
+    """Databases (alias -> file) that are attached and described together."""
+
+    def __init__(self, name, databases, keywords=(), optional=None, nouns=()):
+        self.name = name
+        self.databases = dict(databases)
+        self.optional = dict(optional or {})
+        self.keywords = tuple(keywords)   # words that point at it besides its schema
+        # Keywords that are also everyday words ("show me ...", "time series");
+        # see SchemaCatalog.route for when they count
+        self.nouns = tuple(nouns)
+
+
+DATASETS = OrderedDict()
+
+
+def register_dataset(name, databases, keywords=(), optional=None, nouns=()) -> Dataset:
+    DATASETS[name] = Dataset(name, databases, keywords, optional, nouns)
+    return DATASETS[name]
+
+
+register_dataset(
+    "coins", coin_databases(), optional=OPTIONAL_DBS,
+    keywords=("coin", "crypto", "cryptocurrency", "price", "market cap", "marketcap", "trading"),
+)
+register_dataset("movies", {"movies": "movie.db"}, keywords=("movie", "film", "box office", "cinema"))
+register_dataset("books", {"books": "books.db"}, keywords=("book", "novel", "author", "writer"))
+register_dataset(
+    "tvshows", {"tvshows": "tvshows.db"}, keywords=("tv", "sitcom", "television"), nouns=("show", "series"),
+)
+# More datasets without code changes, one file each:
+# NL2SQL_EXTRA_DBS="games=games.db,music=music.db"
+for _item in os.getenv("NL2SQL_EXTRA_DBS", "").split(","):
+    if "=" in _item:
+        _alias, _file = (part.strip() for part in _item.split("=", 1))
+        register_dataset(_alias, {_alias: _file})
+
+# Used when a question or query names no dataset
+DEFAULT_DATASET = os.getenv("NL2SQL_DEFAULT_DATASET", "coins")
+
+
+def datasets_for_sql(sql: str) -> tuple:
+    """Datasets whose aliases the SQL mentions; the default one if none."""
+    owners = {
+        alias.lower(): ds.name
+        for ds in DATASETS.values() for alias in [*ds.databases, *ds.optional]
+    }
+    names = {owners[tok.lower()] for tok in _SQL_TOKEN.findall(sql) if tok.lower() in owners}
+    return tuple(sorted(names)) or (DEFAULT_DATASET,)
+
+
+# Read-only access tuning for pooled connections. Every file is attached with
+# mode=ro; NL2SQL_IMMUTABLE=1 adds immutable=1, so SQLite takes no file locks
+# and skips the change check before each read. The pool then reopens a
+# connection itself when db_files_token of its files changes (create_coins.py
+# --incremental, a rebuild), which also drops the page cache it would
+# otherwise trust. Do not run queries while a builder is writing the files.
+class AccessMode:
+    """How the pool opens database files: URI flags plus per-schema pragmas.
+
+    ``mmap_bytes`` and ``cache_kib`` are applied to each attached database
+    (0 keeps SQLite's default); ``shared_cache`` lets all connections of a
+    process share one page cache per file, so a new pooled connection starts warm.
+    """
+
+    def __init__(self, immutable=False, mmap_bytes=0, cache_kib=0, shared_cache=False):
+        self.immutable = immutable
+        self.mmap_bytes = mmap_bytes
+        self.cache_kib = cache_kib
+        self.shared_cache = shared_cache
+
+    def uri(self, path) -> str:
+        params = ["mode=ro"]
+        if self.immutable:
+            params.append("immutable=1")
+        if self.shared_cache:
+            params.append("cache=shared")
+        return f"file:{path}?{'&'.join(params)}"
+
+    def pragmas(self, alias) -> list:
+        out = []
+        if self.mmap_bytes:
+            out.append(f"PRAGMA {alias}.mmap_size = {int(self.mmap_bytes)}")
+        if self.cache_kib:
+            out.append(f"PRAGMA {alias}.cache_size = -{int(self.cache_kib)}")
+        return out
+
+    def __repr__(self):
+        return (f"AccessMode(immutable={self.immutable}, mmap_bytes={self.mmap_bytes}, "
+                f"cache_kib={self.cache_kib}, shared_cache={self.shared_cache})")
+
+
+_access_mode = None
+_access_lock = threading.Lock()
+
+
+def get_access_mode() -> AccessMode:
+    """Process-wide access mode; NL2SQL_IMMUTABLE, NL2SQL_MMAP_MB (default 256),
+    NL2SQL_CACHE_MB and NL2SQL_SHARED_CACHE configure it."""
+    global _access_mode
+    if _access_mode is None:
+        with _access_lock:
+            if _access_mode is None:
+                _access_mode = AccessMode(
+                    immutable=os.getenv("NL2SQL_IMMUTABLE", "0") == "1",
+                    mmap_bytes=int(float(os.getenv("NL2SQL_MMAP_MB", "256")) * 1024 * 1024),
+                    cache_kib=int(float(os.getenv("NL2SQL_CACHE_MB", "0")) * 1024),
+                    shared_cache=os.getenv("NL2SQL_SHARED_CACHE", "0") == "1",
+                )
+    return _access_mode
+
+
+class _PooledConnection(sqlite3.Connection):
+    """sqlite3 connection that remembers which databases it has attached."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.attached = set()
+        self.rollup_tables = None
+        self.table_rows = None
+        self.fts_indexes = None
+        self.paths = []     # files attached, for db_files_token
+        self.opened = None  # their token when attached (immutable mode)
+
+
+class ConnectionPool:
+    """Thread-safe pool of warm, read-only connections with the coin DBs attached.
+
+    Connections are created lazily up to ``max_size``; a thread that asks for
+    one while all are checked out waits until another thread returns it.
+    Idle connections are health-checked before reuse and replaced if broken.
+    ``access`` (default get_access_mode()) sets how files are attached.
+    """
+
+    def __init__(self, databases=None, max_size=4, health_check_interval=30.0, base_dir=None, optional=None,
+                 access=None):
+        self.databases = dict(databases or COIN_DBS)
+        self.optional = dict(OPTIONAL_DBS if optional is None else optional)
+        self.access = access or get_access_mode()
+        self.max_size = max_size
+        self.health_check_interval = health_check_interval
+        self.base_dir = base_dir
+        self._idle = []          # (conn, last_used) pairs, most recent last
+        self._size = 0
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def paths(self):
+        """Absolute paths of every database file the pool may attach."""
+        base = self.base_dir or os.getcwd()
+        files = {**self.databases, **self.optional}.values()
+        return sorted({os.path.abspath(os.path.join(base, f)) for f in files})
+
+    def _connect(self):
+        base = self.base_dir or os.getcwd()
+        conn = sqlite3.connect(":memory:", uri=True, check_same_thread=False, factory=_PooledConnection)
+        for alias, fname in [*self.databases.items(), *self.optional.items()]:
+            path = os.path.abspath(os.path.join(base, fname))
+            if alias in self.optional and not os.path.exists(path):
+                continue
+            conn.execute("ATTACH DATABASE ? AS " + alias, (self.access.uri(path),))
+            for pragma in self.access.pragmas(alias):
+                conn.execute(pragma)
+            conn.attached.add(alias)
+            conn.paths.append(path)
+        conn.execute("PRAGMA query_only = ON")
+        if self.access.immutable:
+            conn.opened = db_files_token(conn.paths)
+        return conn
+
+    def _current(self, conn):
+        """False if an immutable connection's files changed since it attached them."""
+        return not self.access.immutable or conn.opened == db_files_token(conn.paths)
+
+    def _healthy(self, conn):
+        try:
+            attached = {row[1] for row in conn.execute("PRAGMA database_list")}
+        except sqlite3.Error:
+            return False
+        return set(self.databases) <= attached
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def acquire(self, timeout=None):
+        """Check out a connection, creating or waiting for one as needed."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Connection pool is closed.")
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn, last_used = None, None
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError("Timed out waiting for a database connection.")
+                self._cond.wait(remaining)
+
+        if conn is not None:
+            stale = time.monotonic() - last_used > self.health_check_interval
+            if (not stale or self._healthy(conn)) and self._current(conn):
+                return conn
+            # Broken or outdated idle connection: close it and reuse its slot for a fresh one.
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        try:
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, conn, broken=False):
+        """Return a connection to the pool (or drop it if it is broken)."""
+        if broken or self._closed:
+            self._discard(conn)
+            return
+        if conn.in_transaction:
+            conn.rollback()
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        except sqlite3.OperationalError:
+            # Query errors leave the connection usable
+            self.release(conn)
+            raise
+        except sqlite3.ProgrammingError:
+            # Usually bad input ("You can only execute one statement at a
+            # time"); only a connection closed underneath us is dropped
+            self.release(conn, broken=not self._healthy(conn))
+            raise
+        except GeneratorExit:
+            # A streaming consumer stopped early; the connection is fine.
+            self.release(conn)
+            raise
+        except BaseException:
+            self.release(conn, broken=True)
+            raise
+        else:
+            self.release(conn)
+
+    def close(self):
+        """Close all idle connections; checked-out ones close on release."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            conn.close()
+
+
+_pools = {}
+_pool_lock = threading.Lock()
+
+
+def get_pool(datasets=None) -> ConnectionPool:
+    """Return the process-wide pool attaching ``datasets`` (names; default
+    DEFAULT_DATASET), creating it on first use. Each combination of datasets
+    has its own pool, so a query only ever attaches the files it needs."""
+    key = tuple(sorted(datasets or (DEFAULT_DATASET,)))
+    pool = _pools.get(key)
+    if pool is None:
+        with _pool_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = ConnectionPool(
+                    {alias: f for name in key for alias, f in DATASETS[name].databases.items()},
+                    max_size=int(os.getenv("NL2SQL_POOL_SIZE", "4")),
+                    optional={alias: f for name in key for alias, f in DATASETS[name].optional.items()},
+                )
+    return pool
+
+
+def dataset_paths():
+    """Absolute paths of every registered dataset file."""
+    base = os.getcwd()
+    files = [f for ds in DATASETS.values() for f in [*ds.databases.values(), *ds.optional.values()]]
+    return sorted({os.path.abspath(os.path.join(base, f)) for f in files})
+
+
+_SQL_TOKEN = re.compile(
+    r"""'(?:[^']|'')*'                 # string literal
+      |"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\]  # quoted identifiers
+      |--[^\n]*|/\*.*?\*/              # comments
+      |\s+
+      |[A-Za-z_][A-Za-z0-9_$]*          # keywords and identifiers
+      |\d+(?:\.\d*)?(?:[eE][+-]?\d+)?
+      |.""",
+    re.S | re.X,
+)
+
+
+def canonicalize_sql(sql: str) -> str:
+    """Collapse whitespace and drop comments/trailing semicolons outside literals."""
+    parts = []
+    for tok in _SQL_TOKEN.findall(sql):
+        if tok.isspace() or tok.startswith("--") or tok.startswith("/*"):
+            if parts and parts[-1] != " ":
+                parts.append(" ")
+        else:
+            parts.append(tok)
+    return "".join(parts).strip().rstrip(";").rstrip()
+
+
+def _compact_column(values):
+    """Store one result column as a NumPy array when it is purely int/float,
+    otherwise as a tuple with repeated strings shared.
+
+    Returns (column, nbytes, escaped); ``escaped`` tells whether any string in
+    the column contains '&' and so may need HTML unescaping for display.
+    """
+    kinds = set(map(type, values))
+    if kinds == {float} or kinds == {int}:
+        try:
+            arr = np.array(values, dtype=np.float64 if kinds == {float} else np.int64)
+            return arr, arr.nbytes, False
+        except OverflowError:
+            pass
+    # Every SQLite value is hashable, so one dict interns all of them at C speed
+    memo = {}
+    col = tuple(map(memo.setdefault, values, values))
+    # Checked once per distinct string, not per cell
+    escaped = any("&" in v for v in memo if isinstance(v, str))
+    return col, sys.getsizeof(col) + sum(map(sys.getsizeof, memo)), escaped
+
+
+_DATE_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d")
+
+
+def _is_date_column(name) -> bool:
+    return isinstance(name, str) and name.lower().endswith("date")
+
+
+def _to_datetime(col):
+    """Parse an ISO text column (as stored by create_coins.py) into datetime64,
+    or return None if any value does not match exactly."""
+    if isinstance(col, np.ndarray) or not col:
+        return None
+    for fmt in _DATE_FORMATS:
+        try:
+            return pd.to_datetime(pd.Series(col, dtype=object), format=fmt).to_numpy()
+        except (ValueError, TypeError):
+            continue
+    return None
+
+
+# Up to this many rows a plain per-cell pass is faster than the vectorized
+# one, whose fixed pandas overhead dominates (see bench_unescape.py)
+CELL_UNESCAPE_ROWS = 10_000
+
+
+def unescape_column(values: pd.Series) -> pd.Series:
+    """HTML-unescape a text column, touching only the cells that contain '&'.
+
+    The '&' test is a vectorized string op; html.unescape then runs once per
+    distinct affected string rather than once per cell. Columns of at most
+    CELL_UNESCAPE_ROWS rows are done cell by cell instead. Returns ``values``
+    itself when nothing changes.
+    """
+    if len(values) <= CELL_UNESCAPE_ROWS:
+        cells = values.tolist()
+        out = [html.unescape(v) if isinstance(v, str) and "&" in v else v for v in cells]
+        if out == cells:
+            return values
+        return pd.Series(out, index=values.index, name=values.name, dtype=object)
+    mask = values.str.contains("&", regex=False, na=False).to_numpy(dtype=bool)
+    if not mask.any():
+        return values
+    idx = np.flatnonzero(mask)
+    cells = values.to_numpy()[idx]
+    mapping = {v: html.unescape(v) for v in pd.unique(cells)}
+    if all(k == v for k, v in mapping.items()):
+        return values
+    out = values.to_numpy(copy=True)
+    out[idx] = [mapping[v] for v in cells]
+    return pd.Series(out, index=values.index, name=values.name)
+
+
+class ColumnarResult:
+    """A result set stored column by column.
+
+    Columns keep the values SQLite returned (so ``rows()`` round-trips);
+    ``frame()`` decodes them for display: Date columns become datetime64,
+    parsed once per result and shared by every slice.
+    """
+
+    def __init__(self, rows, cols):
+        self.cols = list(cols)
+        self.nrows = len(rows)
+        self.columns = []
+        self.escaped = []
+        self.nbytes = 0
+        self._dates = {}
+        for values in zip(*rows) if rows else ([] for _ in self.cols):
+            col, size, escaped = _compact_column(list(values))
+            self.columns.append(col)
+            self.escaped.append(escaped)
+            self.nbytes += size
+
+    def slice(self, start, stop):
+        """Rows [start, stop) as a new ColumnarResult sharing nothing mutable."""
+        part = ColumnarResult.__new__(ColumnarResult)
+        part.cols = self.cols
+        part.columns = [col[start:stop] for col in self.columns]
+        part.escaped = self.escaped
+        part.nrows = len(range(*slice(start, stop).indices(self.nrows)))
+        part.nbytes = self.nbytes * part.nrows // max(self.nrows, 1)
+        part._dates = {i: (None if col is None else col[start:stop]) for i, col in self._dates.items()}
+        return part
+
+    def rows(self):
+        """Rebuild the run_sql-style list of tuples."""
+        cols = [c.tolist() if isinstance(c, np.ndarray) else c for c in self.columns]
+        return list(zip(*cols)) if cols else [() for _ in range(self.nrows)]
+
+    def decoded(self, i):
+        """Column ``i`` as it should appear in a DataFrame."""
+        if i not in self._dates:
+            parsed = _to_datetime(self.columns[i]) if _is_date_column(self.cols[i]) else None
+            self._dates[i] = parsed
+        parsed = self._dates[i]
+        return self.columns[i] if parsed is None else parsed
+
+    def frame(self) -> pd.DataFrame:
+        df = pd.DataFrame({i: self.decoded(i) for i in range(len(self.columns))}, index=pd.RangeIndex(self.nrows))
+        df.columns = self.cols
+        return df
+
+
+def _change_counter(path):
+    """SQLite's file change counter (header bytes 24-27); every committed write
+    transaction bumps it, even one that leaves mtime and size unchanged."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        return os.pread(fd, 4, 24)
+    finally:
+        os.close(fd)
+
+
+def db_files_token(paths):
+    """(path, mtime, size, change counter) for each file; changes whenever a
+    database is rebuilt or appended to."""
+    token = []
+    for path in paths:
+        try:
+            info = os.stat(path)
+            token.append((path, info.st_mtime_ns, info.st_size, _change_counter(path)))
+        except FileNotFoundError:
+            token.append((path, None, None, None))
+    return tuple(token)
+
+
+class ResultCache:
+    """In-memory LRU cache of query results keyed on canonicalized SQL.
+
+    Every entry remembers the db_files_token of the attached database files when
+    it was stored; a lookup after any of them changed (e.g. create_coins.py
+    rebuilt or appended to them) drops the whole cache. Total size is bounded by
+    ``max_bytes``.
+    """
+
+    def __init__(self, db_paths, max_bytes=64 * 1024 * 1024):
+        self.db_paths = list(db_paths)
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._token = None
+        self._lock = threading.Lock()
+
+    def _check_token(self):
+        token = db_files_token(self.db_paths)
+        if token != self._token:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self.nbytes = 0
+            self._token = token
+        return token
+
+    def get(self, sql: str):
+        key = canonicalize_sql(sql)
+        with self._lock:
+            self._check_token()
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, sql: str, rows, cols):
+        """Store a result; returns the ColumnarResult, or None if it exceeds the budget."""
+        entry = ColumnarResult(rows, cols)
+        if entry.nbytes > self.max_bytes:
+            return None
+        key = canonicalize_sql(sql)
+        with self._lock:
+            self._check_token()
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            self._entries[key] = entry
+            self.nbytes += entry.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+            "bytes": self.nbytes,
+        }
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    """Return the process-wide result cache over every dataset's files."""
+    global _result_cache
+    if _result_cache is None:
+        with _result_cache_lock:
+            if _result_cache is None:
+                _result_cache = ResultCache(
+                    dataset_paths(),
+                    max_bytes=int(float(os.getenv("NL2SQL_RESULT_CACHE_MB", "64")) * 1024 * 1024),
+                )
+    return _result_cache
+
+
+# 3.1 Rollup rewrite: send eligible per-period aggregates to create_rollups.py tables
+_ROLLUP_GRAINS = {"%Y": "YEARLY", "%Y-%m": "MONTHLY", "%Y-%W": "WEEKLY"}
+_ROLLUP_VALUE_COLS = {c.upper(): c for c in ["Open", "High", "Low", "Close", "Volume", "Marketcap"]}
+_ROLLUP_AGGS = {
+    "MIN": "MIN(Min{c})",
+    "MAX": "MAX(Max{c})",
+    "SUM": "SUM(Sum{c})",
+    "AVG": "(SUM(Sum{c}) * 1.0 / SUM(Days))",
+}
+_AGG_FUNCS = frozenset({"MIN", "MAX", "SUM", "AVG", "COUNT"})
+_ROLLUP_FUNCS = frozenset({"ROUND", "ABS", "CAST", "COALESCE", "IFNULL", "PRINTF"})
+_ROLLUP_WORDS = frozenset(
+    {"AS", "REAL", "INTEGER", "NULL", "SYMBOL", "NAME", "ORDER", "BY", "ASC", "DESC", "LIMIT", "OFFSET"}
+)
+_DATE_LITERAL = re.compile(r"^(\d{4})(?:-(\d{2})(?:-(\d{2})(?:[ T]\d{2}:\d{2}:\d{2})?)?)?$")
+_LIKE_PERIOD = re.compile(r"^(\d{4})(?:-(\d{2}))?%$")
+_COMPARE = {
+    ">": operator.gt, ">=": operator.ge,
+    "<": operator.lt, "<=": operator.le,
+}
+
+rollup_report = deque(maxlen=200)   # most recent rewrite decisions, newest last
+
+
+class _NotEligible(Exception):
+    pass
+
+
+def _day_bound(literal: str, op: str) -> dt.date:
+    """First (>, >=) or last (<, <=) day whose 'YYYY-MM-DD 23:59:59' Date
+    value satisfies ``Date <op> literal``."""
+    m = _DATE_LITERAL.match(literal)
+    if not m:
+        raise _NotEligible(f"unrecognised date literal {literal!r}")
+    year, month, day = m.groups()
+    try:
+        candidate = dt.date(int(year), int(month or 1), int(day or 1))
+    except ValueError:
+        raise _NotEligible(f"invalid date literal {literal!r}")
+    if _COMPARE[op](f"{candidate.isoformat()} 23:59:59", literal):
+        return candidate
+    return candidate + dt.timedelta(days=1 if op[0] == ">" else -1)
+
+
+def _period_range(year, month):
+    if month is None:
+        return dt.date(int(year), 1, 1), dt.date(int(year), 12, 31)
+    last = calendar.monthrange(int(year), int(month))[1]
+    return dt.date(int(year), int(month), 1), dt.date(int(year), int(month), last)
+
+
+def _aligned(day: dt.date, grain: str, start: bool) -> bool:
+    """Is ``day`` the first (start=True) or last day of a bucket of this grain?"""
+    if grain == "YEARLY":
+        return (day.month, day.day) == ((1, 1) if start else (12, 31))
+    if grain == "MONTHLY":
+        return day.day == (1 if start else calendar.monthrange(day.year, day.month)[1])
+    # %W weeks start on Monday and never cross a year boundary
+    if start:
+        return day.weekday() == 0 or (day.month, day.day) == (1, 1)
+    return day.weekday() == 6 or (day.month, day.day) == (12, 31)
+
+
+class _RollupArm:
+    """One SELECT of a (possibly compound) query, rewritten onto a rollup table.
+
+    Works on the lexer tokens; ``sig`` indexes the non-whitespace ones so
+    clauses can be matched by position while the original text of unaliased
+    expressions is still available to keep result column names unchanged.
+    """
+
+    def __init__(self, tokens, aliases=None):
+        self.raw = tokens
+        self.sig = [i for i, t in enumerate(tokens) if not t.isspace() and not t.startswith(("--", "/*"))]
+        self.grains = set()
+        self.aliases = set(aliases or ())
+        self.lo = None
+        self.hi = None
+
+    def tok(self, k):
+        return self.raw[self.sig[k]] if k < len(self.sig) else ""
+
+    def up(self, k):
+        return self.tok(k).upper()
+
+    def span(self, a, b):
+        return "".join(self.raw[self.sig[a]:self.sig[b - 1] + 1])
+
+    def lit(self, k):
+        t = self.tok(k)
+        return t[1:-1].replace("''", "'") if t[:1] == "'" else None
+
+    def split(self, a, b, sep):
+        """Split significant tokens [a, b) on a top-level separator."""
+        parts, depth, start = [], 0, a
+        for k in range(a, b):
+            t = self.tok(k)
+            depth += (t == "(") - (t == ")")
+            if depth == 0 and self.up(k) == sep:
+                parts.append((start, k))
+                start = k + 1
+        parts.append((start, b))
+        return parts
+
+    def expr(self, a, b):
+        """Rewrite the expression in [a, b) onto rollup columns."""
+        out, k = [], a
+        while k < b:
+            t, u = self.tok(k), self.up(k)
+            if u == "STRFTIME" and self.tok(k + 1) == "(" and self.tok(k + 3) == "," \
+                    and self.up(k + 4) == "DATE" and self.tok(k + 5) == ")":
+                fmt = self.lit(k + 2)
+                if fmt not in _ROLLUP_GRAINS:
+                    raise _NotEligible(f"unsupported period format {fmt!r}")
+                self.grains.add(_ROLLUP_GRAINS[fmt])
+                out.append("Bucket")
+                k += 6
+                continue
+            if u in _AGG_FUNCS and self.tok(k + 1) == "(":
+                arg = self.up(k + 2)
+                if self.tok(k + 3) != ")":
+                    raise _NotEligible(f"{u}() over an expression")
+                if u == "COUNT" and arg in ("*", "DATE"):
+                    out.append("SUM(Days)")
+                elif u in ("MIN", "MAX") and arg == "DATE":
+                    out.append("MIN(Start)" if u == "MIN" else "MAX(End)")
+                elif u != "COUNT" and arg in _ROLLUP_VALUE_COLS:
+                    out.append(_ROLLUP_AGGS[u].format(c=_ROLLUP_VALUE_COLS[arg]))
+                else:
+                    raise _NotEligible(f"{u}({self.tok(k + 2)}) has no rollup")
+                k += 4
+                continue
+            if t[0].isalpha() or t[0] in '_"`[':
+                name = t.strip('"`[]')
+                known = u in _ROLLUP_WORDS or name in self.aliases
+                if not known and not (u in _ROLLUP_FUNCS and self.tok(k + 1) == "("):
+                    raise _NotEligible(f"non-aggregated column {t}")
+            out.append(t)
+            k += 1
+        return " ".join(out)
+
+    def item(self, a, b):
+        """Rewrite one select-list item, keeping its original output name."""
+        alias = None
+        if b - a >= 2 and self.up(b - 2) == "AS":
+            alias, b = self.tok(b - 1), b - 2
+        elif b - a == 1 and self.tok(a)[0] == "'":
+            return self.span(a, b)
+        text, original = self.expr(a, b), self.span(a, b)
+        if alias is None and text != original:
+            alias = '"' + original.replace('"', '""') + '"'
+        if alias is None:
+            return text
+        self.aliases.add(alias.strip('"`[]'))
+        return f"{text} AS {alias}"
+
+    def condition(self, a, b):
+        """Translate one WHERE conjunct; date filters become bucket bounds."""
+        u0, op = self.up(a), self.up(a + 1)
+        if u0 in ("SYMBOL", "NAME") and op == "=" and b == a + 3 and self.lit(a + 2) is not None:
+            return self.span(a, b)
+        if u0 == "DATE":
+            k = a + 2
+            if op in ("<", ">") and self.tok(k) == "=":
+                op, k = op + "=", k + 1
+            if op in _COMPARE and b == k + 1 and self.lit(k) is not None:
+                self.bound(_day_bound(self.lit(k), op), op[0] == ">")
+                return None
+            if op == "BETWEEN" and b == a + 5 and self.up(a + 3) == "AND" \
+                    and self.lit(a + 2) is not None and self.lit(a + 4) is not None:
+                self.bound(_day_bound(self.lit(a + 2), ">="), True)
+                self.bound(_day_bound(self.lit(a + 4), "<="), False)
+                return None
+            if op == "LIKE" and b == a + 3 and _LIKE_PERIOD.match(self.lit(a + 2) or ""):
+                self.period(*_LIKE_PERIOD.match(self.lit(a + 2)).groups())
+                return None
+        if u0 == "STRFTIME" and b == a + 8 and self.up(a + 4) == "DATE" and self.tok(a + 6) == "=":
+            fmt, value = self.lit(a + 2), self.lit(a + 7)
+            m = _DATE_LITERAL.match(value or "")
+            if fmt in ("%Y", "%Y-%m") and m and m.group(3) is None and (m.group(2) is None) == (fmt == "%Y"):
+                self.period(m.group(1), m.group(2))
+                return None
+        raise _NotEligible(f"unsupported filter {self.span(a, b)!r}")
+
+    def period(self, year, month):
+        lo, hi = _period_range(year, month)
+        self.bound(lo, True)
+        self.bound(hi, False)
+
+    def bound(self, day, lower):
+        if lower:
+            self.lo = day if self.lo is None else max(self.lo, day)
+        else:
+            self.hi = day if self.hi is None else min(self.hi, day)
+
+    def rewrite(self):
+        """Return (rewritten SELECT, rollup table name)."""
+        n = len(self.sig)
+        if self.up(0) != "SELECT" or self.up(1) in ("DISTINCT", "ALL"):
+            raise _NotEligible("not a plain SELECT")
+        clauses, depth = {}, 0
+        for k in range(n):
+            t, u = self.tok(k), self.up(k)
+            depth += (t == "(") - (t == ")")
+            if depth == 0 and u in ("FROM", "WHERE", "GROUP", "HAVING", "JOIN", "WINDOW", "SELECT") and k:
+                if u in clauses or u not in ("FROM", "WHERE", "GROUP"):
+                    raise _NotEligible(f"{u} clause")
+                clauses[u] = k
+        if "FROM" not in clauses:
+            raise _NotEligible("no FROM clause")
+        if "GROUP" not in clauses and not any(self.up(k) in _AGG_FUNCS for k in range(n)):
+            raise _NotEligible("no aggregation")
+        marks = sorted(clauses.values()) + [n]
+        end = {name: marks[marks.index(k) + 1] for name, k in clauses.items()}
+
+        f = clauses["FROM"]
+        alias, table = self.tok(f + 1).lower(), self.up(f + 3)
+        if end["FROM"] != f + 4 or self.tok(f + 2) != "." or ALIAS_TO_TABLE.get(alias) != table:
+            raise _NotEligible("source is not a single coin table")
+
+        items = [self.item(a, b) for a, b in self.split(1, f, ",")]
+        where = []
+        if "WHERE" in clauses:
+            conjuncts = []
+            for a, b in self.split(clauses["WHERE"] + 1, end["WHERE"], "AND"):
+                # re-join the AND of "Date BETWEEN x AND y"
+                if conjuncts and self.up(conjuncts[-1][0] + 1) == "BETWEEN" \
+                        and conjuncts[-1][1] - conjuncts[-1][0] == 3:
+                    conjuncts[-1][1] = b
+                else:
+                    conjuncts.append([a, b])
+            for a, b in conjuncts:
+                cond = self.condition(a, b)
+                if cond:
+                    where.append(cond)
+        group = []
+        if "GROUP" in clauses:
+            g = clauses["GROUP"]
+            if self.up(g + 1) != "BY":
+                raise _NotEligible("malformed GROUP BY")
+            group = [self.expr(a, b) for a, b in self.split(g + 2, end["GROUP"], ",")]
+
+        if len(self.grains) > 1:
+            raise _NotEligible("mixed period formats")
+        for grain in sorted(self.grains) or ["YEARLY", "MONTHLY", "WEEKLY"]:
+            if (self.lo is None or _aligned(self.lo, grain, True)) and \
+                    (self.hi is None or _aligned(self.hi, grain, False)):
+                break
+        else:
+            raise _NotEligible("date filter does not align with rollup buckets")
+        if self.lo is not None:
+            where.append(f"Start >= '{self.lo.isoformat()}'")
+        if self.hi is not None:
+            where.append(f"End <= '{self.hi.isoformat()} 23:59:59'")
+        rollup = f"{table}_{grain}"
+        sql = f"SELECT {', '.join(items)} FROM coin_rollups.{rollup}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        if group:
+            sql += " GROUP BY " + ", ".join(group)
+        return sql, rollup
+
+
+def rewrite_for_rollups(sql: str, available=None):
+    """Rewrite per-coin aggregate queries (incl. UNION ALL arms) onto rollup tables.
+
+    Returns ``(sql, rollups)``: the SQL is handed back unchanged with an empty
+    list unless every arm can be answered from create_rollups.py tables.
+    ``available`` is the set of rollup tables that exist (None skips the
+    check). Each decision on a query that aggregates lands in ``rollup_report``.
+    """
+    tokens = _SQL_TOKEN.findall(sql)
+    upper = [t.upper() for t in tokens]
+    if not _AGG_FUNCS.intersection(upper) and "GROUP" not in upper:
+        return sql, []
+    arms, ops, tail, depth, start = [], [], None, 0, 0
+    for i, u in enumerate(upper):
+        depth += (u == "(") - (u == ")")
+        if depth or tail is not None:
+            continue
+        if u in _COMPOUND_OPS:
+            arms.append(tokens[start:i])
+            nxt = next((j for j in range(i + 1, len(tokens)) if not tokens[j].isspace()), i)
+            if upper[nxt] == "ALL":
+                ops.append(f"{tokens[i]} {tokens[nxt]}")
+                start = nxt + 1
+            else:
+                ops.append(tokens[i])
+                start = i + 1
+        elif u in ("ORDER", "LIMIT", ";"):
+            tail = i
+    arms.append(tokens[start:tail])
+    try:
+        rewritten, rollups, aliases = [], [], set()
+        for arm_tokens in arms:
+            arm = _RollupArm(arm_tokens)
+            text, rollup = arm.rewrite()
+            if available is not None and rollup not in available:
+                raise _NotEligible(f"rollup table {rollup} is missing")
+            rewritten.append(text)
+            rollups.append(rollup)
+            aliases |= arm.aliases
+        out = rewritten[0]
+        for op, text in zip(ops, rewritten[1:]):
+            out += f"\n{op}\n{text}"
+        if tail is not None:
+            # Output columns keep their names, so ORDER BY on them still works
+            order = _RollupArm(tokens[tail:], aliases)
+            out += "\n" + order.expr(0, len(order.sig))
+    except _NotEligible as e:
+        rollup_report.append({"sql": sql, "rewritten": None, "reason": str(e)})
+        return sql, []
+    rollup_report.append({"sql": sql, "rewritten": out, "rollups": rollups})
+    return out, rollups
+
+
+def table_checksum(conn, table: str) -> str:
+    """Digest of every row of ``table`` in Date order; create_rollups.py
+    records it so a corrected price with unchanged row count and last Date
+    still marks the rollups stale."""
+    h = hashlib.blake2b(digest_size=16)
+    for row in conn.execute(f"SELECT * FROM {table} ORDER BY Date"):
+        h.update(repr(row).encode())
+    return h.hexdigest()
+
+
+def _fresh_rollups(conn):
+    """Rollup tables whose source still has the row count, last Date and
+    checksum recorded when they were built; re-checked whenever a database
+    file changes. Rollups built before checksums were recorded are stale."""
+    token = db_files_token(conn.paths)
+    if conn.rollup_tables is None or conn.rollup_tables[0] != token:
+        fresh = set()
+        try:
+            sources = conn.execute(
+                "SELECT TableName, Rows, LastDate, Checksum FROM coin_rollups.ROLLUP_SOURCES"
+            ).fetchall()
+        except sqlite3.OperationalError:
+            sources = []
+        for table, rows, last, checksum in sources:
+            alias = next((a for a, t in ALIAS_TO_TABLE.items() if t == table), None)
+            source = f"{alias}.{table}"
+            if alias in conn.attached and conn.execute(
+                f"SELECT COUNT(*), MAX(Date) FROM {source}"
+            ).fetchone() == (rows, last) and table_checksum(conn, source) == checksum:
+                fresh |= {f"{table}_{grain}" for grain in _ROLLUP_GRAINS.values()}
+        conn.rollup_tables = (token, fresh)
+    return conn.rollup_tables[1]
+
+
+class QueryHandle:
+    """Lets another thread interrupt a query running on a pooled connection."""
+
+    def __init__(self):
+        self.conn = None
+        self.cancelled = False
+        self._lock = threading.Lock()
+
+    def attach(self, conn):
+        with self._lock:
+            if self.cancelled:
+                raise sqlite3.OperationalError("interrupted")
+            self.conn = conn
+
+    def detach(self):
+        with self._lock:
+            self.conn = None
+
+    def interrupt(self):
+        with self._lock:
+            self.cancelled = True
+            if self.conn is not None:
+                self.conn.interrupt()
+
+
+# 3.2 Query cost guard: plan check, VM-step and wall-clock budget, row cap
+guard_report = deque(maxlen=200)   # most recent guard decisions, newest last
+_guard_log = logging.getLogger("nl2sql.guard")
+_FROM_ITEM = re.compile(r"(?i)\b(?:FROM|JOIN)\s+((?:\w+\.)?\w+)(?:\s+(?:AS\s+)?(\w+))?")
+_COMMA_ITEM = re.compile(r"(?i),\s*((?:\w+\.)?\w+)(?:\s+(?:AS\s+)?(\w+))?")
+_PLAN_SCAN = re.compile(r"^SCAN (?!CONSTANT ROW|\()(\S+)")
+
+
+class QueryRejected(sqlite3.OperationalError):
+    """The cost guard refused to run a query or stopped it."""
+
+
+class QueryGuard:
+    """Cost limits for model-written SQL.
+
+    Before a query runs, its EXPLAIN QUERY PLAN is checked for nested full
+    scans (a cartesian product, or a join with no usable index) whose row
+    product, estimated from sqlite_stat1, exceeds ``max_join_rows``; those are
+    rejected. Scans of subqueries and CTEs have no estimate and are left to the
+    runtime budget: a progress handler stops the query after ``max_seconds``
+    or ``max_steps`` VM instructions. At most ``max_rows`` rows are returned.
+    A limit of 0 disables it. Every decision lands in ``guard_report`` and the
+    ``nl2sql.guard`` log together with the SQL.
+    """
+
+    STEP_INTERVAL = 10_000
+
+    def __init__(self, max_seconds=20.0, max_steps=200_000_000, max_rows=100_000, max_join_rows=1_000_000):
+        self.max_seconds = max_seconds
+        self.max_steps = max_steps
+        self.max_rows = max_rows
+        self.max_join_rows = max_join_rows
+
+    def record(self, sql: str, action: str, reason: str):
+        guard_report.append({"sql": sql, "action": action, "reason": reason})
+        _guard_log.warning("%s: %s\n%s", action, reason, sql)
+
+    @staticmethod
+    def _table_rows(conn):
+        """Row count per table ('name' and 'alias.name', lowercase) from the
+        attached databases' statistics; re-read whenever a database file changes."""
+        token = db_files_token(conn.paths)
+        if conn.table_rows is None or conn.table_rows[0] != token:
+            counts = {}
+            for alias in conn.attached:
+                try:
+                    stats = dict(conn.execute(
+                        f"SELECT tbl, MAX(CAST(stat AS INTEGER)) FROM {alias}.sqlite_stat1 GROUP BY tbl"
+                    ).fetchall())
+                except sqlite3.OperationalError:
+                    stats = {}
+                for (name,) in conn.execute(f"SELECT name FROM {alias}.sqlite_master WHERE type = 'table'"):
+                    if name.startswith("sqlite_"):
+                        continue
+                    rows = stats.get(name)
+                    if rows is None:
+                        rows = conn.execute(f'SELECT COUNT(*) FROM {alias}."{name}"').fetchone()[0]
+                    counts[name.lower()] = max(rows, counts.get(name.lower(), 0))
+                    counts[f"{alias}.{name}".lower()] = rows
+            conn.table_rows = (token, counts)
+        return conn.table_rows[1]
+
+    def check_plan(self, conn, sql: str):
+        """Raise QueryRejected if the plan nests full scans over too many rows."""
+        if not self.max_join_rows:
+            return
+        scans = {}
+        for _, parent, _, detail in conn.execute("EXPLAIN QUERY PLAN " + sql):
+            m = _PLAN_SCAN.match(detail)
+            if m:
+                scans.setdefault(parent, []).append(m.group(1))
+        nested = [names for names in scans.values() if len(names) > 1]
+        if not nested:
+            return
+        # Plan lines name aliases; map them back to tables via the FROM/JOIN items
+        aliases = {}
+        for pattern in (_FROM_ITEM, _COMMA_ITEM):
+            for table, alias in pattern.findall(sql):
+                aliases.setdefault((alias or table).lower(), table.lower())
+        counts = self._table_rows(conn)
+        for names in nested:
+            known = [(n, counts[aliases.get(n.lower(), n.lower())]) for n in names
+                     if aliases.get(n.lower(), n.lower()) in counts]
+            if len(known) < 2:
+                continue
+            product = 1
+            for _, rows in known:
+                product *= max(rows, 1)
+            if product > self.max_join_rows:
+                tables = " x ".join(f"{n} ({rows:,} rows)" for n, rows in known)
+                reason = f"nested full scans {tables} = {product:,} row combinations"
+                self.record(sql, "rejected", reason)
+                raise QueryRejected(
+                    f"Query rejected: {reason}. Join the tables on a shared column such as Date."
+                )
+
+    @contextmanager
+    def budget(self, conn, sql: str):
+        """Abort the statement(s) run inside the block once the time or step
+        budget is spent; the abort surfaces as QueryRejected."""
+        if not (self.max_seconds or self.max_steps):
+            yield
+            return
+        deadline = time.monotonic() + self.max_seconds if self.max_seconds else None
+        state = {"steps": 0, "reason": None}
+
+        def tick():
+            state["steps"] += self.STEP_INTERVAL
+            if self.max_steps and state["steps"] > self.max_steps:
+                state["reason"] = f"exceeded {self.max_steps:,} VM steps"
+            elif deadline is not None and time.monotonic() > deadline:
+                state["reason"] = f"ran longer than {self.max_seconds:g}s"
+            return state["reason"] is not None
+
+        conn.set_progress_handler(tick, self.STEP_INTERVAL)
+        try:
+            yield
+        except sqlite3.OperationalError as e:
+            if state["reason"] is None:
+                raise
+            self.record(sql, "stopped", state["reason"])
+            raise QueryRejected(f"Query stopped: {state['reason']}.") from e
+        finally:
+            conn.set_progress_handler(None, 0)
+
+    def cap(self, sql: str, rows):
+        """Trim a fetched result (read with ``max_rows + 1``) to ``max_rows``."""
+        if self.max_rows and len(rows) > self.max_rows:
+            self.record(sql, "capped", f"returned the first {self.max_rows:,} rows")
+            del rows[self.max_rows:]
+        return rows
+
+
+_query_guard = None
+_query_guard_lock = threading.Lock()
+
+
+def get_query_guard() -> QueryGuard:
+    """Process-wide guard; NL2SQL_MAX_SECONDS, NL2SQL_MAX_STEPS, NL2SQL_MAX_ROWS
+    and NL2SQL_MAX_JOIN_ROWS set the limits (0 disables one)."""
+    global _query_guard
+    if _query_guard is None:
+        with _query_guard_lock:
+            if _query_guard is None:
+                _query_guard = QueryGuard(
+                    max_seconds=float(os.getenv("NL2SQL_MAX_SECONDS", "20")),
+                    max_steps=int(os.getenv("NL2SQL_MAX_STEPS", "200000000")),
+                    max_rows=int(os.getenv("NL2SQL_MAX_ROWS", "100000")),
+                    max_join_rows=int(os.getenv("NL2SQL_MAX_JOIN_ROWS", "1000000")),
+                )
+    return _query_guard
+
+
+# 3.3 Full-text rewrite: answer LIKE '%text%' filters from FTS5 trigram indexes
+_FTS_OPTION = re.compile(r"(\w+)\s*=\s*'([^']*)'")
+_FTS_SAFE_TEXT = re.compile(r"^[A-Za-z0-9 .,:;!?&()/-]{3,}$")
+_FROM_WORDS = frozenset({"FROM", "JOIN"})
+_NOT_ALIAS = frozenset({
+    "WHERE", "GROUP", "ORDER", "LIMIT", "JOIN", "INNER", "LEFT", "CROSS", "NATURAL", "ON",
+    "USING", "UNION", "EXCEPT", "INTERSECT", "HAVING", "WINDOW",
+})
+
+
+class FTSIndex:
+    """An external-content FTS5 table with the trigram tokenizer over some
+    text columns of a content table."""
+
+    def __init__(self, alias, name, content, content_rowid, columns):
+        self.alias = alias
+        self.name = name
+        self.content = content
+        self.content_rowid = content_rowid
+        self.columns = {c.upper(): c for c in columns}
+
+
+def _fts_indexes(conn) -> list:
+    """Trigram FTS5 tables in the attached databases, re-read when a file changes."""
+    token = db_files_token(conn.paths)
+    if conn.fts_indexes is None or conn.fts_indexes[0] != token:
+        found = []
+        for alias in conn.attached:
+            for name, ddl in conn.execute(
+                f"SELECT name, sql FROM {alias}.sqlite_master WHERE type = 'table' AND sql LIKE 'CREATE VIRTUAL TABLE%fts5%'"
+            ):
+                args = ddl[ddl.index("(") + 1:ddl.rindex(")")]
+                options = {k.lower(): v for k, v in _FTS_OPTION.findall(args)}
+                if "content" not in options or "trigram" not in options.get("tokenize", ""):
+                    continue
+                columns = [a.strip() for a in args.split(",") if "=" not in a and a.strip()]
+                found.append(FTSIndex(alias, name, options["content"], options.get("content_rowid", "rowid"), columns))
+        conn.fts_indexes = (token, found)
+    return conn.fts_indexes[1]
+
+
+def _where_conjuncts(words, start):
+    """Start positions of the ``col LIKE 'x'`` / ``q.col LIKE 'x'`` terms that
+    make up a whole top-level AND-conjunct of the WHERE clause after
+    ``words[start]``; none when the clause has a top-level OR."""
+    if "WHERE" not in words[start:]:
+        return []
+    conjuncts, current, depth, between = [], [], 0, False
+    for n in range(words.index("WHERE", start) + 1, len(words)):
+        w = words[n]
+        if w in ("(", "CASE"):
+            depth += 1
+        elif w in (")", "END"):
+            depth -= 1
+        elif depth == 0 and w in ("GROUP", "ORDER", "LIMIT", "HAVING", "WINDOW", ";"):
+            break
+        elif depth == 0 and w == "OR":
+            return []
+        elif depth == 0 and w == "BETWEEN":
+            between = True
+        elif depth == 0 and w == "AND":
+            if between:
+                between = False
+            else:
+                conjuncts.append(current)
+                current = []
+                continue
+        current.append(n)
+    conjuncts.append(current)
+    return [c[-3] for c in conjuncts
+            if (len(c) == 3 or len(c) == 5 and words[c[1]] == ".") and words[c[-2]] == "LIKE"]
+
+
+def rewrite_like_to_match(sql: str, indexes) -> str:
+    """Replace ``col LIKE '%text%'`` on an indexed column with a MATCH against
+    its FTS5 trigram index.
+
+    Trigram MATCH of a phrase finds exactly the rows containing it as a
+    case-insensitive substring, which is what LIKE '%text%' asks, so the
+    result is unchanged. Only applied where that holds: the statement reads
+    one table (no joins, subqueries or compound arms), the pattern is '%'
+    + at least three plain ASCII characters + '%' with no ESCAPE, and the
+    predicate is a whole top-level AND-conjunct of the WHERE clause. There a
+    NULL column (LIKE gives NULL, the IN gives false) drops the row either
+    way; under NOT, OR or in the select list the two would differ. Anything
+    else is left alone.
+    """
+    if not indexes or "LIKE" not in sql.upper():
+        return sql
+    toks = _SQL_TOKEN.findall(sql)
+    sig = [i for i, t in enumerate(toks) if not (t.isspace() or t.startswith("--") or t.startswith("/*"))]
+    words = [toks[i].upper() for i in sig]
+    if sum(w in _FROM_WORDS for w in words) != 1 or "SELECT" in words[words.index("FROM") + 1:] \
+            or any(w in ("UNION", "EXCEPT", "INTERSECT") for w in words):
+        return sql
+
+    # The single FROM item: [db.]table [[AS] alias], not followed by a comma
+    k = words.index("FROM") + 1
+    parts = [toks[sig[k]]]
+    while k + 2 < len(sig) and words[k + 1] == ".":
+        parts.append(toks[sig[k + 2]])
+        k += 2
+    qualifier, table = (parts[0], parts[-1]) if len(parts) == 2 else (None, parts[0])
+    index = next(
+        (ix for ix in indexes if ix.content.upper() == table.upper()
+         and (qualifier is None or qualifier.upper() == ix.alias.upper())),
+        None,
+    )
+    if index is None:
+        return sql
+    k += 1
+    if k < len(sig) and words[k] == "AS":
+        k += 1
+    names = {table.upper()}
+    if k < len(sig) and re.match(r"[A-Za-z_]", words[k]) and words[k] not in _NOT_ALIAS:
+        names = {words[k]}
+        k += 1
+    if k < len(sig) and words[k] == ",":
+        return sql
+
+    out, last = [], 0
+    for n in _where_conjuncts(words, k):
+        if words[n + 1] != "LIKE" or words[n].upper() not in index.columns:
+            continue
+        lit = toks[sig[n + 2]]
+        col_start = n
+        if n >= 2 and words[n - 1] == ".":
+            if words[n - 2] not in names:
+                continue
+            col_start = n - 2
+        if not (lit.startswith("'%") and lit.endswith("%'") and _FTS_SAFE_TEXT.match(lit[2:-2])):
+            continue
+        text = lit[2:-2]
+        ref = f"{toks[sig[col_start]]}.{index.content_rowid}" if col_start != n else index.content_rowid
+        column = index.columns[words[n].upper()]
+        out.append("".join(toks[last:sig[col_start]]))
+        out.append(
+            f"{ref} IN (SELECT rowid FROM {index.alias}.{index.name} "
+            f"WHERE {index.name} MATCH '{column} : \"{text}\"')"
+        )
+        last = sig[n + 2] + 1
+    if not out:
+        return sql
+    out.append("".join(toks[last:]))
+    return "".join(out)
+
+
+def _prepare(conn, sql: str, rewrite: bool = True) -> str:
+    """Per-connection rewrites applied before any query runs; with
+    ``rewrite=False`` (SQL that already went through them) only the plan check."""
+    if rewrite and "coin_rollups" in conn.attached and os.getenv("NL2SQL_ROLLUPS", "1") != "0":
+        sql, _ = rewrite_for_rollups(sql, _fresh_rollups(conn))
+    if rewrite and os.getenv("NL2SQL_FTS", "1") != "0":
+        sql = rewrite_like_to_match(sql, _fts_indexes(conn))
+    get_query_guard().check_plan(conn, sql)
+    return sql
+
+
+def _fetch(sql: str, handle: QueryHandle = None, prepared: bool = False):
+    guard = get_query_guard()
+    with get_pool(datasets_for_sql(sql)).connection() as conn:
+        sql = _prepare(conn, sql, rewrite=not prepared)
+        if handle is not None:
+            handle.attach(conn)
+        try:
+            with guard.budget(conn, sql):
+                cur = conn.cursor()
+                cur.execute(sql)
+                rows = cur.fetchmany(guard.max_rows + 1) if guard.max_rows else cur.fetchall()
+                cols = [desc[0] for desc in cur.description]
+                cur.close()
+        finally:
+            if handle is not None:
+                handle.detach()
+    return guard.cap(sql, rows), cols
+
+
+DEFAULT_BATCH_ROWS = 1000
+DEFAULT_PAGE_ROWS = int(os.getenv("NL2SQL_PAGE_ROWS", "1000"))
+
+
+def iter_batches(sql: str, batch_size: int = DEFAULT_BATCH_ROWS, max_rows: int = None,
+                 skip_rows: int = 0, handle: QueryHandle = None):
+    """Stream a query as ColumnarResult batches of at most ``batch_size`` rows.
+
+    Only one batch is held in memory at a time, however large the result.
+    ``skip_rows`` rows are read and dropped first; reading stops after
+    ``max_rows`` rows. An empty result still yields one empty batch so the
+    column names are known. The pooled connection is returned as soon as the
+    generator is exhausted or closed. The guard's row cap counts skipped rows
+    too, and its time budget covers the whole stream.
+    """
+    guard = get_query_guard()
+    capped = False
+    if guard.max_rows and (max_rows is None or skip_rows + max_rows > guard.max_rows):
+        max_rows, capped = max(guard.max_rows - skip_rows, 0), True
+    with get_pool(datasets_for_sql(sql)).connection() as conn:
+        sql = _prepare(conn, sql)
+        if handle is not None:
+            handle.attach(conn)
+        cur = conn.cursor()
+        try:
+            with guard.budget(conn, sql):
+                cur.execute(sql)
+                cols = [desc[0] for desc in cur.description]
+                while skip_rows > 0:
+                    skipped = len(cur.fetchmany(min(skip_rows, batch_size)))
+                    if not skipped:
+                        break
+                    skip_rows -= skipped
+                remaining, yielded = max_rows, False
+                while remaining is None or remaining > 0:
+                    rows = cur.fetchmany(batch_size if remaining is None else min(batch_size, remaining))
+                    if not rows:
+                        break
+                    if remaining is not None:
+                        remaining -= len(rows)
+                    yielded = True
+                    yield ColumnarResult(rows, cols)
+                if not yielded:
+                    yield ColumnarResult([], cols)
+                if capped and remaining == 0 and cur.fetchone() is not None:
+                    guard.record(sql, "capped", f"streamed the first {guard.max_rows:,} rows")
+        finally:
+            cur.close()
+            if handle is not None:
+                handle.detach()
+
+
+def fetch_page(sql: str, page: int = 0, page_size: int = DEFAULT_PAGE_ROWS, use_cache: bool = True):
+    """Return ``(QueryResult, has_more)`` for one page of a query's rows.
+
+    A result that is already in the result cache is sliced; otherwise only
+    this page (plus one row to detect more) is read from SQLite, so the first
+    page renders without materializing the whole result.
+    """
+    start = page * page_size
+    hit = get_result_cache().get(sql) if use_cache else None
+    if hit is None:
+        # Read just this page plus one row to know whether another page exists
+        with closing(iter_batches(sql, page_size + 1, page_size + 1, skip_rows=start)) as batches:
+            hit, start = next(batches), 0
+    return QueryResult(sql, [], hit.cols, data=hit.slice(start, start + page_size)), hit.nrows > start + page_size
+
+
+def run_sql(sql: str, use_cache: bool = True):
+    """Execute the given SQL on a pooled connection with all coin DBs attached."""
+    cache = get_result_cache() if use_cache else None
+    hit = cache.get(sql) if cache else None
+    if hit is not None:
+        return hit.rows(), hit.cols
+    rows, cols = _fetch(sql)
+    if cache:
+        cache.put(sql, rows, cols)
+    return rows, cols
+
+
+class QueryResult:
+    """One execution of a query; every view of the results derives from it."""
+
+    def __init__(self, sql: str, rows, cols, data: ColumnarResult = None):
+        self.sql = sql
+        self.rows = rows
+        self.cols = cols
+        self.data = data
+        self._frame = None
+
+    def __len__(self):
+        if self._frame is not None:
+            return len(self._frame)
+        return self.data.nrows if self.data is not None else len(self.rows)
+
+    @property
+    def frame(self) -> pd.DataFrame:
+        """Decoded results as a DataFrame, built once and shared by the other views."""
+        if self._frame is None:
+            if self.data is None:
+                self.data = ColumnarResult(self.rows, self.cols)
+                # The columns own the data now; drop the tuples to halve peak memory.
+                self.rows = []
+            self._frame = self.data.frame()
+        return self._frame
+
+    def display_frame(self) -> pd.DataFrame:
+        """Results with HTML entities unescaped in text columns, for the table view.
+
+        Only columns where '&' was seen while building the result are scanned.
+        """
+        df = self.frame
+        out = None
+        for i, escaped in enumerate(self.data.escaped):
+            if not escaped:
+                continue
+            col = df.iloc[:, i]
+            unescaped = unescape_column(col)
+            if unescaped is not col:
+                if out is None:
+                    out = df.copy(deep=False)
+                out.isetitem(i, unescaped)
+        return df if out is None else out
+
+    def plot_frame(self) -> pd.DataFrame:
+        """A shallow copy of the decoded results that chart code may modify freely."""
+        return self.frame.copy(deep=False)
+
+
+def execute(sql: str, use_cache: bool = True, handle: QueryHandle = None,
+            prepared: bool = False) -> QueryResult:
+    """Run the SQL once (or reuse a cached result) and hand back a QueryResult
+    for the table and plot views. ``handle`` allows interrupting the query;
+    ``prepared`` skips the rewrites for SQL that already went through them."""
+    cache = get_result_cache() if use_cache else None
+    hit = cache.get(sql) if cache else None
+    if hit is None:
+        rows, cols = _fetch(sql, handle, prepared)
+        hit = cache.put(sql, rows, cols) if cache else None
+        if hit is None:
+            return QueryResult(sql, rows, cols)
+    return QueryResult(sql, [], hit.cols, data=hit)
+
+
+
+# 3.4 Chart shaping: let SQLite do the aggregation a chart would do in pandas.
+# Bar and pie charts get one SUM per group, histograms one COUNT per bin, so
+# only chart-ready rows leave the database. The generated query becomes a
+# subquery after the per-connection rewrites have run on it, so rollups and
+# FTS still apply. Which columns to group and measure is read from a probe
+# of its first rows, with the same rules the chart code uses on a full frame.
+SHAPED_CHARTS = ("bar", "pie", "hist")
+CHART_BINS = 10         # as np.histogram
+_PROBE_ROWS = 50
+
+
+def _identifier(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _strip_order_by(sql: str) -> str:
+    """Drop a trailing top-level ORDER BY (unless a LIMIT/OFFSET follows it)
+    and semicolons: the statement is about to become a subquery, and an
+    aggregate over it does not care about row order."""
+    tokens = _SQL_TOKEN.findall(sql.strip().rstrip(";").rstrip())
+    depth, order_at = 0, None
+    for i, tok in enumerate(tokens):
+        if tok == "(":
+            depth += 1
+        elif tok == ")":
+            depth -= 1
+        elif depth == 0:
+            upper = tok.upper()
+            if upper == "ORDER":
+                order_at = i
+            elif upper in ("LIMIT", "OFFSET"):
+                order_at = None
+    return "".join(tokens[:order_at])
+
+
+def chart_columns(cols, rows):
+    """(group, value) columns of a result: value is the first numeric column,
+    group is Source if present, else the first non-numeric one. A column is
+    numeric when its non-NULL values all are; either may be None."""
+    numeric = []
+    for i, col in enumerate(cols):
+        kinds = {type(row[i]) for row in rows if row[i] is not None}
+        if kinds and kinds <= {int, float}:
+            numeric.append(col)
+    value = numeric[0] if numeric else None
+    others = [c for c in cols if c not in numeric]
+    group = "Source" if "Source" in others else others[0] if others else None
+    return group, value
+
+
+def shape_sql(sql: str, kind: str, group, value) -> str:
+    """``sql`` wrapped so it returns only what a ``kind`` chart draws.
+
+    bar / pie: ``group, SUM(value)`` per group, in group order.
+    hist:      ``bin, Frequency, lo, hi`` per non-empty bin of CHART_BINS equal
+               bins over [lo, hi]; the bin column is named after ``value``.
+    """
+    inner = _strip_order_by(sql)
+    v = _identifier(value)
+    if kind == "hist":
+        return f"""WITH chart_values AS (SELECT {v} AS v FROM ({inner}) WHERE {v} IS NOT NULL),
+     chart_range AS (SELECT MIN(v) AS lo, MAX(v) AS hi FROM chart_values)
+SELECT CASE WHEN hi > lo THEN MIN(CAST((v - lo) * {CHART_BINS}.0 / (hi - lo) AS INTEGER), {CHART_BINS - 1})
+            ELSE {CHART_BINS // 2} END AS {v},
+       COUNT(*) AS Frequency, lo, hi
+  FROM chart_values, chart_range
+ GROUP BY 1
+ ORDER BY 1"""
+    g = _identifier(group)
+    return f"""SELECT {g}, COALESCE(SUM({v}), 0) AS {v}
+  FROM ({inner})
+ WHERE {g} IS NOT NULL
+ GROUP BY {g}
+ ORDER BY {g}"""
+
+
+def execute_chart(sql: str, kind: str, use_cache: bool = True, handle: QueryHandle = None):
+    """Run ``sql`` shaped for a ``kind`` chart (see shape_sql). Returns None
+    when the chart is not one SQLite can pre-aggregate or the columns it
+    needs are missing; the caller then charts the plain result."""
+    if kind not in SHAPED_CHARTS:
+        return None
+    with get_pool(datasets_for_sql(sql)).connection() as conn:
+        prepared = _prepare(conn, sql)
+    probe = execute(f"SELECT * FROM ({_strip_order_by(prepared)}) LIMIT {_PROBE_ROWS}", use_cache, prepared=True)
+    rows = probe.data.rows() if probe.data is not None else probe.rows
+    group, value = chart_columns(probe.cols, rows)
+    if value is None or (group is None and kind != "hist"):
+        return None
+    return execute(shape_sql(prepared, kind, group, value), use_cache, handle, prepared=True)
+
+# 4. NL -> SQL generation with a persistent question cache
+ALIAS_TO_TABLE = {
+    "coin_bitcoin": "BITCOIN",
+    "coin_chainlink": "CHAINLINK",
+    "coin_ethereum": "ETHEREUM",
+    "coin_usdcoin": "USDCOIN",
+}
+
+
+_FENCE_RE = re.compile(r"^\s*```[^\n]*\n|\n?```\s*$")
+_COMPOUND_OPS = frozenset({"UNION", "INTERSECT", "EXCEPT"})
+_FROM_JOIN = frozenset({"FROM", "JOIN"})
+
+
+def postprocess_sql(sql: str) -> str:
+    """Clean raw model output in one token pass.
+
+    Strips Markdown fences, patches bare ``FROM/JOIN coin_x`` into
+    ``coin_x.TABLE``, and hoists ORDER BY clauses written on individual
+    UNION ALL arms to the end of the compound query (keeping the last one),
+    which is the only place SQLite accepts them. ORDER BY inside parentheses
+    (subqueries, window functions) is left where it is.
+    """
+    tokens = _SQL_TOKEN.findall(_FENCE_RE.sub("", sql.strip()))
+    out = []
+    order_by = None      # the top-level ORDER BY kept for the end
+    clause = None        # top-level ORDER BY currently being collected
+    depth = 0
+    prev = None          # previous significant token, upper-cased
+    for i, tok in enumerate(tokens):
+        first = tok[0]
+        if first.isspace():
+            (out if clause is None else clause).append(tok)
+            continue
+        upper = tok.upper() if first.isalpha() or first == "_" else tok
+        if tok == "(":
+            depth += 1
+        elif tok == ")":
+            depth -= 1
+        elif depth == 0 and (upper in _COMPOUND_OPS or tok == ";"):
+            if clause is not None:
+                order_by, clause = clause, None
+        elif depth == 0 and upper == "ORDER" and clause is None:
+            clause = []
+        elif (prev in _FROM_JOIN and tok.lower() in ALIAS_TO_TABLE
+              and (i + 1 == len(tokens) or tokens[i + 1] != ".")):
+            tok = f"{tok}.{ALIAS_TO_TABLE[tok.lower()]}"
+        prev = upper
+        (out if clause is None else clause).append(tok)
+    if clause is not None:
+        order_by = clause
+    sql = "".join(out).strip().rstrip(";").rstrip()
+    if order_by is not None:
+        sql += "\n" + "".join(order_by).strip().rstrip(";").rstrip()
+    return sql
+
+
+_WORD_RE = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+_STOPWORDS = frozenset(
+    "a an the of for in on over to me please show give what is are was were "
+    "and with by from all".split()
+)
+
+
+def normalize_question(question: str) -> str:
+    """Lower-case, NFKC-fold and strip punctuation so trivial rewordings share a key."""
+    text = unicodedata.normalize("NFKC", question).lower()
+    return " ".join(_WORD_RE.findall(text))
+
+
+def _similarity_tokens(normalized: str) -> frozenset:
+    return frozenset(t for t in normalized.split() if t not in _STOPWORDS)
+
+
+def _entity_words(normalized: str, vocabulary) -> frozenset:
+    text = f" {_stem_words(normalized)} "
+    return frozenset(w for w in vocabulary if f" {w} " in text)
+
+
+class SQLCache:
+    """On-disk LRU/TTL cache of question -> post-processed SQL.
+
+    Entries are keyed on the normalized question plus a hash of the prompt and
+    the model name, so editing the prompt or switching models never serves
+    stale SQL. With ``similarity`` set (0-1), a miss falls back to the closest
+    cached question by token Jaccard similarity, provided both questions
+    mention exactly the same numbers (years, amounts, ...) and the same
+    entities: the words of ``entities()`` (normalized, stemmed phrases such as
+    SchemaCatalog.vocabulary) found in them. Without ``entities`` a near match
+    may only differ in stopwords.
+    """
+
+    def __init__(self, path="nl2sql_cache.db", max_entries=1000, ttl=7 * 24 * 3600, similarity=None,
+                 entities=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self.entities = entities
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS sql_cache (
+                   key        TEXT PRIMARY KEY,
+                   scope      TEXT NOT NULL,
+                   question   TEXT NOT NULL,
+                   sql        TEXT NOT NULL,
+                   created    REAL NOT NULL,
+                   last_used  REAL NOT NULL
+               )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sql_cache_scope ON sql_cache(scope, last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def _scope(prompt: str, model_name: str) -> str:
+        return hashlib.sha256(f"{model_name}\0{prompt}".encode()).hexdigest()[:16]
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self.ttl is not None and now - created > self.ttl
+
+    def _nearest(self, scope, normalized, now):
+        tokens = _similarity_tokens(normalized)
+        numbers = {t for t in tokens if t[0].isdigit()}
+        if self.entities is None:
+            def same(question, other):
+                return other == tokens
+        else:
+            vocabulary = self.entities()
+            named = _entity_words(normalized, vocabulary)
+
+            def same(question, other):
+                return {t for t in other if t[0].isdigit()} == numbers and _entity_words(question, vocabulary) == named
+        best, best_score = None, self.similarity
+        for key, question, sql, created in self._conn.execute(
+            "SELECT key, question, sql, created FROM sql_cache WHERE scope = ?", (scope,)
+        ):
+            if self._expired(created, now):
+                continue
+            other = _similarity_tokens(question)
+            if not same(question, other):
+                continue
+            union = tokens | other
+            score = len(tokens & other) / len(union) if union else 1.0
+            if score >= best_score:
+                best, best_score = (key, sql), score
+        return best
+
+    def get(self, question: str, prompt: str, model_name: str):
+        """Return cached SQL for the question, or None on a miss."""
+        normalized = normalize_question(question)
+        scope = self._scope(prompt, model_name)
+        key = f"{scope}:{normalized}"
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT sql, created FROM sql_cache WHERE key = ?", (key,)).fetchone()
+            if row and self._expired(row[1], now):
+                self._conn.execute("DELETE FROM sql_cache WHERE key = ?", (key,))
+                row = None
+            if row:
+                self.hits += 1
+            elif self.similarity is not None:
+                near = self._nearest(scope, normalized, now)
+                if near:
+                    key, row = near[0], (near[1],)
+                    self.near_hits += 1
+            if not row:
+                self.misses += 1
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE sql_cache SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return row[0]
+
+    def put(self, question: str, prompt: str, model_name: str, sql: str):
+        """Store SQL for the question and evict least-recently-used entries over the limit."""
+        normalized = normalize_question(question)
+        scope = self._scope(prompt, model_name)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sql_cache VALUES (?, ?, ?, ?, ?, ?)",
+                (f"{scope}:{normalized}", scope, normalized, sql, now, now),
+            )
+            self._conn.execute(
+                """DELETE FROM sql_cache WHERE key IN (
+                       SELECT key FROM sql_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)""",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM sql_cache")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        """Hit/miss counters for this process plus the number of stored entries."""
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM sql_cache").fetchone()[0]
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.near_hits) / lookups if lookups else 0.0,
+            "entries": size,
+        }
+
+
+_sql_cache = None
+_sql_cache_lock = threading.Lock()
+
+
+def get_sql_cache() -> SQLCache:
+    """Return the process-wide question cache (configured from the environment)."""
+    global _sql_cache
+    if _sql_cache is None:
+        with _sql_cache_lock:
+            if _sql_cache is None:
+                similarity = os.getenv("NL2SQL_CACHE_SIMILARITY")
+                _sql_cache = SQLCache(
+                    os.getenv("NL2SQL_CACHE_PATH", "nl2sql_cache.db"),
+                    similarity=float(similarity) if similarity else None,
+                    entities=lambda: get_schema_catalog().vocabulary(),
+                )
+    return _sql_cache
+
+
+# 4.1 Schema-driven prompts: describe only the tables a question needs
+PROMPT_HEADER = """
+You are an expert in converting English questions to SQL queries.
+You have these attached SQLite tables (always qualify them as alias.TABLE):
+"""
+
+# Added when the described tables include several with the same columns
+SIBLING_RULE = """
+When a question spans several tables with the same columns, UNION ALL one SELECT per table
+and prefix each SELECT with a literal 'Source' column naming it."""
+
+# Added when the unified coin store (NL2SQL_COIN_STORE=unified) is described
+UNIFIED_RULE = """
+Every coin's prices are in coins.coins: answer questions about several coins from that one table,
+filtering with Symbol IN (...), selecting Source (the coin name) and grouping by it, never a UNION ALL per coin."""
+
+PROMPT_RULES = """
+Filter indexed columns with plain range comparisons (e.g. Date BETWEEN '2021-01-01' AND '2021-12-31 23:59:59')
+instead of wrapping them in functions like strftime().
+
+Do NOT wrap your answer in backticks or include the word “SQL.”
+
+make sure to remeber that after the sql part the user will also make a graph from the data, so if u think the date or any other 
+feature should be added to the sql query add it for the graph to be made better
+
+"""
+
+# Text columns with at most this many distinct values have them listed
+SCHEMA_MAX_VALUES = 8
+_EXAMPLE_CHARS = 40
+
+
+class TableSchema:
+    """Columns, indexes and sample values of one attached table."""
+
+    def __init__(self, alias, name, columns, indexed, rows, values, examples):
+        self.alias = alias
+        self.name = name
+        self.columns = columns      # [(name, declared type)]
+        self.indexed = indexed      # column names leading an index
+        self.rows = rows
+        self.values = values        # column -> every distinct value (low-cardinality text)
+        self.examples = examples    # column -> one sample value (other text columns)
+        self.keywords = set()       # normalized words/phrases that point at this table
+        self.note = None            # described by this line instead of its columns
+        self.references = {}        # column -> "TABLE.column" it is a foreign key to
+
+    @property
+    def qualified(self) -> str:
+        return f"{self.alias}.{self.name}"
+
+    def signature(self):
+        return tuple(self.columns)
+
+
+def _quote(value) -> str:
+    text = str(value)
+    if len(text) > _EXAMPLE_CHARS:
+        text = text[:_EXAMPLE_CHARS] + "…"
+    return "'" + text.replace("'", "''") + "'"
+
+
+def _stem_words(text: str) -> str:
+    """Drop a plural 's' so "movies" in a question matches a Movie table."""
+    return " ".join(w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w for w in text.split())
+
+
+def _route_terms(text: str) -> str:
+    """_stem_words, then -ing, -ed and a final e dropped, so "rated" and
+    "voted" in a question meet the Rating and Votes columns."""
+    out = []
+    for w in _stem_words(text).split():
+        if len(w) > 5 and w.endswith("ing"):
+            w = w[:-3]
+        elif len(w) > 4 and w.endswith("ed"):
+            w = w[:-2]
+        if len(w) > 3 and w.endswith("e"):
+            w = w[:-1]
+        out.append(w)
+    return " ".join(out)
+
+
+def introspect_tables(conn, aliases) -> list:
+    """Read sqlite_master and PRAGMA table_info of the given attached databases.
+
+    A file attached under several aliases is described once, under the first.
+    """
+    files = {row[1]: row[2] for row in conn.execute("PRAGMA database_list")}
+    seen, tables = set(), []
+    for alias in aliases:
+        if alias not in files or files[alias] in seen:
+            continue
+        seen.add(files[alias])
+        names = conn.execute(
+            f"SELECT name, sql FROM {alias}.sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+        ).fetchall()
+        virtual = [name for name, ddl in names if ddl.upper().startswith("CREATE VIRTUAL TABLE")]
+        for name, ddl in names:
+            if any(name.startswith(v + "_") for v in virtual):
+                continue    # FTS5 shadow tables
+            if name in virtual:
+                cols = [c[1] for c in conn.execute(f"PRAGMA {alias}.table_info(\"{name}\")")]
+                t = TableSchema(alias, name, [], set(), 0, {}, {})
+                t.note = (f"full-text index over {', '.join(cols)}; WHERE {name} MATCH '{cols[-1]} : \"text\"'"
+                          f" finds substrings, ORDER BY bm25({name}) ranks by relevance; its rowid is the indexed row's id")
+                tables.append(t)
+                continue
+            table = f'{alias}."{name}"'
+            columns = [(c[1], c[2] or "") for c in conn.execute(f"PRAGMA {alias}.table_info(\"{name}\")")]
+            indexed = set()
+            for idx in conn.execute(f"PRAGMA {alias}.index_list(\"{name}\")").fetchall():
+                first = conn.execute(f"PRAGMA {alias}.index_info(\"{idx[1]}\")").fetchone()
+                if first is not None:
+                    indexed.add(first[2])
+            indexed |= {c[1] for c in conn.execute(f"PRAGMA {alias}.table_info(\"{name}\")") if c[5] == 1}
+            rows = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            values, examples = {}, {}
+            for col, decl in columns:
+                if "CHAR" not in decl.upper() and "TEXT" not in decl.upper() and decl:
+                    continue
+                distinct = [v for (v,) in conn.execute(
+                    f'SELECT DISTINCT "{col}" FROM {table} WHERE "{col}" IS NOT NULL LIMIT {SCHEMA_MAX_VALUES + 1}'
+                )]
+                if not distinct:
+                    continue
+                if len(distinct) <= SCHEMA_MAX_VALUES and all(isinstance(v, str) for v in distinct):
+                    values[col] = distinct
+                else:
+                    examples[col] = distinct[0]
+            t = TableSchema(alias, name, columns, indexed, rows, values, examples)
+            t.references = {
+                fk[3]: f"{fk[2]}.{fk[4]}" for fk in conn.execute(f"PRAGMA {alias}.foreign_key_list(\"{name}\")")
+            }
+            tables.append(t)
+
+    # Words that name a table (alias, table name, its listed values); words
+    # shared by every table (e.g. "coin" in coin_bitcoin) cannot tell them apart
+    for t in tables:
+        words = {t.name, *t.alias.split("_"), *(v for vals in t.values.values() for v in vals)}
+        t.keywords = {_stem_words(normalize_question(w)) for w in words} - {""}
+    if len(tables) > 1:
+        common = set.intersection(*(t.keywords for t in tables))
+        for t in tables:
+            t.keywords -= common
+    return tables
+
+
+class SchemaCatalog:
+    """Introspected tables of every registered dataset, read once per dataset
+    and re-read only when one of its files changes. Optional databases (the
+    rollups) are not described: queries reach them through rewrite_for_rollups.
+
+    The same metadata routes questions: ``route`` picks datasets by matching
+    the question against their words (registry keywords, aliases, table and
+    column names, listed values), so registering more datasets adds a few
+    set lookups, not attached files.
+    """
+
+    def __init__(self):
+        self._tables = {}       # dataset -> (token, [TableSchema])
+        self._routes = None     # (tokens, {dataset: {routing word: (weight, names it)}}, vocabulary)
+        self._lock = threading.Lock()
+
+    def tables(self, dataset: str) -> list:
+        pool = get_pool((dataset,))
+        token = db_files_token(pool.paths())
+        entry = self._tables.get(dataset)
+        if entry is None or entry[0] != token:
+            with self._lock:
+                entry = self._tables.get(dataset)
+                if entry is None or entry[0] != token:
+                    try:
+                        with pool.connection() as conn:
+                            tables = introspect_tables(conn, list(pool.databases))
+                    except sqlite3.OperationalError:
+                        tables = []     # a file is missing; nothing to route to
+                    entry = self._tables[dataset] = (token, tables)
+        return entry[1]
+
+    def _routing_words(self) -> dict:
+        return self._index()[1]
+
+    def vocabulary(self) -> frozenset:
+        """Every alias, table, column and listed value (coin names and symbols
+        among them), normalized and stemmed: the words that change which rows
+        a question asks for."""
+        return self._index()[2]
+
+    def _index(self):
+        tokens = {name: db_files_token(get_pool((name,)).paths()) for name in DATASETS}
+        if self._routes is None or self._routes[0] != tokens:
+            words, vocabulary = {}, set()
+            for name, ds in DATASETS.items():
+                # Keywords and column names hint at a dataset; aliases, table
+                # names and listed values name something in it
+                hints, names, columns = {*ds.keywords, name}, set(ds.databases), set()
+                for t in self.tables(name):
+                    columns |= {col for col, _ in t.columns}
+                    names |= {t.name, *(v for vals in t.values.values() for v in vals)}
+                    vocabulary |= t.keywords
+                found = {_route_terms(normalize_question(w)): False for w in hints | columns}
+                found.update((_route_terms(normalize_question(w)), True) for w in names)
+                words[name] = {w: named for w, named in found.items() if w and w not in _STOPWORDS}
+                vocabulary |= {_stem_words(normalize_question(w)) for w in names | columns}
+            counts = {}
+            for found in words.values():
+                for w in found:
+                    counts[w] = counts.get(w, 0) + 1
+            # A word several datasets share (Year, Genre, ...) is split between them
+            self._routes = (tokens, {
+                name: {w: (Fraction(1, counts[w]), named) for w, named in found.items()}
+                for name, found in words.items()
+            }, frozenset(vocabulary - _STOPWORDS - {""}))
+        return self._routes
+
+    def route(self, question: str = None) -> tuple:
+        """Datasets the question points at most often; DEFAULT_DATASET if none.
+
+        Each matching word scores 1, split evenly between the datasets that
+        share it. A dataset's nouns ("shows", "series") score when plural, or
+        when singular, not the opening word ("show me ...") and no other
+        dataset's table, alias or value is named. A tie goes to the datasets
+        whose tables, aliases or values the question names; a tie on keywords
+        and column names alone goes to DEFAULT_DATASET when it is one of them.
+        """
+        if not question:
+            return (DEFAULT_DATASET,)
+        normalized = normalize_question(question)
+        text = f" {_route_terms(normalized)} "
+        hits = {
+            name: [hit for w, hit in words.items() if f" {w} " in text]
+            for name, words in self._routing_words().items()
+        }
+        raw = normalized.split()
+        for name, found in hits.items():
+            named_elsewhere = any(named for other, hs in hits.items() if other != name for _, named in hs)
+            for noun in DATASETS[name].nouns:
+                plural = noun + "s" in raw or (noun.endswith("s") and noun in raw)
+                if plural or (noun in raw and raw[0] != noun and not named_elsewhere):
+                    found.append((Fraction(1), False))
+        scores = {name: sum(weight for weight, _ in found) for name, found in hits.items()}
+        best = max(scores.values(), default=0)
+        if not best:
+            return (DEFAULT_DATASET,)
+        tied = [name for name, score in scores.items() if score == best]
+        if len(tied) > 1:
+            named = {name: sum(n for _, n in hits[name]) for name in tied}
+            most = max(named.values())
+            tied = [name for name in tied if named[name] == most]
+            if not most and DEFAULT_DATASET in tied:
+                return (DEFAULT_DATASET,)
+        return tuple(tied)
+
+    def relevant(self, question: str = None, datasets=None) -> list:
+        """Tables of ``datasets`` (default: routed) needed for the question.
+
+        Among tables with identical columns (one per coin) only those the
+        question names are kept, or all of them when it names none; tables
+        of their own shape (a dimension, a junction table) are always kept.
+        """
+        datasets = datasets or self.route(question)
+        tables = [t for name in datasets for t in self.tables(name)]
+        if not question:
+            return tables
+        text = f" {_stem_words(normalize_question(question))} "
+        siblings = OrderedDict()
+        for t in tables:
+            siblings.setdefault(t.signature(), []).append(t)
+        picked = []
+        for group in siblings.values():
+            named = [t for t in group if any(f" {kw} " in text for kw in t.keywords)]
+            picked.extend(named if len(group) > 1 and named else group)
+        return picked
+
+    def describe(self, tables) -> str:
+        """Compact schema text; tables with identical columns share one line."""
+        groups = OrderedDict()
+        for t in tables:
+            groups.setdefault(t.signature(), []).append(t)
+        lines = []
+        for group in groups.values():
+            first = group[0]
+            if first.note:
+                lines.extend(f"- {t.qualified}: {t.note}" for t in group)
+                continue
+            cols = ", ".join(
+                f"{name} {decl}".rstrip() + (" indexed" if name in first.indexed else "")
+                + (f" -> {first.references[name]}" if name in first.references else "")
+                for name, decl in first.columns
+            )
+            lines.append(f"- {', '.join(t.qualified for t in group)}: {cols}")
+            # Sample values look alike across a group; show the first table's
+            examples = [f"{col} e.g. {_quote(val)}" for col, val in first.examples.items()]
+            if examples:
+                lines.append(f"    {'; '.join(examples)}")
+            for t in group:
+                facts = [
+                    f"{col} {_quote(vals[0])}" if len(vals) == 1 else f"{col} in ({', '.join(map(_quote, vals))})"
+                    for col, vals in t.values.items()
+                ]
+                if facts:
+                    lines.append(f"    {t.qualified}: {'; '.join(facts)}")
+        return "\n".join(lines)
+
+
+_schema_catalog = None
+_schema_catalog_lock = threading.Lock()
+
+
+def get_schema_catalog() -> SchemaCatalog:
+    global _schema_catalog
+    if _schema_catalog is None:
+        with _schema_catalog_lock:
+            if _schema_catalog is None:
+                _schema_catalog = SchemaCatalog()
+    return _schema_catalog
+
+
+def build_prompt(question: str = None, datasets=None) -> str:
+    """Prompt describing only the tables relevant to ``question``, within the
+    datasets it routes to (or ``datasets``)."""
+    catalog = get_schema_catalog()
+    tables = catalog.relevant(question, datasets)
+    return PROMPT_HEADER + "\n" + catalog.describe(tables) + "\n" + prompt_rules(tables)
+
+
+def prompt_rules(tables) -> str:
+    """PROMPT_RULES, after the rule for how to combine the coin tables
+    among ``tables``: one table in the unified store, else a UNION ALL of
+    tables with the same columns."""
+    rules = ""
+    if COIN_STORE == "unified" and any(t.qualified.lower() == "coins.coins" for t in tables):
+        rules += UNIFIED_RULE
+    signatures = [t.signature() for t in tables if not t.note]
+    if len(signatures) != len(set(signatures)):
+        rules += SIBLING_RULE
+    return rules + PROMPT_RULES
+
+
+def _model_name(model) -> str:
+    return getattr(model, "model_name", None) or MODEL_NAME
+
+
+def generate_sql(question: str, model=None, prompt: str = None, cache=None) -> str:
+    """Turn a question into SQL, answering from the cache when possible.
+
+    ``model`` is anything with ``generate_content([prompt, question])``
+    returning an object with ``.text``; it defaults to the Gemini model and is
+    only constructed on a cache miss. ``prompt`` defaults to build_prompt() for
+    the question. Pass ``cache=False`` to bypass caching.
+    """
+    if prompt is None:
+        prompt = build_prompt(question)
+    if cache is None:
+        cache = get_sql_cache()
+    model_name = _model_name(model)
+    if cache:
+        sql = cache.get(question, prompt, model_name)
+        if sql is not None:
+            return sql
+    if model is None:
+        model = get_model()
+    response = model.generate_content([prompt, question])
+    sql = postprocess_sql(response.text)
+    if cache and sql:
+        cache.put(question, prompt, model_name, sql)
+    return sql
+
+
+# 5. Async request pipeline: transcription -> SQL generation -> execution
+class Answer:
+    """Everything one question produced, with per-stage wall-clock timings (s)."""
+
+    def __init__(self, question, sql=None, result=None, timings=None):
+        self.question = question
+        self.sql = sql
+        self.result = result
+        self.timings = {} if timings is None else timings
+
+
+class Pipeline:
+    """asyncio front end to the blocking stages in this module.
+
+    Each stage runs under its own concurrency limit and timeout; SQLite and
+    transcription work happens on a thread pool so one slow LLM call never
+    blocks other questions. Cancelling ``answer()`` (or hitting the SQL
+    timeout) interrupts the running query on its connection.
+    """
+
+    DEFAULT_TIMEOUTS = {"transcribe": 30.0, "llm": 60.0, "sql": 30.0}
+
+    def __init__(self, model=None, prompt=None, cache=None, timeouts=None,
+                 llm_concurrency=4, sql_concurrency=None, transcribe_concurrency=2):
+        self.model = model
+        self.prompt = prompt
+        self.cache = cache
+        self.timeouts = {**self.DEFAULT_TIMEOUTS, **(timeouts or {})}
+        sql_concurrency = sql_concurrency or get_pool().max_size
+        self._llm = asyncio.Semaphore(llm_concurrency)
+        self._sql = asyncio.Semaphore(sql_concurrency)
+        self._transcribe = asyncio.Semaphore(transcribe_concurrency)
+        self._executor = ThreadPoolExecutor(
+            max_workers=sql_concurrency + transcribe_concurrency, thread_name_prefix="nl2sql"
+        )
+        self._loop = None
+        self._loop_lock = threading.Lock()
+
+    async def _in_thread(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def transcribe(self, audio) -> str:
+        async with self._transcribe:
+            return await asyncio.wait_for(self._in_thread(transcribe, audio), self.timeouts["transcribe"])
+
+    def _lookup(self, question: str):
+        """(cache, prompt, cached SQL or None) for a question. Building the
+        prompt may introspect the schema and the cache is a SQLite file, so
+        this runs on a worker thread like every other blocking stage."""
+        cache = get_sql_cache() if self.cache is None else self.cache
+        prompt = self.prompt or build_prompt(question)
+        sql = cache.get(question, prompt, _model_name(self.model)) if cache else None
+        return cache, prompt, sql
+
+    async def generate_sql(self, question: str) -> str:
+        cache, prompt, sql = await self._in_thread(self._lookup, question)
+        if sql is not None:
+            return sql
+        model_name = _model_name(self.model)
+        async with self._llm:
+            model = self.model or get_model()
+            if hasattr(model, "generate_content_async"):
+                call = model.generate_content_async([prompt, question])
+            else:
+                # Default executor, so blocking LLM clients never starve the SQL workers
+                call = asyncio.to_thread(model.generate_content, [prompt, question])
+            response = await asyncio.wait_for(call, self.timeouts["llm"])
+        sql = postprocess_sql(response.text)
+        if cache and sql:
+            await self._in_thread(cache.put, question, prompt, model_name, sql)
+        return sql
+
+    async def execute(self, sql: str) -> QueryResult:
+        handle = QueryHandle()
+        async with self._sql:
+            task = asyncio.ensure_future(self._in_thread(execute, sql, True, handle))
+            try:
+                return await asyncio.wait_for(asyncio.shield(task), self.timeouts["sql"])
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                # Stop SQLite, then wait for the worker so the connection is back in the pool
+                handle.interrupt()
+                await asyncio.wait([task])
+                if not task.cancelled():
+                    task.exception()   # "interrupted", superseded by the timeout/cancel
+                raise
+
+    async def answer(self, question: str = None, audio=None) -> Answer:
+        """Transcribe (if given audio), generate SQL and execute it."""
+        timings = {}
+        start = time.perf_counter()
+        if question is None:
+            question = await self.transcribe(audio)
+            timings["transcribe"] = time.perf_counter() - start
+        answer = Answer(question, timings=timings)
+        mark = time.perf_counter()
+        answer.sql = await self.generate_sql(question)
+        timings["llm"] = time.perf_counter() - mark
+        mark = time.perf_counter()
+        answer.result = await self.execute(answer.sql)
+        timings["sql"] = time.perf_counter() - mark
+        timings["total"] = time.perf_counter() - start
+        return answer
+
+    def _ensure_loop(self):
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="nl2sql-loop", daemon=True).start()
+        return self._loop
+
+    def submit(self, coro):
+        """Schedule a coroutine on the pipeline's shared background event loop and
+        return a concurrent.futures.Future (usable from Streamlit or Jupyter threads)."""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    def run(self, coro, timeout=None):
+        """Blocking helper around submit(); cancels the coroutine on timeout."""
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_pipeline() -> Pipeline:
+    """Return the process-wide pipeline shared by every session."""
+    global _pipeline
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                _pipeline = Pipeline()
+    return _pipeline
+
+
+async def answer(question: str = None, audio=None) -> Answer:
+    """Answer one question with the shared pipeline (see Pipeline.answer)."""
+    return await get_pipeline().answer(question, audio)
+
+
+# 6. Startup: create the long-lived resources before the first question
+def warm_up(datasets=None) -> dict:
+    """Build the model client, one pooled connection per dataset, the schema
+    catalog and the caches now, so the first question finds them ready.
+    Returns seconds per resource. Front ends call it once per process
+    (e.g. from an st.cache_resource function).
+
+    A dataset whose files cannot be opened is skipped and reported as
+    ``"pool <name>": "<error>"``; only questions routed to it will fail.
+    """
+    timings = {}
+    names = list(datasets or DATASETS)
+    start = time.perf_counter()
+    get_model()
+    timings["model"] = time.perf_counter() - start
+    start = time.perf_counter()
+    failed = {}
+    for name in names:
+        try:
+            with get_pool((name,)).connection():
+                pass
+        except sqlite3.Error as e:
+            failed[name] = f"{type(e).__name__}: {e}"
+            logging.getLogger("nl2sql").warning("Dataset %s unavailable: %s", name, e)
+    timings["pool"] = time.perf_counter() - start
+    timings.update((f"pool {name}", error) for name, error in failed.items())
+    names = [name for name in names if name not in failed]
+    start = time.perf_counter()
+    catalog = get_schema_catalog()
+    for name in names:
+        catalog.tables(name)
+    timings["schema"] = time.perf_counter() - start
+    start = time.perf_counter()
+    get_sql_cache()
+    get_result_cache()
+    timings["caches"] = time.perf_counter() - start
+    return timings
+
+
+import_report["core"] = time.perf_counter() - _IMPORT_START
@@ -1,14 +1,14 @@
-import sqlite3
-import pandas as pd
+from bulk_load import LoadJob, TableLoad, build_all
 
-# 1. Read in the CSV
-books_df = pd.read_csv('books.csv')
+# 1. books.csv -> table 'BOOKS' in books.db, with declared column types
+BOOKS_COLUMNS = {"Title": "TEXT", "Author": "TEXT", "Year": "INTEGER", "Genre": "TEXT"}
 
-# 2. Connect (or create) the books.db database
-conn = sqlite3.connect('books.db')
 
-# 3. Write the DataFrame into a table named 'BOOKS'
-books_df.to_sql('BOOKS', conn, if_exists='replace', index=False)
+def jobs():
+    return [LoadJob("books.db", [TableLoad("BOOKS", "books.csv", BOOKS_COLUMNS)])]
 
-conn.close()
-print("books.db created with table 'BOOKS'.")
+
+if __name__ == "__main__":
+    # 2. Stream the CSV into books.db in one transaction (see bulk_load.py)
+    build_all(jobs())
+    print("books.db created with table 'BOOKS'.")
@@ -0,0 +1,70 @@
+import sqlite3
+import glob
+import os
+import time
+
+# Optional consolidated store: one `coins` table clustered on (Symbol, Date),
+# plus a view per coin (BITCOIN, ETHEREUM, ...) with the original columns so
+# SQL written against coin_bitcoin.BITCOIN keeps working when core attaches
+# coins.db under the old aliases (NL2SQL_COIN_STORE=unified).
+STORE = "coins.db"
+SCHEMA = """
+CREATE TABLE coins (
+    Source    TEXT NOT NULL,
+    Symbol    TEXT NOT NULL,
+    Date      TEXT NOT NULL,
+    SNo       INTEGER NOT NULL,
+    Name      TEXT NOT NULL,
+    High      REAL,
+    Low       REAL,
+    Open      REAL,
+    Close     REAL,
+    Volume    REAL,
+    Marketcap REAL,
+    PRIMARY KEY (Symbol, Date)
+) WITHOUT ROWID;
+CREATE INDEX idx_coins_date ON coins(Date);
+CREATE INDEX idx_coins_source_date ON coins(Source, Date);
+"""
+VIEW = """
+CREATE VIEW {table} AS
+SELECT SNo, Name, Symbol, Date, High, Low, Open, Close, Volume, Marketcap
+  FROM coins
+ WHERE Symbol = '{symbol}'
+"""
+
+start = time.perf_counter()
+conn = sqlite3.connect(STORE)
+
+# 1. Start from an empty store
+for (name, kind) in conn.execute(
+    "SELECT name, type FROM sqlite_master WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite_%'"
+).fetchall():
+    conn.execute(f"DROP {kind.upper()} {name}")
+conn.executescript(SCHEMA)
+
+# 2. Copy each per-coin database built by create_coins.py into `coins`
+for csv_path in sorted(glob.glob("coin_*.csv")):
+    coin = os.path.basename(csv_path).replace("coin_", "").replace(".csv", "")
+    db_name, table_name = f"{coin.lower()}.db", coin.upper()
+    conn.execute("ATTACH DATABASE ? AS src", (db_name,))
+    with conn:
+        conn.execute(
+            f"""INSERT INTO coins
+                SELECT Name, Symbol, Date, SNo, Name, High, Low, Open, Close, Volume, Marketcap
+                  FROM src.{table_name}"""
+        )
+        symbol = conn.execute(f"SELECT Symbol FROM src.{table_name} LIMIT 1").fetchone()[0]
+    conn.execute("DETACH DATABASE src")
+
+    # 3. Backward-compatible per-coin view
+    conn.execute(VIEW.format(table=table_name, symbol=symbol))
+    print(f"Added {table_name} ({symbol}) to {STORE}.")
+
+# 4. Planner statistics and compaction
+conn.execute("ANALYZE")
+conn.commit()
+conn.execute("VACUUM")
+total = conn.execute("SELECT COUNT(*) FROM coins").fetchone()[0]
+conn.close()
+print(f"{STORE} built with {total} rows in {time.perf_counter() - start:.2f}s.")
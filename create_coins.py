@@ -1,26 +1,173 @@
+import argparse
 import sqlite3
 import pandas as pd
 import glob
 import os
+import time
 
-# 1. Find all coin_*.csv files
-for csv_path in glob.glob("coin_*.csv"):
-    # Derive the coin name from the filename, e.g. "coin_Bitcoin.csv" → "Bitcoin"
-    fname = os.path.basename(csv_path)
-    coin = fname.replace("coin_", "").replace(".csv", "")
+from bulk_load import LoadJob, TableLoad, build_all
+from create_rollups import ROLLUPS_DB, build_rollups
 
-    # 2. Read the CSV
-    df = pd.read_csv(csv_path)
-    # Optional: Parse the Date column as datetime
-    df["Date"] = pd.to_datetime(df["Date"])
+# Typed schema for every coin table. Date stays an ISO-8601 text key
+# ("YYYY-MM-DD 23:59:59") so range filters become index seeks.
+SCHEMA = """
+CREATE TABLE {table} (
+    SNo       INTEGER PRIMARY KEY,
+    Name      TEXT NOT NULL,
+    Symbol    TEXT NOT NULL,
+    Date      TEXT NOT NULL,
+    High      REAL,
+    Low       REAL,
+    Open      REAL,
+    Close     REAL,
+    Volume    REAL,
+    Marketcap REAL
+)
+"""
+INDEXES = [
+    "CREATE UNIQUE INDEX idx_{table}_date ON {table}(Date)",
+    "CREATE INDEX idx_{table}_symbol_date ON {table}(Symbol, Date)",
+]
+COLUMNS = {
+    "SNo": "INTEGER", "Name": "TEXT", "Symbol": "TEXT", "Date": "TEXT",
+    "High": "REAL", "Low": "REAL", "Open": "REAL", "Close": "REAL", "Volume": "REAL", "Marketcap": "REAL",
+}
+INSERT = "INSERT INTO {table} ({columns}) VALUES ({placeholders})"
+# Rows per transaction when appending
+BATCH_ROWS = 50_000
+STORE = "coins.db"   # optional single-table store from create_coin_store.py
 
-    # 3. Connect (or create) coin_<name>.db
-    db_name = f"{coin.lower()}.db"
-    conn = sqlite3.connect(db_name)
 
-    # 4. Write the DataFrame into a table named after the coin, e.g. BITCOIN
-    table_name = coin.upper()
-    df.to_sql(table_name, conn, if_exists="replace", index=False)
+def coin_files():
+    """(csv path, db file, table) per coin_*.csv, e.g. coin_Bitcoin.csv -> bitcoin.db, BITCOIN."""
+    for csv_path in sorted(glob.glob("coin_*.csv")):
+        coin = os.path.basename(csv_path).replace("coin_", "").replace(".csv", "")
+        yield csv_path, f"{coin.lower()}.db", coin.upper()
 
-    conn.close()
-    print(f"Created {db_name} with table {table_name} ({len(df)} rows).")
+
+def normalise_dates(chunk):
+    """Date as a sortable ISO string."""
+    chunk["Date"] = pd.to_datetime(chunk["Date"]).dt.strftime("%Y-%m-%d %H:%M:%S")
+    return chunk
+
+
+def coin_job(csv_path, db_name, table_name):
+    return LoadJob(db_name, [TableLoad(
+        table_name, csv_path, COLUMNS,
+        transform=normalise_dates,
+        ddl=SCHEMA.format(table=table_name),
+        indexes=[sql.format(table=table_name) for sql in INDEXES],
+    )], finish=refresh_rebuilt)
+
+
+def jobs():
+    """Full rebuild of every coin database (see bulk_load.py)."""
+    return [coin_job(*files) for files in coin_files()]
+
+
+def insert_sql(table):
+    return INSERT.format(table=table, columns=", ".join(COLUMNS), placeholders=", ".join("?" * len(COLUMNS)))
+
+
+def read_coin_csv(csv_path, skip_rows=0):
+    """Read a coin CSV (after skipping ``skip_rows`` data rows) with Date
+    normalised to a sortable ISO string."""
+    return normalise_dates(pd.read_csv(csv_path, skiprows=range(1, skip_rows + 1)))
+
+
+def append_coin(conn, csv_path, table_name):
+    """Append the CSV rows dated after the last ingested Date.
+
+    The CSVs are append-only with SNo numbering the data rows, so the rows up
+    to the last ingested SNo are skipped without being parsed; the last
+    ingested row is read back as an anchor, and if it does not line up the
+    whole file is read instead. Rows are then filtered on Date, so running
+    again inserts nothing. Returns (rows appended, first new Date).
+    """
+    last_sno, last_date = conn.execute(f"SELECT MAX(SNo), MAX(Date) FROM {table_name}").fetchone()
+    last_sno, last_date = last_sno or 0, last_date or ""
+    df = read_coin_csv(csv_path, skip_rows=max(last_sno - 1, 0))
+    if df.empty or df["Date"].iloc[0] != last_date:
+        df = read_coin_csv(csv_path)
+    df = df[df["Date"] > last_date]
+    if df.empty:
+        return 0, None
+    # SNo is the table's key; continue the numbering if the CSV's does not
+    if df["SNo"].iloc[0] <= last_sno:
+        df = df.assign(SNo=range(last_sno + 1, last_sno + 1 + len(df)))
+    sql = insert_sql(table_name)
+    for start in range(0, len(df), BATCH_ROWS):
+        with conn:
+            conn.executemany(sql, df[list(COLUMNS)].iloc[start:start + BATCH_ROWS].itertuples(index=False, name=None))
+    # Indexes are maintained by the inserts; refresh stale planner statistics
+    conn.execute("PRAGMA optimize")
+    return len(df), df["Date"].iloc[0]
+
+
+def refresh_derived(db_name, table_name, since=""):
+    """Bring rollups.db and coins.db (when they exist) up to date from ``since``.
+    Without ``since`` the coin's rollups and coins.db rows are replaced whole."""
+    if os.path.exists(ROLLUPS_DB):
+        conn = sqlite3.connect(ROLLUPS_DB)
+        conn.execute("ATTACH DATABASE ? AS src", (db_name,))
+        with conn:
+            build_rollups(conn, f"src.{table_name}", table_name, since=since)
+        conn.execute("DETACH DATABASE src")
+        conn.close()
+    if os.path.exists(STORE):
+        conn = sqlite3.connect(STORE)
+        conn.execute("ATTACH DATABASE ? AS src", (db_name,))
+        with conn:
+            if not since:
+                conn.execute(f"DELETE FROM coins WHERE Symbol IN (SELECT DISTINCT Symbol FROM src.{table_name})")
+            conn.execute(
+                f"""INSERT OR IGNORE INTO coins
+                    SELECT Name, Symbol, Date, SNo, Name, High, Low, Open, Close, Volume, Marketcap
+                      FROM src.{table_name}
+                     WHERE Date >= ?""",
+                (since,),
+            )
+        conn.execute("DETACH DATABASE src")
+        conn.close()
+
+
+def refresh_rebuilt(job):
+    """LoadJob.finish of a full coin build: what rollups.db and coins.db
+    derived from the old database is rebuilt from the new one."""
+    refresh_derived(job.db, job.tables[0].table)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build (or append to) one SQLite database per coin_*.csv.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="append rows newer than each database's last Date instead of rebuilding")
+    parser.add_argument("--processes", type=int, help="parallel full builds (default: one per coin, up to CPUs)")
+    args = parser.parse_args()
+
+    # 1. Find all coin_*.csv files; existing databases are appended to in incremental mode
+    rebuild = []
+    for csv_path, db_name, table_name in coin_files():
+        exists = False
+        if args.incremental and os.path.exists(db_name):
+            conn = sqlite3.connect(db_name)
+            exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,)
+            ).fetchone() is not None
+            if exists:
+                # 2. Append only the new daily rows; rollups and the unified store follow
+                start = time.perf_counter()
+                rows, since = append_coin(conn, csv_path, table_name)
+                conn.close()
+                if rows:
+                    refresh_derived(db_name, table_name, since)
+                    print(f"Appended {rows} rows to {db_name} table {table_name} in {time.perf_counter() - start:.2f}s.")
+                else:
+                    print(f"{db_name} table {table_name} is up to date.")
+            else:
+                conn.close()
+        if not exists:
+            rebuild.append(coin_job(csv_path, db_name, table_name))
+
+    # 3. Full builds, one process per database
+    if rebuild:
+        build_all(rebuild, args.processes)
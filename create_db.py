@@ -1,15 +1,15 @@
-import sqlite3
-import pandas as pd
+from bulk_load import LoadJob, TableLoad, build_all
 
-# 1. Read Movie.csv (which you just generated)
-movies_df = pd.read_csv('Movie.csv')
+# 1. Movie.csv (which you just generated) -> table "Movie" in movie.db,
+#    with declared column types
+MOVIE_COLUMNS = {"Name": "TEXT", "Revenue": "REAL", "Year": "INTEGER", "Universe": "TEXT"}
 
-# 2. Connect (or create) the SQLite database file named movie.db
-conn = sqlite3.connect('movie.db')
 
-# 3. Write the DataFrame to a table named "Movie"
-movies_df.to_sql('Movie', conn, if_exists='replace', index=False)
+def jobs():
+    return [LoadJob("movie.db", [TableLoad("Movie", "Movie.csv", MOVIE_COLUMNS)])]
 
-# 4. Clean up
-conn.close()
-print("movie.db created with table 'Movie'.")
+
+if __name__ == "__main__":
+    # 2. Stream the CSV into movie.db in one transaction (see bulk_load.py)
+    build_all(jobs())
+    print("movie.db created with table 'Movie'.")
@@ -0,0 +1,131 @@
+import sqlite3
+import glob
+import os
+import time
+
+from core import table_checksum
+
+# Weekly / monthly / yearly OHLCV rollups of every coin table, written to
+# rollups.db as <TABLE>_<GRAIN> (e.g. BITCOIN_MONTHLY). core attaches the file
+# as coin_rollups and rewrites eligible GROUP BY queries onto these tables.
+# Bucket holds exactly what strftime(<format>, Date) returns for the grain,
+# Start/End the first and last trading day in it, Days the number of rows.
+# Besides OHLCV, every price column keeps Min/Max/Sum so MIN/MAX/SUM/AVG over
+# the daily table can be answered from the rollup.
+ROLLUPS_DB = "rollups.db"
+GRAINS = {"WEEKLY": "%Y-%W", "MONTHLY": "%Y-%m", "YEARLY": "%Y"}
+VALUE_COLUMNS = ["Open", "High", "Low", "Close", "Volume", "Marketcap"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS {table} (
+    Bucket TEXT PRIMARY KEY,
+    Start  TEXT NOT NULL,
+    End    TEXT NOT NULL,
+    Days   INTEGER NOT NULL,
+    Name   TEXT,
+    Symbol TEXT,
+    Open   REAL,
+    High   REAL,
+    Low    REAL,
+    Close  REAL,
+    Volume REAL,
+    {stats}
+) WITHOUT ROWID
+"""
+
+INSERT = """
+INSERT OR REPLACE INTO {rollup}
+WITH days AS (
+    SELECT strftime('{fmt}', Date) AS Bucket, *,
+           FIRST_VALUE(Open) OVER w AS FirstOpen,
+           LAST_VALUE(Close) OVER w AS LastClose
+      FROM {source}
+     WHERE Date >= :since
+    WINDOW w AS (PARTITION BY strftime('{fmt}', Date) ORDER BY Date
+                 ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING)
+)
+SELECT Bucket, MIN(Date), MAX(Date), COUNT(*), MAX(Name), MAX(Symbol),
+       MAX(FirstOpen), MAX(High), MIN(Low), MAX(LastClose), SUM(Volume),
+       {stats}
+  FROM days
+ GROUP BY Bucket
+"""
+
+
+SOURCES = """
+CREATE TABLE IF NOT EXISTS ROLLUP_SOURCES (
+    TableName TEXT PRIMARY KEY,
+    Rows      INTEGER NOT NULL,
+    LastDate  TEXT,
+    Checksum  TEXT
+)
+"""
+
+
+def stat_columns():
+    return [f"{agg}{col}" for col in VALUE_COLUMNS for agg in ("Min", "Max", "Sum")]
+
+
+def bucket_start(conn, source, fmt, since):
+    """First Date of the bucket that contains `since`, so a partial rebuild
+    recomputes whole buckets."""
+    row = conn.execute(
+        f"SELECT MIN(Date) FROM {source} WHERE strftime('{fmt}', Date) = strftime('{fmt}', ?)",
+        (since,),
+    ).fetchone()
+    return row[0] or since
+
+
+def build_rollups(conn, source, table, since=""):
+    """(Re)build all grains for one coin table; only buckets from `since` on
+    are recomputed, which lets incremental ingestion refresh the tail.
+
+    The source's row count, last Date and checksum (core.table_checksum) are
+    recorded in ROLLUP_SOURCES; core only rewrites onto rollups whose recorded
+    state still matches the source.
+    """
+    stats_ddl = ",\n    ".join(f"{c} REAL" for c in stat_columns())
+    stats_sql = ", ".join(
+        f"{agg.upper()}({col})" for col in VALUE_COLUMNS for agg in ("Min", "Max", "Sum")
+    )
+    for grain, fmt in GRAINS.items():
+        rollup = f"{table}_{grain}"
+        conn.execute(SCHEMA.format(table=rollup, stats=stats_ddl))
+        start = bucket_start(conn, source, fmt, since) if since else ""
+        conn.execute(f"DELETE FROM {rollup} WHERE Start >= ?", (start,))
+        conn.execute(INSERT.format(rollup=rollup, fmt=fmt, source=source, stats=stats_sql), {"since": start})
+    conn.execute(SOURCES)
+    if "Checksum" not in {row[1] for row in conn.execute("PRAGMA table_info(ROLLUP_SOURCES)")}:
+        conn.execute("ALTER TABLE ROLLUP_SOURCES ADD COLUMN Checksum TEXT")
+    conn.execute(
+        f"""INSERT OR REPLACE INTO ROLLUP_SOURCES (TableName, Rows, LastDate, Checksum)
+            SELECT ?, COUNT(*), MAX(Date), ? FROM {source}""",
+        (table, table_checksum(conn, source)),
+    )
+
+
+if __name__ == "__main__":
+    conn = sqlite3.connect(ROLLUPS_DB)
+    # 1. Build the rollups of every coin database made by create_coins.py
+    for csv_path in sorted(glob.glob("coin_*.csv")):
+        start = time.perf_counter()
+        coin = os.path.basename(csv_path).replace("coin_", "").replace(".csv", "")
+        db_name, table_name = f"{coin.lower()}.db", coin.upper()
+        conn.execute("ATTACH DATABASE ? AS src", (db_name,))
+        with conn:
+            for grain in GRAINS:
+                conn.execute(f"DROP TABLE IF EXISTS {table_name}_{grain}")
+            build_rollups(conn, f"src.{table_name}", table_name)
+        conn.execute("DETACH DATABASE src")
+        counts = ", ".join(
+            f"{grain.lower()} {conn.execute(f'SELECT COUNT(*) FROM {table_name}_{grain}').fetchone()[0]}"
+            for grain in GRAINS
+        )
+        print(f"Rolled up {table_name} ({counts}) in {time.perf_counter() - start:.2f}s.")
+
+    # 2. Planner statistics and compaction
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+    print(f"{ROLLUPS_DB} written.")
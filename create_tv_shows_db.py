@@ -1,60 +1,124 @@
-import pandas as pd
 import sqlite3
 
-# 1) Load the “raw” CSV you just saved. 
+import pandas as pd
+
+from bulk_load import LoadJob, TableLoad, build_all
+
+# 1) The “raw” CSV you just saved is streamed in chunks (see bulk_load.py).
 #
-#    Because the very first column is just an unnamed index (0,1,2…), 
-#    pandas will read it as a “Unnamed: 0” column by default. 
-#    We’ll drop that after loading.
-tv_df = pd.read_csv('tv_shows.csv')
-
-# 2) Rename columns to remove the leading comma. 
-#    The file’s header is ["", "title", "year", …], 
-#    so pandas calls the first column "Unnamed: 0". We don’t need it.
-tv_df = tv_df.drop(columns=[tv_df.columns[0]])  # drop that unnamed index
-tv_df.columns = ['Title', 'Year', 'Runtime', 'Rating', 'Votes', 'Genre', 'Description']
-
-# 3) (Optional) Clean up any stray quotes, NaNs, etc.
-#    For example, if “Votes” came in as a string like "748,557", remove commas and convert to int:
-tv_df['Votes'] = (
-    tv_df['Votes']
-    .astype(str)
-    .str.replace(',', '', regex=False)
-    .replace({r'^\s*$': None}, regex=True)
-    .astype('Int64')  # allow for missing values
-)
-
-#    Also strip any leading/trailing whitespace on text fields:
-tv_df['Title']       = tv_df['Title'].astype(str).str.strip()
-tv_df['Genre']       = tv_df['Genre'].astype(str).str.strip()
-tv_df['Description'] = tv_df['Description'].astype(str).str.strip()
-
-# 4) Save a clean CSV (so you can eyeball it later if you want)
-tv_df.to_csv('tvshows_clean.csv', index=False)
-print(f"tvshows_clean.csv written ({len(tv_df)} rows).")
-
-# 5) Write to SQLite. We’ll create (or replace) tvshows.db with a table named TVSHOWS.
-conn = sqlite3.connect('tvshows.db')
-tv_df.to_sql('TVSHOWS', conn, if_exists='replace', index=False)
-
-# 6) (Optional) Add a simple PRIMARY KEY on rowid by creating a new table:
-#    – SQLite doesn’t let us ALTER an existing table to add PK easily,
-#      but we can create a fresh table with INTEGER PRIMARY KEY if you need it.
-conn.execute("""
-    CREATE TABLE IF NOT EXISTS TVSHOWS_with_id AS
-    SELECT ROWID      AS id,
-           Title      AS Title,
-           Year       AS Year,
-           Runtime    AS Runtime,
-           Rating     AS Rating,
-           Votes      AS Votes,
-           Genre      AS Genre,
-           Description AS Description
-    FROM TVSHOWS;
-""")
-conn.execute("DROP TABLE TVSHOWS;")
-conn.execute("ALTER TABLE TVSHOWS_with_id RENAME TO TVSHOWS;")
-
-conn.commit()
-conn.close()
-print("tvshows.db created (table = TVSHOWS with columns: id, Title, Year, Runtime, Rating, Votes, Genre, Description).")
+#    Because the very first column is just an unnamed index (0,1,2…),
+#    pandas reads it as a “Unnamed: 0” column. clean_chunk drops it.
+RAW_COLUMNS = ['Title', 'Year', 'Runtime', 'Rating', 'Votes', 'Genre', 'Description']
+
+
+def clean_chunk(chunk):
+    # 2) Drop the unnamed index column and name the rest.
+    chunk = chunk.drop(columns=[chunk.columns[0]])
+    chunk.columns = RAW_COLUMNS
+
+    # 3) Clean up any stray quotes, NaNs, etc.
+    #    For example, if “Votes” came in as a string like "748,557", remove commas:
+    chunk['Votes'] = chunk['Votes'].astype(str).str.replace(',', '', regex=False)
+
+    #    Also strip any leading/trailing whitespace on text fields:
+    chunk['Title']       = chunk['Title'].astype(str).str.strip()
+    chunk['Description'] = chunk['Description'].astype(str).str.strip()
+
+    #    Typed fields: "(2011 TV Series)" -> 2011 and "55 mins." -> 55. Genre comes
+    #    as a Python list repr ("[u'Adventure', u'Drama']"); store it as a plain
+    #    "Adventure, Drama" string, which step 6 splits into SHOW_GENRE.
+    chunk['Year']    = chunk['Year'].astype(str).str.extract(r'(\d{4})', expand=False)
+    chunk['Runtime'] = chunk['Runtime'].astype(str).str.extract(r'(\d+)', expand=False)
+    genres           = chunk['Genre'].astype(str).str.findall(r"'([^']+)'")
+    chunk['Genre']   = genres.str.join(', ').where(genres.str.len() > 0)
+
+    #    The chunk index keeps counting across chunks, so it numbers the shows
+    chunk.insert(0, 'id', chunk.index + 1)
+    return chunk
+
+
+# 4) TVSHOWS is keyed on id. INTEGER PRIMARY KEY makes id the rowid, which
+#    stays stable across VACUUM so the full-text index can point at it.
+TVSHOWS_COLUMNS = {
+    'id': 'INTEGER PRIMARY KEY',
+    'Title': 'TEXT',
+    'Year': 'INTEGER',
+    'Runtime': 'INTEGER',
+    'Rating': 'REAL',
+    'Votes': 'INTEGER',
+    'Genre': 'TEXT',
+    'Description': 'TEXT',
+}
+
+AFTER = [
+    # 5) Full-text index over Title, Genre and Description. External content:
+    #    the text stays in TVSHOWS and the index only holds trigrams, so a MATCH
+    #    finds substrings (what LIKE '%dragon%' asks for) from the index, and
+    #    bm25(TVSHOWS_FTS) ranks the hits. core rewrites such LIKE filters onto it.
+    """
+    CREATE VIRTUAL TABLE TVSHOWS_FTS USING fts5(
+        Title, Genre, Description,
+        content='TVSHOWS', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    "INSERT INTO TVSHOWS_FTS(TVSHOWS_FTS) VALUES ('rebuild')",
+
+    # 6) Genres as rows: SHOW_GENRE has one row per (show, genre) and GENRES one
+    #    per genre. Both are keyed on genre, so a genre filter is an index lookup
+    #    and per-genre counts/averages walk SHOW_GENRE in genre order, joining
+    #    TVSHOWS by primary key, instead of scanning Genre with LIKE.
+    """
+    CREATE TABLE GENRES (
+        genre TEXT PRIMARY KEY,
+        shows INTEGER NOT NULL
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE SHOW_GENRE (
+        show_id INTEGER NOT NULL REFERENCES TVSHOWS(id),
+        genre   TEXT    NOT NULL REFERENCES GENRES(genre),
+        PRIMARY KEY (genre, show_id)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX idx_SHOW_GENRE_show ON SHOW_GENRE(show_id, genre)",
+    # Genre is stored as "Adventure, Drama"; split it into rows on ", " with a
+    # recursive CTE, which needs no quoting whatever characters a genre holds
+    """
+    WITH RECURSIVE split(id, genre, rest) AS (
+        SELECT id, NULL, Genre || ', ' FROM TVSHOWS WHERE Genre IS NOT NULL
+        UNION ALL
+        SELECT id, substr(rest, 1, instr(rest, ', ') - 1), substr(rest, instr(rest, ', ') + 2)
+          FROM split WHERE rest <> ''
+    )
+    INSERT INTO SHOW_GENRE (show_id, genre)
+    SELECT DISTINCT id, genre FROM split WHERE genre IS NOT NULL
+    """,
+    "INSERT INTO GENRES SELECT genre, COUNT(*) FROM SHOW_GENRE GROUP BY genre",
+]
+
+
+def jobs():
+    return [LoadJob(
+        'tvshows.db',
+        [TableLoad('TVSHOWS', 'tv_shows.csv', TVSHOWS_COLUMNS, transform=clean_chunk)],
+        after=AFTER,
+        drop=('TVSHOWS_FTS', 'SHOW_GENRE', 'GENRES'),
+    )]
+
+
+if __name__ == "__main__":
+    # 7) Write to SQLite: tvshows.db, table TVSHOWS (steps 1-4) plus the tables of steps 5-6.
+    build_all(jobs())
+
+    # 8) Save a clean CSV (so you can eyeball it later if you want)
+    conn = sqlite3.connect('tvshows.db')
+    query = f"SELECT {', '.join(TVSHOWS_COLUMNS)} FROM TVSHOWS ORDER BY id"
+    for i, chunk in enumerate(pd.read_sql(query, conn, chunksize=100_000)):
+        chunk.astype({'Year': 'Int64', 'Runtime': 'Int64', 'Votes': 'Int64'}).to_csv(
+            'tvshows_clean.csv', mode='a' if i else 'w', header=not i, index=False, lineterminator='\r\n'
+        )
+    shows, genres = conn.execute("SELECT (SELECT COUNT(*) FROM TVSHOWS), (SELECT COUNT(*) FROM GENRES)").fetchone()
+    conn.close()
+    print(f"tvshows_clean.csv written ({shows} rows).")
+    print(f"tvshows.db created (table = TVSHOWS with columns: id, Title, Year, Runtime, Rating, Votes, Genre, Description;"
+          f" full-text index = TVSHOWS_FTS; SHOW_GENRE over {genres} GENRES).")
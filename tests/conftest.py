@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the repository root, next to the databases they open
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+
+class FakeModel:
+    """Stands in for the Gemini model: returns ``text`` and counts calls."""
+
+    model_name = "fake"
+
+    def __init__(self, text="SELECT 1"):
+        self.text = text
+        self.calls = 0
+
+    def generate_content(self, parts):
+        self.calls += 1
+        return type("Response", (), {"text": self.text})()
+
+
+@pytest.fixture
+def fake_model():
+    return FakeModel()
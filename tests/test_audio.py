@@ -0,0 +1,118 @@
+import wave
+from io import BytesIO
+
+import numpy as np
+import pytest
+
+import core
+from core import audio_digest
+
+
+def test_audio_digest_follows_bytes():
+    clip = b"RIFF" + bytes(range(200))
+    assert audio_digest(clip) == audio_digest(BytesIO(clip))
+    assert audio_digest(clip) != audio_digest(clip + b"\0")
+
+
+def test_backend_must_implement_stream_methods():
+    class Incomplete(core.TranscriptionStream):
+        def _accept(self, pcm):
+            pass
+
+    with pytest.raises(TypeError):
+        Incomplete(core.GoogleTranscriber())
+    with pytest.raises(TypeError):
+        core.Transcriber()
+
+
+def test_buffered_stream_times_stages():
+    class Echo(core.GoogleTranscriber):
+        def recognize(self, pcm):
+            return f"{len(pcm)} bytes"
+
+    stream = Echo().stream()
+    stream.feed(b"\0" * 320)
+    stream.feed(b"\0" * 320)
+    assert stream.finish() == "640 bytes"
+    assert {"recognize", "finalize", "total"} <= set(stream.timings)
+
+
+def wav_bytes(samples, rate=16000, channels=1):
+    buf = BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(np.asarray(samples, dtype="<i2").tobytes())
+    return buf.getvalue()
+
+
+@pytest.mark.parametrize("head, fmt", [
+    (b"RIFF\0\0\0\0WAVE", "wav"),
+    (b"fLaC\0\0\0\x22", "flac"),
+    (b"OggS\0\x02", "ogg"),
+    (b"ID3\x04\0\0", "mp3"),
+    (b"\xff\xfb\x90\x64", "mp3"),
+    (b"\x1aE\xdf\xa3\x9fB\x86", "webm"),
+    (b"\0\0\0\x20ftypM4A ", "mp4"),
+    (b"FORM\0\0\0\0AIFF", "aiff"),
+    (b"hello world!", None),
+    (b"", None),
+])
+def test_detect_container(head, fmt):
+    assert core.detect_container(head) == fmt
+
+
+def test_decode_reads_file_from_start():
+    # An UploadedFile the page already read sits at EOF
+    clip = wav_bytes(np.arange(1600) % 100)
+    upload = BytesIO(clip)
+    upload.read()
+    samples, rate = core.decode_audio(upload)
+    assert rate == 16000 and samples.shape == (1600, 1)
+
+
+def test_decode_seeks_plain_file(tmp_path):
+    path = tmp_path / "clip.wav"
+    path.write_bytes(wav_bytes([0, 1, 2, 3] * 400, rate=8000, channels=2))
+    with open(path, "rb") as f:
+        f.read()
+        samples, rate = core.decode_audio(f)
+    assert rate == 8000 and samples.shape == (800, 2)
+    assert samples[0].tolist() == [0, 1]
+
+
+def test_decode_empty_input():
+    with pytest.raises(RuntimeError):
+        core.decode_audio(b"")
+
+
+def test_resample_integer_ratio_averages_blocks():
+    samples = np.array([0, 2, 4, 6, 8, 10, 12], dtype=np.int16)
+    assert core.resample(samples, 48000, 16000).tolist() == [2.0, 8.0]
+    assert core.resample(samples, 16000, 16000) is samples
+
+
+def test_resample_other_ratio_interpolates():
+    samples = np.arange(0, 441, dtype=np.int16)
+    out = core.resample(samples, 44100, 16000)
+    assert len(out) == 160
+    np.testing.assert_allclose(out, np.arange(160) * 44100 / 16000, atol=1e-3)
+
+
+def test_trim_silence_keeps_padded_speech():
+    rate = 16000
+    frame = rate * core.VAD_FRAME_MS // 1000
+    rng = np.random.default_rng(0)
+    speech = rng.integers(-8000, 8000, rate // 2).astype(np.int16)
+    silence = np.full(rate, 3, dtype=np.int16)      # a DC offset is still silence
+    clip = np.concatenate([silence, speech, silence])
+    out = core.trim_silence(clip, rate)
+    pad = core.VAD_PAD_MS // core.VAD_FRAME_MS * frame
+    assert len(out) == len(speech) + 2 * pad
+    assert np.shares_memory(out, clip)
+
+
+def test_trim_silence_leaves_all_silence():
+    clip = np.zeros(16000, dtype=np.int16)
+    assert len(core.trim_silence(clip, 16000)) == len(clip)
@@ -0,0 +1,84 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from bulk_load import LoadJob, TableLoad, build, build_all, typed_chunk
+
+COLUMNS = {"id": "INTEGER PRIMARY KEY", "Name": "TEXT", "Score": "REAL", "Votes": "INTEGER"}
+
+
+def write_csv(path, rows):
+    pd.DataFrame(rows, columns=["Name", "Score", "Votes"]).to_csv(path, index=False)
+
+
+def numbered(chunk):
+    chunk.insert(0, "id", chunk.index + 1)
+    return chunk
+
+
+def test_typed_chunk_coerces_declared_types():
+    chunk = pd.DataFrame({"id": [1, 2], "Name": ["a", None], "Score": ["1.5", "n/a"], "Votes": ["7", ""]})
+    out = typed_chunk(chunk, COLUMNS)
+    assert list(out.itertuples(index=False, name=None)) == [(1, "a", 1.5, 7), (2, None, None, None)]
+    assert isinstance(out["Votes"].iloc[0], int)
+
+
+def test_build_streams_chunks_and_runs_after(tmp_path):
+    csv = tmp_path / "items.csv"
+    write_csv(csv, [(f"item{i}", i / 2, i) for i in range(25)])
+    job = LoadJob(
+        str(tmp_path / "items.db"),
+        [TableLoad("ITEMS", str(csv), COLUMNS, transform=numbered, indexes=["CREATE INDEX idx_ITEMS_Name ON ITEMS(Name)"])],
+        after=["CREATE TABLE TOTALS AS SELECT COUNT(*) AS n, SUM(Votes) AS votes FROM ITEMS"],
+    )
+    db, rows, _ = build(job, chunk_rows=10)
+    assert (db, rows) == (job.db, 25)
+    with sqlite3.connect(job.db) as conn:
+        # ids keep counting across the three chunks
+        assert conn.execute("SELECT MIN(id), MAX(id), COUNT(DISTINCT id) FROM ITEMS").fetchone() == (1, 25, 25)
+        assert conn.execute("SELECT * FROM TOTALS").fetchone() == (25, sum(range(25)))
+        assert conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name = 'idx_ITEMS_Name'").fetchone()
+        assert conn.execute("SELECT COUNT(*) FROM sqlite_stat1").fetchone()[0] > 0
+
+
+def test_rebuild_drops_derived_tables(tmp_path):
+    csv = tmp_path / "items.csv"
+    write_csv(csv, [("a", 1.0, 1), ("b", 2.0, 2)])
+    spec = TableLoad("ITEMS", str(csv), COLUMNS, transform=numbered)
+    db = str(tmp_path / "items.db")
+    build(LoadJob(db, [spec], after=["CREATE TABLE OLD AS SELECT * FROM ITEMS"]))
+    write_csv(csv, [("c", 3.0, 3)])
+    build(LoadJob(db, [spec], drop=("OLD",)))
+    with sqlite3.connect(db) as conn:
+        assert conn.execute("SELECT Name FROM ITEMS").fetchall() == [("c",)]
+        assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'OLD'").fetchone() is None
+        assert conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
+
+
+def test_failed_build_raises(tmp_path):
+    csv = tmp_path / "items.csv"
+    write_csv(csv, [("a", 1.0, 1)])
+    job = LoadJob(str(tmp_path / "items.db"), [TableLoad("ITEMS", str(csv), COLUMNS, transform=numbered)],
+                  after=["SELECT * FROM MISSING"])
+    with pytest.raises(sqlite3.OperationalError):
+        build(job)
+
+
+finished = []
+
+
+def record_finish(job):
+    finished.append(job.db)
+
+
+def test_build_all_runs_finish_per_job(tmp_path):
+    jobs = []
+    for name in ("one", "two"):
+        csv = tmp_path / f"{name}.csv"
+        write_csv(csv, [(name, 1.0, 1)] * 3)
+        jobs.append(LoadJob(str(tmp_path / f"{name}.db"), [TableLoad("ITEMS", str(csv), COLUMNS, transform=numbered)],
+                            finish=record_finish))
+    finished.clear()
+    assert build_all(jobs, processes=1) == 6
+    assert finished == [job.db for job in jobs]
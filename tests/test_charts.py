@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import core
+from charts import build_chart, downsample, line_series, lttb_indices, minmax_indices
+
+
+# 1. Pie / bar from a full result frame
+def test_pie_sums_repeated_categories():
+    df = pd.DataFrame({"Genre": ["Drama", "Comedy", "Drama"], "Votes": [1, 2, 3]})
+    chart = build_chart(df, "pie")
+    assert dict(zip(chart.labels, chart.values)) == {"Comedy": 2, "Drama": 4}
+
+
+def test_pie_groups_by_source_like_bar():
+    df = pd.DataFrame({"Name": ["a", "b", "c"], "Source": ["BTC", "ETH", "BTC"], "Close": [1.0, 2.0, 3.0]})
+    pie, bar = build_chart(df, "pie"), build_chart(df, "bar")
+    assert list(pie.labels) == list(bar.labels) == ["BTC", "ETH"]
+    assert list(pie.values) == list(bar.values) == [4.0, 2.0]
+
+
+# 2. Shaped charts run the per-connection rewrites once
+def test_execute_chart_prepares_once(monkeypatch):
+    calls = []
+    rewrite = core.rewrite_like_to_match
+
+    def counting(sql, indexes):
+        calls.append(sql)
+        return rewrite(sql, indexes)
+
+    monkeypatch.setattr(core, "rewrite_like_to_match", counting)
+    sql = "SELECT Genre, Votes FROM tvshows.TVSHOWS WHERE Title LIKE '%war%'"
+    shaped = core.execute_chart(sql, "pie", use_cache=False)
+    assert calls == [sql]
+    assert shaped.cols[0] == "Genre" and len(shaped.plot_frame()) > 0
+
+
+# 3. Downsampling
+@pytest.fixture
+def spiky():
+    y = np.sin(np.linspace(0, 20, 10_000))
+    y[4321] = 50.0
+    y[7000] = -50.0
+    return y
+
+
+def test_short_series_is_kept_whole():
+    y = np.arange(10.0)
+    assert minmax_indices(y, 700).tolist() == list(range(10))
+    assert lttb_indices(np.arange(10), y, 700).tolist() == list(range(10))
+    assert lttb_indices(np.arange(10), y, 2).tolist() == list(range(10))
+
+
+def test_minmax_keeps_extremes_and_ends(spiky):
+    idx = minmax_indices(spiky, 100)
+    assert len(idx) <= 102
+    assert np.all(np.diff(idx) > 0)
+    assert {0, 4321, 7000, len(spiky) - 1} <= set(idx.tolist())
+
+
+def test_lttb_picks_exact_count_with_spikes(spiky):
+    idx = lttb_indices(np.arange(len(spiky)), spiky, 100)
+    assert len(idx) == 100
+    assert np.all(np.diff(idx) > 0)
+    assert {0, 4321, 7000, len(spiky) - 1} <= set(idx.tolist())
+
+
+@pytest.mark.parametrize("method", ["minmax", "lttb"])
+def test_downsample_returns_matching_pairs(spiky, method):
+    x = np.arange(len(spiky)) * 10
+    xs, ys = downsample(x, spiky, points=200, method=method)
+    assert len(xs) == len(ys) <= 202
+    np.testing.assert_array_equal(ys, spiky[xs // 10])
+
+
+def test_line_series_groups_sorts_and_downsamples():
+    dates = pd.date_range("2020-01-01", periods=3000, freq="D")
+    df = pd.DataFrame({
+        "Source": ["BTC", "ETH"] * 1500,
+        "Date": np.concatenate([dates[1500:], dates[:1500]]).astype(str),
+        "Close": np.arange(3000.0),
+    })
+    df.loc[5, "Date"] = "not a date"
+    series = line_series(df, "Close", points=100)
+    assert [label for label, _, _ in series] == ["BTC", "ETH"]
+    for _, x, y in series:
+        assert x.dtype == np.dtype("datetime64[ns]") and len(x) == len(y) <= 102
+        assert np.all(np.diff(x.view(np.int64)) > 0)
@@ -0,0 +1,101 @@
+import sqlite3
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+import create_coins
+from bulk_load import build_all
+from core import table_checksum
+from create_rollups import build_rollups
+
+SOURCE_CSV = Path(__file__).resolve().parent.parent / "coin_Bitcoin.csv"
+
+STORE_DDL = """
+CREATE TABLE coins (
+    Source TEXT NOT NULL, Symbol TEXT NOT NULL, Date TEXT NOT NULL, SNo INTEGER NOT NULL, Name TEXT NOT NULL,
+    High REAL, Low REAL, Open REAL, Close REAL, Volume REAL, Marketcap REAL,
+    PRIMARY KEY (Symbol, Date)
+) WITHOUT ROWID
+"""
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """A directory with the first 400 days of coin_Bitcoin.csv, its database
+    built, and rollups.db and coins.db derived from it."""
+    pd.read_csv("coin_Bitcoin.csv", nrows=400).to_csv(tmp_path / "coin_Bitcoin.csv", index=False)
+    monkeypatch.chdir(tmp_path)
+    build_all(create_coins.jobs(), processes=1)
+    with sqlite3.connect("rollups.db") as conn:
+        conn.execute("ATTACH DATABASE 'bitcoin.db' AS src")
+        build_rollups(conn, "src.BITCOIN", "BITCOIN")
+    with sqlite3.connect("coins.db") as conn:
+        conn.execute(STORE_DDL)
+        conn.execute("ATTACH DATABASE 'bitcoin.db' AS src")
+        conn.execute("INSERT INTO coins SELECT Name, Symbol, Date, SNo, Name, High, Low, Open, Close, Volume, "
+                     "Marketcap FROM src.BITCOIN")
+    return tmp_path
+
+
+def derived_state():
+    with sqlite3.connect("rollups.db") as conn:
+        conn.execute("ATTACH DATABASE 'bitcoin.db' AS src")
+        recorded = conn.execute("SELECT Checksum FROM ROLLUP_SOURCES WHERE TableName = 'BITCOIN'").fetchone()[0]
+        fresh = recorded == table_checksum(conn, "src.BITCOIN")
+        yearly = conn.execute("SELECT SUM(SumClose) FROM BITCOIN_YEARLY").fetchone()[0]
+    with sqlite3.connect("coins.db") as conn:
+        store = conn.execute("SELECT COUNT(*), SUM(Close) FROM coins").fetchone()
+    with sqlite3.connect("bitcoin.db") as conn:
+        source = conn.execute("SELECT COUNT(*), SUM(Close) FROM BITCOIN").fetchone()
+    return fresh, yearly, store, source
+
+
+def test_full_rebuild_refreshes_derived_files(workdir):
+    # Corrected prices, same rows and dates
+    df = pd.read_csv("coin_Bitcoin.csv")
+    df["Close"] *= 2
+    df.to_csv("coin_Bitcoin.csv", index=False)
+    build_all(create_coins.jobs(), processes=1)
+    fresh, yearly, store, source = derived_state()
+    assert fresh
+    assert yearly == pytest.approx(source[1])
+    assert store[0] == source[0] and store[1] == pytest.approx(source[1])
+
+
+def grow_csv(rows):
+    """Rewrite coin_Bitcoin.csv as the first ``rows`` rows of the full file."""
+    pd.read_csv(SOURCE_CSV, nrows=rows).to_csv("coin_Bitcoin.csv", index=False)
+
+
+def test_append_adds_only_new_days(workdir):
+    grow_csv(450)
+    with sqlite3.connect("bitcoin.db") as conn:
+        rows, since = create_coins.append_coin(conn, "coin_Bitcoin.csv", "BITCOIN")
+        assert rows == 50
+        assert since == create_coins.read_coin_csv("coin_Bitcoin.csv")["Date"].iloc[400]
+        assert conn.execute("SELECT COUNT(*), COUNT(DISTINCT Date), MAX(SNo) FROM BITCOIN").fetchone() == (450, 450, 450)
+        # Running again finds nothing newer
+        assert create_coins.append_coin(conn, "coin_Bitcoin.csv", "BITCOIN") == (0, None)
+
+
+def test_append_continues_numbering_when_csv_restarts(workdir):
+    df = pd.read_csv(SOURCE_CSV, nrows=410).iloc[400:]
+    df["SNo"] = range(1, len(df) + 1)
+    df.to_csv("coin_Bitcoin.csv", index=False)
+    with sqlite3.connect("bitcoin.db") as conn:
+        rows, _ = create_coins.append_coin(conn, "coin_Bitcoin.csv", "BITCOIN")
+        assert rows == 10
+        assert conn.execute("SELECT MIN(SNo), MAX(SNo) FROM BITCOIN WHERE SNo > 400").fetchone() == (401, 410)
+
+
+def test_incremental_refresh_follows_append(workdir):
+    grow_csv(450)
+    with sqlite3.connect("bitcoin.db") as conn:
+        _, since = create_coins.append_coin(conn, "coin_Bitcoin.csv", "BITCOIN")
+    create_coins.refresh_derived("bitcoin.db", "BITCOIN", since)
+    fresh, yearly, store, source = derived_state()
+    assert fresh
+    assert source[0] == 450
+    assert yearly == pytest.approx(source[1])
+    assert store[0] == source[0] and store[1] == pytest.approx(source[1])
@@ -0,0 +1,21 @@
+import sqlite3
+
+import create_tv_shows_db
+
+
+def test_genres_split_whatever_they_hold():
+    conn = sqlite3.connect(":memory:")
+    spec = create_tv_shows_db.jobs()[0].tables[0]
+    conn.execute(spec.create_sql())
+    conn.executemany("INSERT INTO TVSHOWS (id, Title, Genre) VALUES (?, ?, ?)", [
+        (1, "a", "Drama, Comedy"),
+        (2, "b", 'Sci "Fi", Back\\slash, Drama'),
+        (3, "c", None),
+        (4, "d", "Drama, Drama"),
+    ])
+    for sql in create_tv_shows_db.AFTER[2:]:
+        conn.execute(sql)
+    assert sorted(conn.execute("SELECT show_id, genre FROM SHOW_GENRE")) == [
+        (1, "Comedy"), (1, "Drama"), (2, "Back\\slash"), (2, "Drama"), (2, 'Sci "Fi"'), (4, "Drama"),
+    ]
+    assert dict(conn.execute("SELECT genre, shows FROM GENRES"))["Drama"] == 3
@@ -0,0 +1,60 @@
+import sqlite3
+
+import pytest
+
+import core
+from core import QueryGuard, QueryRejected
+
+CROSS = "SELECT COUNT(*) FROM coin_bitcoin.BITCOIN b, coin_ethereum.ETHEREUM e WHERE b.Close > e.Close"
+JOINED = "SELECT COUNT(*) FROM coin_bitcoin.BITCOIN b JOIN coin_ethereum.ETHEREUM e ON e.Date = b.Date"
+SPIN = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 100000000) SELECT MAX(i) FROM n"
+
+
+@pytest.fixture
+def conn():
+    with core.get_pool(("coins",)).connection() as conn:
+        yield conn
+
+
+# 1. Plan check
+def test_cartesian_scan_is_rejected(conn):
+    core.guard_report.clear()
+    with pytest.raises(QueryRejected, match="row combinations"):
+        QueryGuard(max_join_rows=1_000_000).check_plan(conn, CROSS)
+    assert core.guard_report[-1]["action"] == "rejected"
+
+
+def test_indexed_join_and_disabled_limit_pass(conn):
+    QueryGuard(max_join_rows=1_000_000).check_plan(conn, JOINED)
+    QueryGuard(max_join_rows=0).check_plan(conn, CROSS)
+
+
+# 2. Runtime budget
+@pytest.mark.parametrize("guard, reason", [
+    (QueryGuard(max_seconds=0, max_steps=100_000), "VM steps"),
+    (QueryGuard(max_seconds=0.05, max_steps=0), "longer than"),
+])
+def test_budget_stops_runaway_query(conn, guard, reason):
+    core.guard_report.clear()
+    with pytest.raises(QueryRejected, match=reason):
+        with guard.budget(conn, SPIN):
+            conn.execute(SPIN).fetchall()
+    assert core.guard_report[-1]["action"] == "stopped"
+    # The handler is removed again: the connection runs long statements normally
+    assert conn.execute("SELECT COUNT(*) FROM coin_bitcoin.BITCOIN").fetchone()[0] > 0
+
+
+def test_budget_passes_other_errors_through(conn):
+    with pytest.raises(sqlite3.OperationalError) as info:
+        with QueryGuard(max_steps=100_000).budget(conn, "SELECT * FROM missing"):
+            conn.execute("SELECT * FROM missing")
+    assert not isinstance(info.value, QueryRejected)
+
+
+# 3. Row cap
+def test_cap_trims_to_max_rows():
+    core.guard_report.clear()
+    rows = list(range(11))
+    assert QueryGuard(max_rows=10).cap("SELECT 1", rows) == list(range(10))
+    assert core.guard_report[-1]["action"] == "capped"
+    assert QueryGuard(max_rows=0).cap("SELECT 1", list(range(11))) == list(range(11))
@@ -0,0 +1,41 @@
+import asyncio
+import threading
+
+import core
+
+
+class RecordingCache(core.SQLCache):
+    def __init__(self, path):
+        super().__init__(path)
+        self.threads = []
+
+    def get(self, *args):
+        self.threads.append(threading.current_thread())
+        return super().get(*args)
+
+    def put(self, *args):
+        self.threads.append(threading.current_thread())
+        return super().put(*args)
+
+
+def test_generate_sql_keeps_blocking_work_off_the_loop(monkeypatch, tmp_path, fake_model):
+    prompt_threads = []
+
+    def build_prompt(question=None, datasets=None):
+        prompt_threads.append(threading.current_thread())
+        return "prompt"
+
+    monkeypatch.setattr(core, "build_prompt", build_prompt)
+    cache = RecordingCache(str(tmp_path / "cache.db"))
+    pipeline = core.Pipeline(model=fake_model, cache=cache, sql_concurrency=1)
+
+    async def ask():
+        loop_thread = threading.current_thread()
+        sqls = [await pipeline.generate_sql("btc close in 2021") for _ in range(2)]
+        return loop_thread, sqls
+
+    loop_thread, sqls = asyncio.run(ask())
+    assert sqls == ["SELECT 1", "SELECT 1"]
+    assert fake_model.calls == 1
+    assert len(prompt_threads) == 2 and len(cache.threads) == 3    # get, put, get
+    assert loop_thread not in prompt_threads + cache.threads
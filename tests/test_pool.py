@@ -0,0 +1,74 @@
+import shutil
+import sqlite3
+
+import pytest
+
+from core import COIN_DBS, AccessMode, ConnectionPool
+
+
+@pytest.fixture
+def pool():
+    pool = ConnectionPool(COIN_DBS, max_size=1, optional={})
+    yield pool
+    pool.close()
+
+
+def checkout(pool):
+    with pool.connection() as conn:
+        return conn
+
+
+@pytest.mark.parametrize("sql, error", [
+    ("SELECT 1; SELECT 2", sqlite3.ProgrammingError),
+    ("SELECT nope FROM coin_bitcoin.BITCOIN", sqlite3.OperationalError),
+])
+def test_query_errors_keep_connection(pool, sql, error):
+    first = checkout(pool)
+    with pytest.raises(error):
+        with pool.connection() as conn:
+            conn.execute(sql)
+    assert checkout(pool) is first
+
+
+def test_closed_connection_is_replaced(pool):
+    first = checkout(pool)
+    with pytest.raises(sqlite3.ProgrammingError):
+        with pool.connection() as conn:
+            conn.close()
+            conn.execute("SELECT 1")
+    assert checkout(pool) is not first
+
+
+@pytest.mark.parametrize("access, uri", [
+    (AccessMode(), "file:x.db?mode=ro"),
+    (AccessMode(immutable=True), "file:x.db?mode=ro&immutable=1"),
+    (AccessMode(immutable=True, shared_cache=True), "file:x.db?mode=ro&immutable=1&cache=shared"),
+])
+def test_access_uri(access, uri):
+    assert access.uri("x.db") == uri
+
+
+def test_access_pragmas_apply_per_schema():
+    assert AccessMode().pragmas("a") == []
+    pool = ConnectionPool(COIN_DBS, max_size=1, optional={}, access=AccessMode(mmap_bytes=1 << 20, cache_kib=512))
+    with pool.connection() as conn:
+        assert conn.execute("PRAGMA coin_bitcoin.cache_size").fetchone()[0] == -512
+        assert conn.execute("PRAGMA coin_bitcoin.mmap_size").fetchone()[0] == 1 << 20
+        assert conn.execute("PRAGMA query_only").fetchone()[0] == 1
+    pool.close()
+
+
+def test_immutable_connection_reopens_after_file_changes(tmp_path):
+    shutil.copy("bitcoin.db", tmp_path / "bitcoin.db")
+    pool = ConnectionPool({"coin_bitcoin": "bitcoin.db"}, max_size=1, base_dir=str(tmp_path), optional={},
+                          access=AccessMode(immutable=True))
+    with pool.connection() as conn:
+        before = conn.execute("SELECT COUNT(*) FROM coin_bitcoin.BITCOIN").fetchone()[0]
+    first = checkout(pool)
+    assert checkout(pool) is first
+    with sqlite3.connect(tmp_path / "bitcoin.db") as writer:
+        writer.execute("DELETE FROM BITCOIN WHERE SNo > 10")
+    with pool.connection() as conn:
+        assert conn is not first
+        assert conn.execute("SELECT COUNT(*) FROM coin_bitcoin.BITCOIN").fetchone()[0] == 10 < before
+    pool.close()
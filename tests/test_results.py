@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import core
+from core import ColumnarResult
+
+ROWS = [("2021-01-0%d" % day, "BTC", float(day)) for day in range(1, 8)]
+COLS = ["Date", "Symbol", "Close"]
+
+
+def test_slice_keeps_values():
+    data = ColumnarResult(ROWS, COLS)
+    part = data.slice(2, 5)
+    assert part.nrows == 3
+    assert part.rows() == ROWS[2:5]
+
+
+def test_slice_past_end():
+    part = ColumnarResult(ROWS, COLS).slice(5, 50)
+    assert part.rows() == ROWS[5:]
+
+
+def test_slice_after_frame():
+    # frame() records None for columns that are not dates; slices must keep that
+    data = ColumnarResult(ROWS, COLS)
+    data.frame()
+    part = data.slice(1, 3)
+    df = part.frame()
+    assert list(df["Symbol"]) == ["BTC", "BTC"]
+    assert df["Date"].dtype.kind == "M"
+    assert df["Date"].iloc[0] == np.datetime64("2021-01-02")
+
+
+def test_fetch_page_after_plot_frame():
+    sql = "SELECT Date, Symbol, Close FROM coin_bitcoin.BITCOIN ORDER BY Date LIMIT 30"
+    core.get_result_cache().clear()
+    core.execute(sql).plot_frame()
+    first, more = core.fetch_page(sql, 0, 20)
+    second, last = core.fetch_page(sql, 1, 20)
+    assert more and not last
+    assert len(first.frame) == 20 and len(second.frame) == 10
+    assert first.frame["Date"].dtype.kind == "M"
+    assert second.display_frame()["Symbol"].eq("BTC").all()
+
+
+@pytest.mark.parametrize("rows", [10, core.CELL_UNESCAPE_ROWS + 10])
+def test_unescape_paths_agree(rows):
+    cells = ["Tom &amp; Jerry", "plain", None, "AT&T", "&lt;b&gt;"] * (rows // 5)
+    out = core.unescape_column(pd.Series(cells, name="Title"))
+    assert out.tolist()[:5] == ["Tom & Jerry", "plain", None, "AT&T", "<b>"]
+    assert out.name == "Title" and len(out) == len(cells)
+
+
+def test_unescape_unchanged_column_is_returned():
+    values = pd.Series(["AT&T", "plain", None])
+    assert core.unescape_column(values) is values
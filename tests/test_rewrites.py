@@ -0,0 +1,155 @@
+import pytest
+
+import core
+from core import postprocess_sql, rewrite_for_rollups, rewrite_like_to_match
+
+
+def run(dataset, sql):
+    """Rows and column names of ``sql`` exactly as written (no rewrites)."""
+    with core.get_pool((dataset,)).connection() as conn:
+        cur = conn.execute(sql)
+        return cur.fetchall(), [d[0] for d in cur.description]
+
+
+def assert_same_result(dataset, sql, rewritten):
+    rows, cols = run(dataset, sql)
+    new_rows, new_cols = run(dataset, rewritten)
+    assert new_cols == cols
+    assert len(new_rows) == len(rows) > 0
+    for old, new in zip(rows, new_rows):
+        assert new == pytest.approx(old)
+
+
+# 1. Rollups
+@pytest.fixture(scope="module")
+def fresh_rollups():
+    with core.get_pool(("coins",)).connection() as conn:
+        if "coin_rollups" not in conn.attached:
+            pytest.skip("rollups.db not built (create_rollups.py)")
+        fresh = core._fresh_rollups(conn)
+    if not fresh:
+        pytest.skip("rollups.db is out of date")
+    return fresh
+
+
+@pytest.mark.parametrize("sql, rollup", [
+    ("SELECT strftime('%Y', Date) AS Year, AVG(Close), MAX(High) FROM coin_bitcoin.BITCOIN "
+     "GROUP BY strftime('%Y', Date) ORDER BY Year", "BITCOIN_YEARLY"),
+    ("SELECT MIN(Low), COUNT(*) FROM coin_ethereum.ETHEREUM "
+     "WHERE Date BETWEEN '2019-01-01' AND '2019-12-31 23:59:59'", "ETHEREUM_YEARLY"),
+    ("SELECT strftime('%Y-%m', Date) AS Month, SUM(Volume) FROM coin_chainlink.CHAINLINK "
+     "WHERE Date LIKE '2020%' GROUP BY Month ORDER BY Month", "CHAINLINK_MONTHLY"),
+    ("SELECT MAX(Date), MIN(Date) FROM coin_usdcoin.USDCOIN WHERE Date >= '2019-04-01'", "USDCOIN_MONTHLY"),
+])
+def test_rollup_rewrite_keeps_result(fresh_rollups, sql, rollup):
+    rewritten, rollups = rewrite_for_rollups(sql, fresh_rollups)
+    assert rollups == [rollup]
+    assert "coin_rollups" in rewritten
+    assert_same_result("coins", sql, rewritten)
+
+
+def test_rollup_rewrite_union_arms(fresh_rollups):
+    sql = "\nUNION ALL\n".join(
+        f"SELECT '{table}' AS Source, strftime('%Y', Date) AS Year, AVG(Close) AS AvgClose "
+        f"FROM {alias}.{table} GROUP BY Year"
+        for alias, table in (("coin_bitcoin", "BITCOIN"), ("coin_ethereum", "ETHEREUM"))
+    ) + "\nORDER BY Source, Year"
+    rewritten, rollups = rewrite_for_rollups(sql, fresh_rollups)
+    assert rollups == ["BITCOIN_YEARLY", "ETHEREUM_YEARLY"]
+    assert_same_result("coins", sql, rewritten)
+
+
+@pytest.mark.parametrize("sql", [
+    # Range that does not start and end on bucket boundaries
+    "SELECT AVG(Close) FROM coin_bitcoin.BITCOIN WHERE Date BETWEEN '2019-01-05' AND '2019-03-10'",
+    # Aggregate of an expression, a non-aggregated column, no aggregation at all
+    "SELECT AVG(Close * 2) FROM coin_bitcoin.BITCOIN",
+    "SELECT Date, MAX(Close) FROM coin_bitcoin.BITCOIN",
+    "SELECT Close FROM coin_bitcoin.BITCOIN WHERE Date LIKE '2020-%'",
+    "SELECT AVG(Close) FROM coin_bitcoin.BITCOIN WHERE Volume > 0",
+])
+def test_rollup_rewrite_leaves_ineligible_queries(fresh_rollups, sql):
+    assert rewrite_for_rollups(sql, fresh_rollups) == (sql, [])
+
+
+def test_rollup_rewrite_needs_available_table():
+    sql = "SELECT MAX(High) FROM coin_bitcoin.BITCOIN"
+    assert rewrite_for_rollups(sql, set()) == (sql, [])
+
+
+# 2. LIKE -> FTS5 MATCH
+@pytest.fixture(scope="module")
+def tv_indexes():
+    with core.get_pool(("tvshows",)).connection() as conn:
+        indexes = core._fts_indexes(conn)
+    if not indexes:
+        pytest.skip("tvshows.db has no FTS index")
+    return indexes
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT Title, Year FROM tvshows.TVSHOWS WHERE Title LIKE '%love%' ORDER BY id",
+    "SELECT t.Title FROM tvshows.TVSHOWS AS t WHERE t.Description LIKE '%DETECTIVE%' AND Year > 2000 ORDER BY t.id",
+    "SELECT COUNT(*) FROM tvshows.TVSHOWS WHERE Rating BETWEEN 7 AND 9 AND Genre LIKE '%Comedy%'",
+])
+def test_like_rewrite_keeps_result(tv_indexes, sql):
+    rewritten = rewrite_like_to_match(sql, tv_indexes)
+    assert "MATCH" in rewritten and "LIKE" not in rewritten
+    assert_same_result("tvshows", sql, rewritten)
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT Title FROM tvshows.TVSHOWS WHERE Title NOT LIKE '%love%'",
+    "SELECT Title FROM tvshows.TVSHOWS WHERE Title LIKE '%lo%'",
+    "SELECT Title FROM tvshows.TVSHOWS WHERE Title LIKE 'love%'",
+    "SELECT Title FROM tvshows.TVSHOWS WHERE Title LIKE '%lo_e%'",
+    "SELECT Title FROM tvshows.TVSHOWS WHERE Title LIKE '%50!%%' ESCAPE '!'",
+    "SELECT Title FROM tvshows.TVSHOWS WHERE Year LIKE '%199%'",
+    "SELECT Title FROM tvshows.TVSHOWS WHERE id IN (SELECT id FROM tvshows.TVSHOWS WHERE Title LIKE '%love%')",
+    "SELECT a.Title FROM tvshows.TVSHOWS a JOIN tvshows.TVSHOWS b ON a.id = b.id WHERE a.Title LIKE '%love%'",
+    "SELECT 'Title LIKE ''%love%''' FROM tvshows.TVSHOWS",
+    "SELECT Title FROM tvshows.TVSHOWS WHERE NOT (Title LIKE '%love%')",
+    "SELECT Title FROM tvshows.TVSHOWS WHERE Genre LIKE '%Comedy%' OR Title LIKE '%war%'",
+    "SELECT Title FROM tvshows.TVSHOWS WHERE Rating > 8 AND (Title LIKE '%war%' OR Year > 2000)",
+    "SELECT Title LIKE '%x%' FROM tvshows.TVSHOWS",
+    "SELECT Title FROM tvshows.TVSHOWS WHERE CASE WHEN Rating > 8 AND Title LIKE '%war%' AND 1 THEN 1 END",
+])
+def test_like_rewrite_leaves_other_patterns(tv_indexes, sql):
+    assert rewrite_like_to_match(sql, tv_indexes) == sql
+
+
+def test_like_rewrite_without_indexes():
+    sql = "SELECT Title FROM tvshows.TVSHOWS WHERE Title LIKE '%love%'"
+    assert rewrite_like_to_match(sql, []) == sql
+
+
+# 3. Model output clean-up
+@pytest.mark.parametrize("raw, expected", [
+    ("```sql\nSELECT 1;\n```", "SELECT 1"),
+    ("SELECT Close FROM coin_bitcoin WHERE Date > '2021-01-01';",
+     "SELECT Close FROM coin_bitcoin.BITCOIN WHERE Date > '2021-01-01'"),
+    ("SELECT Close FROM coin_bitcoin.BITCOIN", "SELECT Close FROM coin_bitcoin.BITCOIN"),
+    ("SELECT * FROM coin_bitcoin b JOIN coin_ethereum e ON b.Date = e.Date",
+     "SELECT * FROM coin_bitcoin.BITCOIN b JOIN coin_ethereum.ETHEREUM e ON b.Date = e.Date"),
+    ("SELECT 'from coin_bitcoin order by x' AS s", "SELECT 'from coin_bitcoin order by x' AS s"),
+])
+def test_postprocess_sql(raw, expected):
+    assert postprocess_sql(raw) == expected
+
+
+def test_postprocess_hoists_arm_order_by():
+    raw = ("SELECT 'BTC' AS Source, Date, Close FROM coin_bitcoin.BITCOIN ORDER BY Date\n"
+           "UNION ALL\n"
+           "SELECT 'ETH' AS Source, Date, Close FROM coin_ethereum.ETHEREUM ORDER BY Date DESC;")
+    sql = postprocess_sql(raw)
+    assert sql.count("ORDER BY") == 1
+    assert sql.endswith("ORDER BY Date DESC")
+    run("coins", sql)
+
+
+def test_postprocess_keeps_nested_order_by():
+    raw = ("SELECT * FROM (SELECT Date, Close FROM coin_bitcoin.BITCOIN ORDER BY Close DESC LIMIT 5) "
+           "UNION ALL SELECT Date, Close FROM coin_ethereum.ETHEREUM ORDER BY Date")
+    sql = postprocess_sql(raw)
+    assert "ORDER BY Close DESC LIMIT 5)" in sql
+    assert sql.endswith("ORDER BY Date")
@@ -0,0 +1,50 @@
+import shutil
+import sqlite3
+
+import pytest
+
+import core
+from create_rollups import build_rollups
+
+
+@pytest.fixture
+def coin_dir(tmp_path):
+    """Copies of the coin databases with rollups.db built from them."""
+    for fname in core.COIN_DBS.values():
+        shutil.copy(fname, tmp_path / fname)
+    conn = sqlite3.connect(tmp_path / "rollups.db")
+    for alias, table in core.ALIAS_TO_TABLE.items():
+        conn.execute("ATTACH DATABASE ? AS src", (str(tmp_path / core.COIN_DBS[alias]),))
+        with conn:
+            build_rollups(conn, f"src.{table}", table)
+        conn.execute("DETACH DATABASE src")
+    conn.close()
+    return tmp_path
+
+
+def fresh(base_dir):
+    pool = core.ConnectionPool(core.COIN_DBS, max_size=1, base_dir=str(base_dir), optional=core.OPTIONAL_DBS)
+    try:
+        with pool.connection() as conn:
+            return core._fresh_rollups(conn)
+    finally:
+        pool.close()
+
+
+def test_rollups_fresh_after_build(coin_dir):
+    assert "BITCOIN_YEARLY" in fresh(coin_dir)
+
+
+def test_corrected_price_makes_rollups_stale(coin_dir):
+    # Same rows, same last Date: only the checksum tells
+    with sqlite3.connect(coin_dir / "bitcoin.db") as conn:
+        conn.execute("UPDATE BITCOIN SET Close = Close + 1 WHERE Date = (SELECT MIN(Date) FROM BITCOIN)")
+    tables = fresh(coin_dir)
+    assert not {"BITCOIN_YEARLY", "BITCOIN_MONTHLY", "BITCOIN_WEEKLY"} & tables
+    assert "ETHEREUM_YEARLY" in tables
+
+
+def test_rollups_without_checksum_are_stale(coin_dir):
+    with sqlite3.connect(coin_dir / "rollups.db") as conn:
+        conn.execute("UPDATE ROLLUP_SOURCES SET Checksum = NULL")
+    assert fresh(coin_dir) == set()
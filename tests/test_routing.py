@@ -0,0 +1,67 @@
+import pytest
+
+import core
+
+
+@pytest.fixture
+def catalog():
+    return core.get_schema_catalog()
+
+
+@pytest.mark.parametrize("question, datasets", [
+    ("show me bitcoin in 2021", ("coins",)),
+    ("show the last 10 days of ETH", ("coins",)),
+    ("top rated tv series", ("tvshows",)),
+    ("novels by george orwell", ("books",)),
+    ("highest grossing Pixar films", ("movies",)),
+    ("shows about dragons", ("tvshows",)),
+    ("series about detectives", ("tvshows",)),
+    ("most voted drama series", ("tvshows",)),
+    ("highest rated comedy", ("tvshows",)),
+    ("list all genres", ("tvshows",)),
+    ("what genre has most shows", ("tvshows",)),
+    ("what is the best show", ("tvshows",)),
+    ("books by genre", ("books",)),
+    ("average movie rating by year", ("movies",)),
+    ("bitcoin price series", ("coins",)),
+])
+def test_route_named_dataset(catalog, question, datasets):
+    assert catalog.route(question) == datasets
+
+
+def test_route_nothing_named(catalog):
+    assert catalog.route("show all data") == (core.DEFAULT_DATASET,)
+    assert catalog.route("") == (core.DEFAULT_DATASET,)
+
+
+def test_stopwords_never_route(catalog):
+    for words in catalog._routing_words().values():
+        assert not set(words) & core._STOPWORDS
+
+
+def test_tie_goes_to_named_dataset(catalog):
+    # "price" is a coins keyword, "the hobbit" a listed books value
+    assert catalog.route("price of the hobbit") == ("books",)
+
+
+@pytest.mark.skipif(core.DEFAULT_DATASET != "coins", reason="NL2SQL_DEFAULT_DATASET is set")
+def test_keyword_tie_goes_to_default(catalog):
+    assert catalog.route("crypto on tv") == ("coins",)
+
+
+COIN_COLUMNS = [("Name", "TEXT"), ("Symbol", "TEXT"), ("Date", "TEXT"), ("Close", "REAL")]
+
+
+def test_per_coin_files_get_union_rule(monkeypatch):
+    monkeypatch.setattr(core, "COIN_STORE", "files")
+    tables = [core.TableSchema(f"coin_{n}", n.upper(), COIN_COLUMNS, [], 0, {}, {})
+              for n in ("bitcoin", "ethereum")]
+    rules = core.prompt_rules(tables)
+    assert "UNION ALL" in rules and "coins.coins" not in rules
+
+
+def test_unified_store_gets_single_table_rule(monkeypatch):
+    monkeypatch.setattr(core, "COIN_STORE", "unified")
+    table = core.TableSchema("coins", "coins", [("Source", "TEXT")] + COIN_COLUMNS, [], 0, {}, {})
+    rules = core.prompt_rules([table])
+    assert "coins.coins" in rules and "UNION ALL one SELECT" not in rules
@@ -0,0 +1,119 @@
+import itertools
+
+import pytest
+
+import core
+from core import SQLCache, generate_sql
+
+VOCABULARY = frozenset({"btc", "eth", "bitcoin", "ethereum", "low", "close"})
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """time.time() advancing one second per call, or as set."""
+    ticks = itertools.count(1_000_000)
+    now = {"offset": 0}
+    monkeypatch.setattr(core.time, "time", lambda: next(ticks) + now["offset"])
+    return now
+
+
+@pytest.fixture
+def cache(tmp_path, clock):
+    return SQLCache(str(tmp_path / "cache.db"), max_entries=3, ttl=3600)
+
+
+def ask(question, model, cache, prompt="prompt"):
+    return generate_sql(question, model=model, prompt=prompt, cache=cache)
+
+
+def test_exact_hit(cache, fake_model):
+    assert ask("BTC close in 2021?", fake_model, cache) == "SELECT 1"
+    fake_model.text = "SELECT 2"
+    # Normalization: case and punctuation do not matter
+    assert ask("btc close in 2021", fake_model, cache) == "SELECT 1"
+    assert fake_model.calls == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_miss(cache, fake_model):
+    ask("btc close in 2021", fake_model, cache)
+    fake_model.text = "SELECT 2"
+    assert ask("eth close in 2021", fake_model, cache) == "SELECT 2"
+    assert fake_model.calls == 2
+    assert cache.stats()["misses"] == 2
+
+
+def test_fence_is_stripped_before_caching(cache, fake_model):
+    fake_model.text = "```sql\nSELECT 1;\n```"
+    assert ask("btc close", fake_model, cache) == "SELECT 1"
+    assert cache.get("btc close", "prompt", "fake") == "SELECT 1"
+
+
+def test_ttl_expiry(cache, clock, fake_model):
+    ask("btc close in 2021", fake_model, cache)
+    clock["offset"] = 3601
+    assert cache.get("btc close in 2021", "prompt", "fake") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_lru_eviction(cache):
+    for q in ("a one", "b two", "c three"):
+        cache.put(q, "prompt", "fake", q)
+    cache.get("a one", "prompt", "fake")
+    cache.put("d four", "prompt", "fake", "d four")
+    assert cache.get("b two", "prompt", "fake") is None
+    assert cache.get("a one", "prompt", "fake") == "a one"
+    assert cache.stats()["entries"] == 3
+
+
+def test_scoped_by_prompt_and_model(cache, fake_model):
+    ask("btc close", fake_model, cache, prompt="schema v1")
+    assert cache.get("btc close", "schema v2", "fake") is None
+    assert cache.get("btc close", "schema v1", "other-model") is None
+    assert cache.get("btc close", "schema v1", "fake") == "SELECT 1"
+
+
+def test_cache_false_always_calls_model(fake_model):
+    ask("btc close", fake_model, False)
+    ask("btc close", fake_model, False)
+    assert fake_model.calls == 2
+
+
+def near_cache(tmp_path, similarity, entities=lambda: VOCABULARY):
+    return SQLCache(str(tmp_path / "near.db"), similarity=similarity, entities=entities)
+
+
+def test_near_match_threshold(tmp_path):
+    cache = near_cache(tmp_path, 0.6)
+    cache.put("plot btc low over 2021", "prompt", "fake", "SELECT low")
+    # {graph, btc, low, 2021} vs {plot, btc, low, 2021}: 3/5
+    assert cache.get("graph btc low over 2021", "prompt", "fake") == "SELECT low"
+    # {draw, chart, btc, low, 2021}: 3/7
+    assert cache.get("draw a chart of btc low in 2021", "prompt", "fake") is None
+    assert cache.stats()["near_hits"] == 1
+
+
+def test_near_match_needs_same_numbers(tmp_path):
+    cache = near_cache(tmp_path, 0.5)
+    cache.put("plot btc low over 2021", "prompt", "fake", "SELECT low")
+    assert cache.get("plot btc low over 2022", "prompt", "fake") is None
+
+
+def test_near_match_needs_same_entities(tmp_path):
+    cache = near_cache(tmp_path, 0.5)
+    cache.put("plot eth low over 2021", "prompt", "fake", "SELECT eth")
+    assert cache.get("plot btc low over 2021", "prompt", "fake") is None
+    assert cache.get("plot eth close over 2021", "prompt", "fake") is None
+
+
+def test_near_match_without_entities_only_ignores_stopwords(tmp_path):
+    cache = near_cache(tmp_path, 0.5, entities=None)
+    cache.put("plot btc low over 2021", "prompt", "fake", "SELECT low")
+    assert cache.get("graph btc low over 2021", "prompt", "fake") is None
+    assert cache.get("plot the btc low in 2021", "prompt", "fake") == "SELECT low"
+
+
+def test_catalog_vocabulary_names_coins():
+    vocabulary = core.get_schema_catalog().vocabulary()
+    assert {"btc", "eth", "bitcoin", "low"} <= vocabulary
+    assert not vocabulary & core._STOPWORDS
@@ -0,0 +1,11 @@
+import core
+
+
+def test_warm_up_skips_missing_dataset(monkeypatch, tmp_path):
+    monkeypatch.setattr(core, "get_model", lambda *args: None)
+    monkeypatch.setitem(core.DATASETS, "missing", core.Dataset("missing", {"missing": str(tmp_path / "no" / "x.db")}))
+    timings = core.warm_up(["books", "missing"])
+    assert "pool books" not in timings
+    assert timings["pool missing"].startswith("OperationalError")
+    assert isinstance(timings["schema"], float)
+    assert "pool missing OperationalError" in core.format_timings(timings)